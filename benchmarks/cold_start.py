@@ -0,0 +1,109 @@
+"""
+Benchmark: cold-start cost of the Cloud Functions.
+
+Each measurement runs in a fresh interpreter, the way a new instance
+starts: it times `import main` for a function directory and, when the
+emulators are configured, the first and second request to its HTTP entry
+point (the first one pays for client construction and any deferred
+imports). --compare checks out another git ref into a temp directory and
+runs the same measurements there, so before/after numbers come from the
+same machine.
+
+Usage:
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --compare HEAD~1 --runs 10 --json
+    FIRESTORE_EMULATOR_HOST=localhost:8080 STORAGE_EMULATOR_HOST=http://localhost:4443 \\
+        python benchmarks/cold_start.py --requests
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Function directory -> HTTP entry point and query string for the first request
+FUNCTIONS = {
+    "notification": ("get_stats", ""),
+    "cleanup": ("cleanup_orphaned_files", "?mode=prefix"),
+}
+
+# Runs inside the fresh interpreter; prints one JSON line
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+result = {"import_ms": (time.perf_counter() - started) * 1000}
+entry_point, query = sys.argv[1], sys.argv[2]
+if sys.argv[3] == "1":
+    import flask
+    app = flask.Flask("probe")
+    for label in ("first_request_ms", "second_request_ms"):
+        with app.test_request_context("/" + query):
+            started = time.perf_counter()
+            getattr(main, entry_point)(flask.request)
+            result[label] = (time.perf_counter() - started) * 1000
+result["modules"] = len(sys.modules)
+print(json.dumps(result))
+"""
+
+
+def probe(function_dir, entry_point, query, requests):
+    # Modules shared by every function are bundled from cloud-functions/shared
+    shared_dir = os.path.join(os.path.dirname(function_dir), "shared")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, entry_point, query, "1" if requests else "0"],
+        cwd=function_dir, env={**os.environ, "PYTHONPATH": shared_dir},
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(root, runs, requests):
+    report = {}
+    for name, (entry_point, query) in FUNCTIONS.items():
+        samples = [
+            probe(os.path.join(root, "cloud-functions", name), entry_point, query, requests)
+            for _ in range(runs)
+        ]
+        report[name] = {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+    return report
+
+
+def checkout(ref, target):
+    """Extract cloud-functions/ at `ref` into `target`."""
+    archive = subprocess.run(
+        ["git", "-C", REPO_ROOT, "archive", ref, "cloud-functions"], capture_output=True, check=True,
+    ).stdout
+    subprocess.run(["tar", "-x", "-C", target], input=archive, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per function (median reported)")
+    parser.add_argument("--compare", metavar="REF", help="also measure this git ref, e.g. HEAD~1")
+    parser.add_argument("--requests", action="store_true",
+                        help="time the first two requests too (needs the Firestore/Storage emulators)")
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of text")
+    args = parser.parse_args()
+
+    reports = {"working tree": measure(REPO_ROOT, args.runs, args.requests)}
+    if args.compare:
+        with tempfile.TemporaryDirectory() as target:
+            checkout(args.compare, target)
+            reports[args.compare] = measure(target, args.runs, args.requests)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    for label, report in reports.items():
+        print(f"== {label}")
+        for name, values in report.items():
+            print(f"{name:<14} " + "  ".join(f"{key}={value}" for key, value in values.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Benchmark: cleanup_orphaned_files and get_stats end to end, offline.
+
+Seeds a synthetic dataset into the Firestore emulator and a local fake GCS
+server (N jobs, M files per job, X% orphaned job folders), then calls the
+HTTP entry points through functions_framework's test client. Every
+scenario runs in its own interpreter so peak RSS belongs to that function
+alone. Each run records wall time, Storage HTTP requests and Firestore
+RPCs (by method), peak RSS and throughput, and the whole report is
+written as JSON; pass a previous report with --baseline to print the
+change per scenario.
+
+Usage:
+    gcloud emulators firestore start --host-port=localhost:8080
+    docker run -p 4443:4443 fsouza/fake-gcs-server -scheme http -public-host localhost:4443
+    export FIRESTORE_EMULATOR_HOST=localhost:8080 STORAGE_EMULATOR_HOST=http://localhost:4443
+    python benchmarks/emulator_suite.py --jobs 2000 --files-per-job 5 --orphan-percent 10
+    python benchmarks/emulator_suite.py --output after.json --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "fognode-bench")
+STATUS_MIX = {"completed": 0.7, "processing": 0.1, "failed": 0.05, "pending": 0.15}
+
+# (scenario name, function dir, entry point, query string)
+SCENARIOS = [
+    ("cleanup-prefix", "cleanup", "cleanup_orphaned_files", "/?mode=prefix&restart=true"),
+    ("cleanup-blob", "cleanup", "cleanup_orphaned_files", "/?mode=blob&restart=true"),
+    ("stats", "notification", "get_stats", "/"),
+]
+
+
+# =============================================================================
+# Dataset
+# =============================================================================
+
+def dataset(args):
+    """Deterministic job ids: (valid ids, orphaned ids), both random hex like real ids."""
+    rng = random.Random(args.seed)
+    orphans = round(args.jobs * args.orphan_percent / 100)
+    ids = [f"{rng.getrandbits(64):016x}" for _ in range(args.jobs + orphans)]
+    return ids[:args.jobs], ids[args.jobs:]
+
+
+def blob_names(job_ids, files_per_job):
+    return [f"audiobooks/{job_id}/part-{k:03d}.wav" for job_id in job_ids for k in range(files_per_job)]
+
+
+def seed_jobs(db, collection, job_ids, rng):
+    """Write the job documents unless the collection already holds them."""
+    jobs_ref = db.collection(collection)
+    if jobs_ref.count().get()[0][0].value >= len(job_ids):
+        return
+    statuses, weights = zip(*STATUS_MIX.items())
+    batch = db.batch()
+    for i, job_id in enumerate(job_ids):
+        batch.set(jobs_ref.document(job_id), {
+            "status": rng.choices(statuses, weights)[0],
+            "filename": f"{job_id}.pdf",
+        })
+        if i % 500 == 499:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+def seed_files(storage_client, bucket_name, names, size):
+    """Upload whichever of `names` are missing (cleanup deletes the orphans every run)."""
+    bucket = storage_client.bucket(bucket_name)
+    if not bucket.exists():
+        storage_client.create_bucket(bucket_name)
+    existing = {blob.name for blob in storage_client.list_blobs(bucket_name, prefix="audiobooks/")}
+    missing = [name for name in names if name not in existing]
+    payload = b"\0" * size
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda name: bucket.blob(name).upload_from_string(payload), missing))
+    return len(missing)
+
+
+# =============================================================================
+# Worker (one scenario, fresh interpreter)
+# =============================================================================
+
+def install_counters():
+    """Count Storage HTTP requests and Firestore RPCs made by this process."""
+    import grpc
+    import requests
+
+    counts = {"storage_http_requests": 0, "firestore_rpcs": Counter()}
+
+    original_request = requests.Session.request
+
+    def counted_request(session, method, url, *args, **kwargs):
+        counts["storage_http_requests"] += 1
+        return original_request(session, method, url, *args, **kwargs)
+
+    class CountingInterceptor(grpc.UnaryUnaryClientInterceptor, grpc.UnaryStreamClientInterceptor):
+        def intercept_unary_unary(self, continuation, details, request):
+            counts["firestore_rpcs"][details.method.rsplit("/", 1)[-1]] += 1
+            return continuation(details, request)
+
+        def intercept_unary_stream(self, continuation, details, request):
+            counts["firestore_rpcs"][details.method.rsplit("/", 1)[-1]] += 1
+            return continuation(details, request)
+
+    original_channel = grpc.insecure_channel
+
+    def counted_channel(*args, **kwargs):
+        return grpc.intercept_channel(original_channel(*args, **kwargs), CountingInterceptor())
+
+    requests.Session.request = counted_request
+    grpc.insecure_channel = counted_channel
+    return counts
+
+
+def run_worker(function_dir, entry_point, query, repeat):
+    counts = install_counters()
+    import functions_framework
+
+    sys.path.append(os.path.join(REPO_ROOT, "cloud-functions", "shared"))
+    source = os.path.join(REPO_ROOT, "cloud-functions", function_dir, "main.py")
+    client = functions_framework.create_app(entry_point, source).test_client()
+
+    timings, status, body = [], None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(query)
+        timings.append(time.perf_counter() - started)
+        status, body = response.status_code, response.get_json(silent=True)
+
+    print(json.dumps({
+        "status_code": status,
+        "wall_seconds": [round(t, 4) for t in timings],
+        "storage_http_requests": counts["storage_http_requests"],
+        "firestore_rpcs": dict(counts["firestore_rpcs"]),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "response": body,
+    }))
+
+
+# =============================================================================
+# Driver
+# =============================================================================
+
+def run_scenario(name, function_dir, entry_point, query, env, repeat):
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", function_dir, entry_point, query, "--repeat", str(repeat)],
+        env=env, capture_output=True, text=True,
+    )
+    if output.returncode:
+        sys.exit(f"{name} failed:\n{output.stderr}")
+    # The functions print their own log lines; the report is the last line
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def summarize(name, result, files, orphaned_files):
+    response = result.pop("response") or {}
+    wall = result["wall_seconds"][0]
+    summary = {"scenario": name, **result}
+    if name.startswith("cleanup"):
+        summary["deleted"] = response.get("orphaned_files_deleted", 0)
+        summary["expected_orphaned_files"] = orphaned_files
+        summary["objects_per_second"] = round(files / wall, 1) if wall else None
+    else:
+        summary["total_jobs"] = response.get("total_jobs")
+        summary["requests_per_second"] = round(len(result["wall_seconds"]) / sum(result["wall_seconds"]), 2)
+    return summary
+
+
+def compare(report, baseline):
+    previous = {run["scenario"]: run for run in baseline.get("runs", [])}
+    print(f"{'scenario':<16} {'wall s':>9} {'before':>9} {'change':>8} {'rss MB':>8} {'before':>8}")
+    for run in report["runs"]:
+        before = previous.get(run["scenario"])
+        if not before:
+            continue
+        wall, wall_before = run["wall_seconds"][0], before["wall_seconds"][0]
+        change = f"{(wall - wall_before) / wall_before:+.0%}" if wall_before else "n/a"
+        print(f"{run['scenario']:<16} {wall:>9} {wall_before:>9} {change:>8} "
+              f"{run['peak_rss_mb']:>8} {before['peak_rss_mb']:>8}")
+
+
+def main():
+    if sys.argv[1:2] == ["--worker"]:
+        function_dir, entry_point, query = sys.argv[2:5]
+        return run_worker(function_dir, entry_point, query, int(sys.argv[6]))
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--files-per-job", type=int, default=3)
+    parser.add_argument("--orphan-percent", type=float, default=10.0)
+    parser.add_argument("--file-bytes", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="requests per get_stats run")
+    parser.add_argument("--scenarios", nargs="+", default=[name for name, *_ in SCENARIOS])
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    args = parser.parse_args()
+
+    for variable in ("FIRESTORE_EMULATOR_HOST", "STORAGE_EMULATOR_HOST"):
+        if not os.environ.get(variable):
+            sys.exit(f"{variable} is not set; start the emulators first")
+
+    from google.cloud import firestore, storage
+
+    tag = f"{args.jobs}-{args.files_per_job}-{args.orphan_percent:g}-{args.seed}".replace(".", "_")
+    collection, bucket_name = f"bench_jobs_{tag}", f"fognode-bench-{tag}"
+    job_ids, orphan_ids = dataset(args)
+    db = firestore.Client(project=PROJECT)
+    storage_client = storage.Client(project=PROJECT)
+    seed_jobs(db, collection, job_ids, random.Random(args.seed))
+
+    names = blob_names(job_ids + orphan_ids, args.files_per_job)
+    orphaned_files = len(orphan_ids) * args.files_per_job
+    env = {
+        **os.environ,
+        "GOOGLE_CLOUD_PROJECT": PROJECT,
+        "BUCKET_NAME": bucket_name,
+        "FIRESTORE_COLLECTION": collection,
+        "CLEANUP_STATE_COLLECTION": f"bench_cleanup_state_{tag}",
+        # Measure the compute path, not the response cache
+        "STATS_CACHE_TTL_SECONDS": "0",
+        "STATS_CACHE_STALE_SECONDS": "0",
+    }
+
+    runs = []
+    for name, function_dir, entry_point, query in SCENARIOS:
+        if name not in args.scenarios:
+            continue
+        if function_dir == "cleanup":
+            seed_files(storage_client, bucket_name, names, args.file_bytes)
+        repeat = 1 if function_dir == "cleanup" else args.repeat
+        result = run_scenario(name, function_dir, entry_point, query, env, repeat)
+        runs.append(summarize(name, result, len(names), orphaned_files))
+        print(f"{name}: {runs[-1]['wall_seconds']} s", file=sys.stderr)
+
+    commit = subprocess.run(["git", "-C", REPO_ROOT, "rev-parse", "--short", "HEAD"],
+                            capture_output=True, text=True).stdout.strip()
+    report = {
+        "dataset": {
+            "jobs": args.jobs,
+            "files_per_job": args.files_per_job,
+            "orphan_percent": args.orphan_percent,
+            "orphaned_jobs": len(orphan_ids),
+            "files": len(names),
+            "seed": args.seed,
+        },
+        "environment": {"commit": commit, "python": platform.python_version(), "machine": platform.machine()},
+        "runs": runs,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark: CPU per Firestore job event spent deciding what on_job_completed does.
+
+Decodes the same synthetic DocumentEventData payloads as
+replay_job_events.py two ways and reports CPU microseconds per event for
+each transition:
+
+- full: the previous decoder, a proto-plus DocumentEventData parsed up
+  front with every field read through proto-plus wrappers;
+- fast: job_events.JobEvent as on_job_completed uses it, which skips
+  progress updates on the update mask alone and parses only the
+  documents it reads.
+
+Both must agree on (old status, new status, filename) for every event
+that changes the status, and the run also checks that an integer field
+holding 0 decodes as 0 rather than None.
+
+Usage:
+    python benchmarks/job_event_decoding.py
+    python benchmarks/job_event_decoding.py --events 20000 --chapters 100 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(BENCHMARKS_DIR, "..", "cloud-functions", "shared")
+
+
+def full_field_value(document, field_name):
+    """The previous field reader (through proto-plus, integer 0 read as None)."""
+    if field_name in document.fields:
+        field = document.fields[field_name]
+        if field.string_value:
+            return field.string_value
+        elif field.integer_value:
+            return field.integer_value
+    return None
+
+
+def full_decode(firestoredata, cloud_event):
+    """The decoding on_job_completed did before the fast path."""
+    payload = firestoredata.DocumentEventData()
+    payload._pb.ParseFromString(cloud_event.data)
+    existed = payload._pb.HasField("old_value")
+    exists = payload._pb.HasField("value")
+    old_status = full_field_value(payload.old_value, "status") if existed else None
+    new_status = full_field_value(payload.value, "status") if exists else None
+    filename = full_field_value(payload.value, "filename") if exists else None
+    if old_status == new_status and existed == exists:
+        return None
+    return old_status, new_status, filename
+
+
+def fast_decode(job_events, cloud_event):
+    """The decision at the top of on_job_completed."""
+    event = job_events.JobEvent(cloud_event)
+    if not event.may_change("status"):
+        return None
+    old_status, new_status = event.old("status"), event.new("status")
+    if old_status == new_status and event.existed == event.exists:
+        return None
+    return old_status, new_status, event.new("filename")
+
+
+def cpu_per_event(decode, events, repeat):
+    """{transition: CPU microseconds per event}, best of `repeat` passes."""
+    by_name = defaultdict(list)
+    for name, event in events:
+        by_name[name].append(event)
+    costs = {}
+    for name, group in by_name.items():
+        best = None
+        for _ in range(repeat):
+            started = time.process_time()
+            for event in group:
+                decode(event)
+            elapsed = time.process_time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        costs[name] = best * 1e6 / len(group)
+    return costs, {name: len(group) for name, group in by_name.items()}
+
+
+def integer_zero_check(firestoredata, job_events):
+    """(full, fast) decoding of an integer field holding 0."""
+    from cloudevents.http import CloudEvent
+
+    document = firestoredata.Document(
+        name="projects/p/databases/(default)/documents/audiobook_jobs/job-0",
+        fields={"progress": firestoredata.Value(integer_value=0)},
+    )
+    payload = firestoredata.DocumentEventData(value=document)
+    event = job_events.JobEvent(CloudEvent(
+        {"id": "zero", "type": "t", "source": "s", "subject": "documents/audiobook_jobs/job-0"},
+        firestoredata.DocumentEventData.serialize(payload),
+    ))
+    return full_field_value(document, "progress"), event.new("progress")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--chapters", type=int, default=20, help="chapter entries per job document")
+    parser.add_argument("--repeat", type=int, default=5, help="passes per transition; the fastest counts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of a table")
+    args = parser.parse_args()
+
+    sys.path[:0] = [BENCHMARKS_DIR, SHARED_DIR]
+    import job_events
+    from google.events.cloud import firestore as firestoredata
+    from replay_job_events import TRANSITIONS, build_events
+
+    mix = {name: weight for name, (_, _, weight) in TRANSITIONS.items()}
+    events = build_events(args.events, mix, args.chapters, args.seed)
+
+    mismatches = sum(
+        full_decode(firestoredata, event) != fast_decode(job_events, event) for _, event in events
+    )
+    full, counts = cpu_per_event(lambda event: full_decode(firestoredata, event), events, args.repeat)
+    fast, _ = cpu_per_event(lambda event: fast_decode(job_events, event), events, args.repeat)
+    legacy_zero, fast_zero = integer_zero_check(firestoredata, job_events)
+
+    def mean(costs):
+        return sum(costs[name] * counts[name] for name in counts) / sum(counts.values())
+
+    report = {
+        "events": len(events),
+        "chapters": args.chapters,
+        "payload_bytes_mean": round(sum(len(event.data) for _, event in events) / len(events)),
+        "mismatches": mismatches,
+        "integer_zero": {"full": legacy_zero, "fast": fast_zero},
+        "cpu_us_per_event": {
+            name: {"events": counts[name], "full": round(full[name], 2), "fast": round(fast[name], 2),
+                   "speedup": round(full[name] / fast[name], 1)}
+            for name in sorted(counts)
+        },
+        "cpu_us_per_event_mix": {"full": round(mean(full), 2), "fast": round(mean(fast), 2),
+                                 "speedup": round(mean(full) / mean(fast), 1)},
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['events']} events, {args.chapters} chapters, {report['payload_bytes_mean']} bytes each")
+        print(f"{'transition':<12} {'events':>7} {'full us':>9} {'fast us':>9} {'speedup':>8}")
+        for name, values in report["cpu_us_per_event"].items():
+            print(f"{name:<12} {values['events']:>7} {values['full']:>9} {values['fast']:>9} {values['speedup']:>7}x")
+        mixed = report["cpu_us_per_event_mix"]
+        print(f"{'mix':<12} {report['events']:>7} {mixed['full']:>9} {mixed['fast']:>9} {mixed['speedup']:>7}x")
+        print(f"mismatches: {mismatches}; integer 0 decodes as {legacy_zero!r} (full) and {fast_zero!r} (fast)")
+    if mismatches or fast_zero != 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
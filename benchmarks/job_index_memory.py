@@ -0,0 +1,92 @@
+"""
+Benchmark: peak RSS of the cleanup valid-job index against job count.
+
+Compares the old in-memory set of ids with the sorted-hash array and the
+Bloom filter used by cloud-functions/cleanup. Every measurement runs in a
+fresh interpreter so the reported peak belongs to that index alone.
+
+Usage:
+    python benchmarks/job_index_memory.py
+    python benchmarks/job_index_memory.py --jobs 10000 100000 1000000 --json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+CLEANUP_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "cleanup")
+SHARED_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "shared")
+BACKENDS = ("set", "sorted", "bloom")
+
+
+def _rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(backend, jobs):
+    """Build one index from synthetic ids and report its cost."""
+    sys.path[:0] = [CLEANUP_DIR, SHARED_DIR]
+    import main
+
+    job_ids = (str(uuid.UUID(int=i * 0x9E3779B97F4A7C15 % (1 << 128))) for i in range(jobs))
+    baseline = _rss_kb()
+    started = time.perf_counter()
+    if backend == "set":
+        index = set(job_ids)
+    else:
+        index = main.JOB_INDEXES[backend](job_ids)
+    build_seconds = time.perf_counter() - started
+
+    probe = str(uuid.uuid4())
+    started = time.perf_counter()
+    for _ in range(10000):
+        probe in index
+    lookup_us = (time.perf_counter() - started) / 10000 * 1e6
+
+    return {
+        "backend": backend,
+        "jobs": jobs,
+        "peak_rss_mb": round(_rss_kb() / 1024, 1),
+        "index_rss_mb": round((_rss_kb() - baseline) / 1024, 1),
+        "build_seconds": round(build_seconds, 3),
+        "lookup_us": round(lookup_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of a table")
+    parser.add_argument("--single", nargs=2, metavar=("BACKEND", "JOBS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(measure(args.single[0], int(args.single[1]))))
+        return
+
+    results = []
+    for jobs in args.jobs:
+        for backend in args.backends:
+            output = subprocess.run(
+                [sys.executable, __file__, "--single", backend, str(jobs)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'backend':<8} {'jobs':>10} {'index MB':>9} {'peak MB':>8} {'build s':>8} {'lookup us':>10}")
+    for r in results:
+        print(f"{r['backend']:<8} {r['jobs']:>10} {r['index_rss_mb']:>9} {r['peak_rss_mb']:>8} "
+              f"{r['build_seconds']:>8} {r['lookup_us']:>10}")
+
+
+if __name__ == "__main__":
+    main()
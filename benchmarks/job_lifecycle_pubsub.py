@@ -0,0 +1,238 @@
+"""
+Benchmark: job lifecycle publishing throughput against the Pub/Sub emulator.
+
+Publishes synthetic job transitions (create, start, complete or fail,
+delete) through the LifecyclePublisher used by on_job_completed, from
+--concurrency threads that each behave like one invocation: publish one
+event and wait for its acknowledgement. Every job's transitions go through
+the same thread in order, as Firestore delivers them. Each batch size in
+--batch-sizes is run against its own topic and ordered subscription, and
+the run reports published events/sec, publish latency percentiles,
+end-to-end latency to the subscriber, bytes per event against the same
+event as JSON, and whether every event arrived once and in order per job.
+
+It also checks that the proto-plus classes in lifecycle.py still match
+job_lifecycle.proto, the schema Pulumi attaches to the real topic (the
+emulator does not validate schemas).
+
+Usage:
+    gcloud beta emulators pubsub start --host-port=localhost:8085
+    PUBSUB_EMULATOR_HOST=localhost:8085 python benchmarks/job_lifecycle_pubsub.py
+    PUBSUB_EMULATOR_HOST=localhost:8085 python benchmarks/job_lifecycle_pubsub.py --jobs 5000 --batch-sizes 1,10,100 --json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+NOTIFICATION_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "notification")
+SHARED_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "shared")
+PROTO_PATH = os.path.join(NOTIFICATION_DIR, "job_lifecycle.proto")
+PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "fognode-bench")
+
+# (old status, new status) of each job, in order; the last step is a delete
+LIFECYCLES = {
+    "completed": [(None, "pending"), ("pending", "processing"), ("processing", "completed"), ("completed", None)],
+    "failed": [(None, "pending"), ("pending", "processing"), ("processing", "failed"), ("failed", None)],
+}
+
+
+def proto_declarations(text):
+    """{qualified name: {field or value: number}} of the messages and enums of a .proto."""
+    text = re.sub(r"//.*", "", text)
+    declared, scope = {}, []
+    for token in re.finditer(r"(?:message|enum)\s+(\w+)\s*\{|\}|[^{};]+;", text):
+        if token.group(1):
+            scope.append(token.group(1))
+            declared[".".join(scope)] = {}
+        elif token.group(0) == "}":
+            scope.pop()
+        elif scope:
+            # "JobStatus old_status = 3;" in a message, "PENDING = 1;" in an enum
+            entry = re.match(r"\s*(?:[\w.]+\s+)?(\w+)\s*=\s*(\d+)\s*;", token.group(0))
+            if entry:
+                declared[".".join(scope)][entry.group(1)] = int(entry.group(2))
+    return declared
+
+
+def schema_mismatches(lifecycle):
+    """
+    Differences between job_lifecycle.proto and the proto-plus classes, and
+    extra top-level types (a Pub/Sub schema takes exactly one).
+    """
+    with open(PROTO_PATH) as f:
+        declared = proto_declarations(f.read())
+
+    descriptor = lifecycle.JobLifecycleEvent.pb().DESCRIPTOR
+    python = {"JobLifecycleEvent": {f.name: f.number for f in descriptor.fields}}
+    for enum in descriptor.enum_types:
+        python[f"JobLifecycleEvent.{enum.name}"] = {value.name: value.number for value in enum.values}
+    mismatches = [name for name in sorted(set(declared) | set(python)) if declared.get(name) != python.get(name)]
+    top_level = sorted(name for name in declared if "." not in name)
+    if len(top_level) != 1:
+        mismatches.append(f"top-level types {', '.join(top_level)}")
+    return mismatches
+
+
+def job_sequences(jobs, seed):
+    """{job_id: [(old, new), ...]}, one lifecycle per job."""
+    rng = random.Random(seed)
+    return {
+        f"{rng.getrandbits(64):016x}": LIFECYCLES["failed" if rng.random() < 0.1 else "completed"]
+        for _ in range(jobs)
+    }
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2) if ordered else None
+
+
+def run_config(lifecycle, publisher_client, subscriber, sequences, batch_size, args):
+    """Publish every sequence with one batch size; returns the report entry."""
+    suffix = f"{os.getpid()}-{batch_size}"
+    topic = publisher_client.topic_path(PROJECT, f"bench-job-lifecycle-{suffix}")
+    subscription = subscriber.subscription_path(PROJECT, f"bench-job-lifecycle-{suffix}")
+    publisher_client.create_topic(request={"name": topic})
+    subscriber.create_subscription(request={"name": subscription, "topic": topic, "enable_message_ordering": True})
+
+    expected = sum(len(steps) for steps in sequences.values())
+    received = defaultdict(list)  # job_id -> [sequence number]
+    end_to_end = []
+    duplicates = [0]
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def on_message(message):
+        event = lifecycle.JobLifecycleEvent.deserialize(message.data)
+        with lock:
+            step = int(event.event_id.rsplit("-", 1)[1])
+            if step in received[event.job_id]:
+                duplicates[0] += 1
+            else:
+                received[event.job_id].append(step)
+                end_to_end.append(time.time() * 1000 - event.event_time_micros / 1000)
+            if sum(len(steps) for steps in received.values()) >= expected:
+                done.set()
+        message.ack()
+
+    streaming = subscriber.subscribe(subscription, on_message)
+
+    publisher = lifecycle.LifecyclePublisher(topic, max_messages=batch_size, max_latency=args.max_latency)
+    publish_ms = []
+    sizes = {"protobuf": 0, "json": 0}
+
+    def invocations(job_ids):
+        # One thread stands for one concurrently running invocation
+        for job_id in job_ids:
+            for step, (old, new) in enumerate(sequences[job_id]):
+                message = lifecycle.JobLifecycleEvent(
+                    event_id=f"{job_id}-{step}",
+                    job_id=job_id,
+                    old_status=lifecycle._status(old),
+                    new_status=lifecycle._status(new),
+                    change=(lifecycle.Change.CREATED if old is None
+                            else lifecycle.Change.DELETED if new is None else lifecycle.Change.UPDATED),
+                    event_time_micros=int(time.time() * 1_000_000),
+                    filename=f"{job_id}.pdf",
+                )
+                started = time.perf_counter()
+                publisher.publish(message)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    publish_ms.append(elapsed)
+                    sizes["protobuf"] += len(lifecycle.JobLifecycleEvent.serialize(message))
+                    sizes["json"] += len(json.dumps({
+                        "event_id": message.event_id, "job_id": job_id, "old_status": old, "new_status": new,
+                        "change": lifecycle.Change(message.change).name.lower(),
+                        "timestamp": message.event_time_micros, "filename": message.filename,
+                    }).encode())
+
+    job_ids = list(sequences)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(invocations, [job_ids[i::args.concurrency] for i in range(args.concurrency)]))
+    publish_seconds = time.perf_counter() - started
+
+    arrived = done.wait(timeout=args.receive_timeout)
+    streaming.cancel()
+    publisher_client.delete_topic(request={"topic": topic})
+    subscriber.delete_subscription(request={"subscription": subscription})
+
+    in_order = all(steps == sorted(steps) for steps in received.values())
+    return {
+        "batch_size": batch_size,
+        "events": expected,
+        "received": sum(len(steps) for steps in received.values()),
+        "duplicates": duplicates[0],
+        "all_received": arrived,
+        "in_order_per_job": in_order,
+        "events_per_sec": round(expected / publish_seconds, 1),
+        "publish_ms_p50": percentile(publish_ms, 0.5),
+        "publish_ms_p95": percentile(publish_ms, 0.95),
+        "end_to_end_ms_p50": percentile(end_to_end, 0.5),
+        "end_to_end_ms_p95": percentile(end_to_end, 0.95),
+        "bytes_per_event": round(sizes["protobuf"] / expected, 1),
+        "json_bytes_per_event": round(sizes["json"] / expected, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=2000, help="jobs; each publishes 4 transitions")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent invocations on the instance")
+    parser.add_argument("--batch-sizes", default="1,10,100", help="JOB_EVENTS_BATCH_MAX_MESSAGES values to compare")
+    parser.add_argument("--max-latency", type=float, default=0.025, help="JOB_EVENTS_BATCH_MAX_LATENCY_SECONDS")
+    parser.add_argument("--receive-timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of a table")
+    args = parser.parse_args()
+
+    if not os.environ.get("PUBSUB_EMULATOR_HOST"):
+        sys.exit("PUBSUB_EMULATOR_HOST is not set; start the Pub/Sub emulator first")
+
+    sys.path[:0] = [NOTIFICATION_DIR, SHARED_DIR]
+    import lifecycle
+    from google.cloud import pubsub_v1
+
+    mismatches = schema_mismatches(lifecycle)
+    if mismatches:
+        sys.exit(f"lifecycle.py does not match job_lifecycle.proto: {', '.join(mismatches)}")
+
+    publisher_client = pubsub_v1.PublisherClient()
+    subscriber = pubsub_v1.SubscriberClient()
+    sequences = job_sequences(args.jobs, args.seed)
+    report = {
+        "jobs": args.jobs,
+        "concurrency": args.concurrency,
+        "max_latency_seconds": args.max_latency,
+        "runs": [
+            run_config(lifecycle, publisher_client, subscriber, sequences, int(size), args)
+            for size in args.batch_sizes.split(",")
+        ],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.jobs} jobs, {args.concurrency} concurrent invocations, max latency {args.max_latency}s")
+        print(f"{'batch':>6} {'events/s':>10} {'pub p50':>8} {'pub p95':>8} {'e2e p50':>8} {'e2e p95':>8} "
+              f"{'bytes':>6} {'json':>6}  received")
+        for run in report["runs"]:
+            check = "ok" if run["all_received"] and run["in_order_per_job"] and not run["duplicates"] else "FAILED"
+            print(f"{run['batch_size']:>6} {run['events_per_sec']:>10} {run['publish_ms_p50']:>8} "
+                  f"{run['publish_ms_p95']:>8} {run['end_to_end_ms_p50']:>8} {run['end_to_end_ms_p95']:>8} "
+                  f"{run['bytes_per_event']:>6} {run['json_bytes_per_event']:>6}  "
+                  f"{run['received']}/{run['events']} {check}")
+    if not all(run["all_received"] and run["in_order_per_job"] for run in report["runs"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
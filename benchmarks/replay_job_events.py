@@ -0,0 +1,222 @@
+"""
+Benchmark: replay synthetic Firestore job events into on_job_completed.
+
+Builds DocumentEventData payloads for a realistic mix of job transitions
+(creates, progress updates that leave the status alone, completions,
+failures, deletes) and calls on_job_completed in-process at a target rate.
+Reports events/sec, per-event latency percentiles overall and per
+transition, and a second pass under tracemalloc reports allocated memory
+per event.
+
+Counter and manifest writes go to the Firestore emulator when
+FIRESTORE_EMULATOR_HOST is set; otherwise the counters are reduced to
+counters.transition_deltas and manifest touches are skipped, so only the
+decode and dispatch path is measured. Webhooks are not sent (WEBHOOK_URLS
+is cleared).
+
+Usage:
+    python benchmarks/replay_job_events.py
+    python benchmarks/replay_job_events.py --events 50000 --rate 2000 --chapters 50 --json
+    python benchmarks/replay_job_events.py --mix progress=0.9 complete=0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+NOTIFICATION_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "notification")
+SHARED_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "shared")
+DOCUMENT_PREFIX = "projects/fognode-bench/databases/(default)/documents/audiobook_jobs"
+
+# name -> (old status or None if the document is new, new status or None if deleted, weight)
+TRANSITIONS = {
+    "create": (None, "pending", 0.15),
+    "start": ("pending", "processing", 0.15),
+    "progress": ("processing", "processing", 0.45),
+    "complete": ("processing", "completed", 0.15),
+    "fail": ("processing", "failed", 0.03),
+    "touch": ("completed", "completed", 0.05),
+    "delete": ("completed", None, 0.02),
+}
+
+
+def job_document(firestoredata, job_id, status, chapters, progress, now):
+    """A job document shaped like the ones the processing service writes."""
+    Value = firestoredata.Value
+    chapter_values = [
+        Value(map_value=firestoredata.MapValue(fields={
+            "title": Value(string_value=f"Chapter {i + 1}"),
+            "duration_seconds": Value(double_value=600.0 + i),
+            "audio_path": Value(string_value=f"audiobooks/{job_id}/chapter-{i:03d}.wav"),
+        }))
+        for i in range(chapters)
+    ]
+    fields = {
+        "status": Value(string_value=status),
+        "filename": Value(string_value=f"{job_id}.pdf"),
+        "user_id": Value(string_value="user-0001"),
+        "progress": Value(integer_value=progress),
+        "created_at": Value(timestamp_value=now - timedelta(minutes=30)),
+        "chapters": Value(array_value=firestoredata.ArrayValue(values=chapter_values)),
+    }
+    if status == "completed":
+        fields["completed_at"] = Value(timestamp_value=now)
+    return firestoredata.Document(name=f"{DOCUMENT_PREFIX}/{job_id}", fields=fields)
+
+
+def build_events(count, mix, chapters, seed):
+    """[(transition name, CloudEvent)] in a shuffled, reproducible order."""
+    from cloudevents.http import CloudEvent
+    from google.events.cloud import firestore as firestoredata
+
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    now = datetime.now(timezone.utc)
+    events = []
+    for i in range(count):
+        name = rng.choices(names, weights)[0]
+        old_status, new_status, _ = TRANSITIONS[name]
+        job_id = f"{rng.getrandbits(64):016x}"
+        payload = firestoredata.DocumentEventData()
+        if old_status:
+            payload.old_value = job_document(firestoredata, job_id, old_status, chapters, 40, now)
+        if new_status:
+            payload.value = job_document(firestoredata, job_id, new_status, chapters, 60, now)
+        if old_status and new_status:
+            changed = ["progress"] if old_status == new_status else ["status", "progress"]
+            payload.update_mask = firestoredata.DocumentMask(field_paths=changed)
+        attributes = {
+            "id": f"event-{i}",
+            "type": "google.cloud.firestore.document.v1.written",
+            "source": "//firestore.googleapis.com/projects/fognode-bench/databases/(default)",
+            "subject": f"documents/audiobook_jobs/{job_id}",
+        }
+        events.append((name, CloudEvent(attributes, firestoredata.DocumentEventData.serialize(payload))))
+    return events
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4) if ordered else None
+
+
+def replay(handler, events, rate):
+    """Call handler for every event, paced to `rate` events/sec (0 = flat out)."""
+    latencies = defaultdict(list)
+    started = time.perf_counter()
+    for i, (name, event) in enumerate(events):
+        if rate:
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        begin = time.perf_counter()
+        handler(event)
+        latencies[name].append((time.perf_counter() - begin) * 1000)
+    return latencies, time.perf_counter() - started
+
+
+def allocations(handler, events):
+    """Peak traced memory per event and blocks still allocated after the pass."""
+    peaks = []
+    tracemalloc.start()
+    baseline_blocks = sys.getallocatedblocks()
+    for _, event in events:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        handler(event)
+        peaks.append((tracemalloc.get_traced_memory()[1] - current) / 1024)
+    retained_blocks = sys.getallocatedblocks() - baseline_blocks
+    tracemalloc.stop()
+    return {
+        "events": len(events),
+        "peak_kib_per_event_mean": round(sum(peaks) / len(peaks), 2) if peaks else None,
+        "peak_kib_per_event_p99": percentile(peaks, 0.99),
+        "retained_blocks": retained_blocks,
+    }
+
+
+def parse_mix(pairs):
+    mix = {name: weight for name, (_, _, weight) in TRANSITIONS.items()}
+    if pairs:
+        mix = {}
+        for pair in pairs:
+            name, _, weight = pair.partition("=")
+            if name not in TRANSITIONS:
+                sys.exit(f"unknown transition {name!r}; choose from {', '.join(TRANSITIONS)}")
+            mix[name] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=0, help="target events/sec (0 = as fast as possible)")
+    parser.add_argument("--chapters", type=int, default=20, help="chapter entries per job document")
+    parser.add_argument("--mix", nargs="+", metavar="NAME=WEIGHT", help="transition weights")
+    parser.add_argument("--alloc-events", type=int, default=1000, help="events in the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of text")
+    args = parser.parse_args()
+
+    os.environ.pop("WEBHOOK_URLS", None)
+    sys.path[:0] = [NOTIFICATION_DIR, SHARED_DIR]
+    import counters
+    import main as notification
+    import manifest
+
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        notification.get_firestore_client = lambda: None
+        counters.apply_transition = (
+            lambda db, event_id, old, new, existed, exists: bool(counters.transition_deltas(old, new, existed, exists))
+        )
+        manifest.touch_job = lambda db, job_id: None
+
+    mix = parse_mix(args.mix)
+    events = build_events(args.events, mix, args.chapters, args.seed)
+    payload_bytes = sum(len(event.data) for _, event in events) / len(events)
+
+    # The function logs every notification; keep that out of the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        notification.on_job_completed(events[0][1])  # warm up imports and clients
+        latencies, elapsed = replay(notification.on_job_completed, events, args.rate)
+        memory = allocations(notification.on_job_completed, events[:args.alloc_events])
+
+    every = [value for values in latencies.values() for value in values]
+    report = {
+        "events": len(events),
+        "target_rate": args.rate or None,
+        "payload_bytes_mean": round(payload_bytes),
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(len(events) / elapsed, 1),
+        "latency_ms_p50": percentile(every, 0.50),
+        "latency_ms_p95": percentile(every, 0.95),
+        "latency_ms_p99": percentile(every, 0.99),
+        "by_transition": {
+            name: {"events": len(values), "p50": percentile(values, 0.50), "p99": percentile(values, 0.99)}
+            for name, values in sorted(latencies.items())
+        },
+        "allocations": memory,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print(key)
+            for name, values in value.items():
+                print(f"  {name:<26} {values}")
+        else:
+            print(f"{key:<28} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: get_stats counting with count() aggregations vs a full scan.
+
+Seeds synthetic audiobook_jobs collections into the Firestore emulator and
+times both counting paths of cloud-functions/notification. Read units are
+estimated from Firestore billing: a scan costs one read per document, an
+aggregation one read per 1000 index entries matched (minimum one).
+
+Usage:
+    gcloud emulators firestore start --host-port=localhost:8080
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/stats_aggregation.py
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/stats_aggregation.py --jobs 1000 100000 1000000 --json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+NOTIFICATION_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "notification")
+SHARED_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "shared")
+STATUS_MIX = {"completed": 0.7, "processing": 0.1, "failed": 0.05, "pending": 0.15}
+
+
+def seed(db, collection, jobs):
+    """Write `jobs` synthetic job documents unless the collection already has them."""
+    jobs_ref = db.collection(collection)
+    existing = jobs_ref.count().get()[0][0].value
+    if existing >= jobs:
+        return
+    statuses, weights = zip(*STATUS_MIX.items())
+    batch = db.batch()
+    for i in range(existing, jobs):
+        batch.set(jobs_ref.document(f"job-{i:08d}"), {
+            "status": random.choices(statuses, weights)[0],
+            "filename": f"book-{i}.pdf",
+        })
+        if i % 500 == 499:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of a table")
+    args = parser.parse_args()
+
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("FIRESTORE_EMULATOR_HOST is not set; start the Firestore emulator first")
+
+    sys.path[:0] = [NOTIFICATION_DIR, SHARED_DIR]
+    import main as notification
+    from google.cloud import firestore
+
+    db = firestore.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT", "fognode-bench"))
+    results = []
+    for jobs in args.jobs:
+        collection = f"bench_jobs_{jobs}"
+        seed(db, collection, jobs)
+        jobs_ref = db.collection(collection)
+
+        counts, aggregation_seconds = timed(notification.count_by_aggregation, jobs_ref)
+        _, scan_seconds = timed(notification.count_by_scan, jobs_ref, repeat=1)
+        aggregation_reads = sum(max(1, math.ceil(n / 1000)) for n in counts.values())
+
+        results.append({
+            "jobs": jobs,
+            "aggregation_seconds": round(aggregation_seconds, 4),
+            "scan_seconds": round(scan_seconds, 4),
+            "aggregation_read_units": aggregation_reads,
+            "scan_read_units": jobs,
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'jobs':>10} {'agg s':>8} {'scan s':>8} {'agg reads':>10} {'scan reads':>11}")
+    for r in results:
+        print(f"{r['jobs']:>10} {r['aggregation_seconds']:>8} {r['scan_seconds']:>8} "
+              f"{r['aggregation_read_units']:>10} {r['scan_read_units']:>11}")
+
+
+if __name__ == "__main__":
+    main()
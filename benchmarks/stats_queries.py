@@ -0,0 +1,159 @@
+"""
+Benchmark: latency of each get_stats query shape.
+
+Seeds a synthetic audiobook_jobs collection into the Firestore emulator, with
+creation times spread over --days days, and times every query shape of
+cloud-functions/notification/queries.py: a first page and a walk through
+every page of a listing (with and without a status filter), and counts
+grouped by day and by hour. Each shape is also checked against a scan of
+the seeded data, so a wrong filter, a skipped page or a duplicate fails
+the run.
+
+The emulator does not require composite indexes, so this measures query
+cost rather than index coverage; the indexes are declared in
+pulumi/__main__.py.
+
+Usage:
+    gcloud emulators firestore start --host-port=localhost:8080
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/stats_queries.py
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/stats_queries.py --jobs 50000 --days 60 --json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+NOTIFICATION_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "notification")
+SHARED_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "shared")
+STATUS_MIX = {"completed": 0.7, "processing": 0.1, "failed": 0.05, "pending": 0.15}
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def seed(db, collection, jobs, days, seed_value):
+    """Write the synthetic jobs (unless already there); returns them as {id: (status, created)}."""
+    rng = random.Random(seed_value)
+    statuses, weights = zip(*STATUS_MIX.items())
+    seeded = {}
+    for i in range(jobs):
+        created = START + timedelta(seconds=rng.uniform(0, days * 86400))
+        seeded[f"job-{i:08d}"] = (rng.choices(statuses, weights)[0], created)
+
+    jobs_ref = db.collection(collection)
+    if jobs_ref.count().get()[0][0].value >= jobs:
+        return seeded
+    bulk = db.bulk_writer()
+    for job_id, (status, created) in seeded.items():
+        bulk.set(jobs_ref.document(job_id), {
+            "status": status,
+            "filename": f"{job_id}.pdf",
+            "created_at": created.replace(tzinfo=None).isoformat(),
+        })
+    bulk.close()
+    return seeded
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, samples
+
+
+def expected_ids(seeded, query):
+    return sorted(
+        (job_id for job_id, (status, created) in seeded.items()
+         if query["from"] <= created < query["to"] and (not query["status"] or status == query["status"])),
+        key=lambda job_id: (seeded[job_id][1], job_id), reverse=True,
+    )
+
+
+def walk(queries, jobs_ref, args):
+    """Every page of a listing; returns (ids in order, pages)."""
+    ids, pages, cursor = [], 0, None
+    while True:
+        page = queries.run(jobs_ref, queries.parse({**args, **({"cursor": cursor} if cursor else {})}))
+        ids += [job["id"] for job in page["jobs"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if not cursor:
+            return ids, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=30, help="creation times are spread over this many days")
+    parser.add_argument("--limit", type=int, default=100, help="page size of the listings")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per shape")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of a table")
+    args = parser.parse_args()
+
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("FIRESTORE_EMULATOR_HOST is not set; start the Firestore emulator first")
+
+    sys.path[:0] = [NOTIFICATION_DIR, SHARED_DIR]
+    import queries
+    from google.cloud import firestore
+
+    db = firestore.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT", "fognode-bench"))
+    collection = f"bench_query_jobs_{args.jobs}_{args.days}"
+    seeded = seed(db, collection, args.jobs, args.days, args.seed)
+    jobs_ref = db.collection(collection)
+
+    week = {"from": (START + timedelta(days=7)).isoformat(), "to": (START + timedelta(days=14)).isoformat()}
+    day = {"from": (START + timedelta(days=3)).isoformat(), "to": (START + timedelta(days=4)).isoformat()}
+    shapes = {
+        "list_first_page": {**week, "limit": str(args.limit)},
+        "list_status_first_page": {**week, "status": "failed", "limit": str(args.limit)},
+        "list_status_all_pages": {**day, "status": "completed", "limit": str(args.limit)},
+        "group_by_day": {"from": START.isoformat(), "to": (START + timedelta(days=args.days)).isoformat(),
+                         "group_by": "day"},
+        "group_by_hour_status": {**day, "group_by": "hour", "status": "completed"},
+    }
+
+    report = {"jobs": args.jobs, "days": args.days, "shapes": {}}
+    for name, shape in shapes.items():
+        query = queries.parse(shape)
+        expected = expected_ids(seeded, query)
+        if name.endswith("all_pages"):
+            (ids, pages), samples = timed(lambda: walk(queries, jobs_ref, shape), args.repeat)
+            correct = ids == expected
+            extra = {"pages": pages, "rows": len(ids)}
+        elif query["group_by"]:
+            result, samples = timed(lambda: queries.run(jobs_ref, query), args.repeat)
+            correct = result["total"] == len(expected)
+            extra = {"buckets": len(result["groups"]), "rows": result["total"]}
+        else:
+            result, samples = timed(lambda: queries.run(jobs_ref, query), args.repeat)
+            ids = [job["id"] for job in result["jobs"]]
+            correct = ids == expected[:len(ids)] and len(ids) == min(query["limit"], len(expected))
+            extra = {"rows": len(ids)}
+        report["shapes"][name] = {
+            "correct": correct,
+            "ms_p50": round(statistics.median(samples), 2),
+            "ms_max": round(max(samples), 2),
+            **extra,
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.jobs} jobs over {args.days} days")
+        print(f"{'shape':<26} {'correct':>8} {'p50 ms':>9} {'max ms':>9}  details")
+        for name, values in report["shapes"].items():
+            details = {k: v for k, v in values.items() if k not in ("correct", "ms_p50", "ms_max")}
+            print(f"{name:<26} {str(values['correct']):>8} {values['ms_p50']:>9} {values['ms_max']:>9}  {details}")
+    if not all(values["correct"] for values in report["shapes"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
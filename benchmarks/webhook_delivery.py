@@ -0,0 +1,116 @@
+"""
+Benchmark: webhook delivery throughput against a local stub HTTP server.
+
+Starts an aiohttp stub endpoint on localhost (with optional latency and
+error rate), pushes N notifications through the WebhookDispatcher used by
+on_job_completed and reports deliveries/sec, latency percentiles, retries
+and how many replayed event ids were suppressed as duplicates.
+
+Usage:
+    python benchmarks/webhook_delivery.py
+    python benchmarks/webhook_delivery.py --events 20000 --latency-ms 20 --error-rate 0.05 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+NOTIFICATION_DIR = os.path.join(os.path.dirname(__file__), "..", "cloud-functions", "notification")
+
+
+def start_stub(port, latency_ms, error_rate):
+    """Run the stub endpoint on its own loop; returns a dict of received counts."""
+    received = {"requests": 0, "errors": 0}
+
+    async def handle(request):
+        await request.read()
+        received["requests"] += 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if random.random() < error_rate:
+            received["errors"] += 1
+            return web.Response(status=503)
+        return web.Response(text="ok")
+
+    ready = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_post("/hook", handle)
+        runner = web.AppRunner(app, access_log=None)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return received
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--replay-rate", type=float, default=0.1, help="fraction of events delivered twice")
+    parser.add_argument("--concurrency", type=int, default=32, help="per-endpoint concurrency limit")
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--json", action="store_true", help="print a JSON report instead of text")
+    args = parser.parse_args()
+
+    sys.path.insert(0, NOTIFICATION_DIR)
+    import delivery
+
+    received = start_stub(args.port, args.latency_ms, args.error_rate)
+    dispatcher = delivery.WebhookDispatcher(
+        [f"http://127.0.0.1:{args.port}/hook"], concurrency=args.concurrency, backoff=0.05, backoff_max=0.5,
+    )
+
+    event_ids = [f"event-{i}" for i in range(args.events)]
+    event_ids += random.sample(event_ids, int(args.events * args.replay_rate))
+    payload = {"event": "job_completed", "job_id": "bench", "filename": "book.pdf"}
+
+    started = time.perf_counter()
+    futures = [dispatcher.submit({**payload, "event_id": event_id}, event_id) for event_id in event_ids]
+    results = [result for future in futures for result in future.result()]
+    elapsed = time.perf_counter() - started
+    dispatcher.close()
+
+    sent = [r for r in results if not r["duplicate"]]
+    latencies = [r["latency_ms"] for r in sent]
+    report = {
+        "events": args.events,
+        "replayed": len(event_ids) - args.events,
+        "delivered": sum(r["delivered"] for r in sent),
+        "failed": sum(not r["delivered"] for r in sent),
+        "duplicates_suppressed": sum(r["duplicate"] for r in results),
+        "http_requests": received["requests"],
+        "retries": sum(r["attempts"] - 1 for r in sent),
+        "seconds": round(elapsed, 3),
+        "deliveries_per_second": round(len(sent) / elapsed, 1),
+        "latency_ms_p50": percentile(latencies, 0.50),
+        "latency_ms_p99": percentile(latencies, 0.99),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
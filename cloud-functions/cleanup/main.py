@@ -4,60 +4,918 @@ Triggered by Cloud Scheduler to clean up audio files in Storage
 that don't have a corresponding job in Firestore.
 """
 import functions_framework
-from google.cloud import storage, firestore
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import base64
+import bisect
+import functools
+import hashlib
+import heapq
+import itertools
 import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+
+import archive
+import clients
+import job_events
+import manifest
+import telemetry
 
 # Configuration
-BUCKET_NAME = "fognode-audiobooks-1766767722"
-FIRESTORE_COLLECTION = "audiobook_jobs"
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "fognode-audiobooks-1766767722")
+FIRESTORE_COLLECTION = os.environ.get("FIRESTORE_COLLECTION", "audiobook_jobs")
+
+# Deletion stage tuning. Storage accepts at most 100 calls per batch request.
+DELETE_BATCH_SIZE = min(int(os.environ.get("DELETE_BATCH_SIZE", "100")), 100)
+DELETE_WORKERS = int(os.environ.get("DELETE_WORKERS", "8"))
+DELETE_MAX_ATTEMPTS = int(os.environ.get("DELETE_MAX_ATTEMPTS", "6"))
+
+# Orphan detection strategy: "prefix" lists only audiobooks/{job_id}/ prefixes,
+# "blob" walks every object, "manifest" merge-joins the object manifest with
+# the job ids and lists nothing. Can be overridden per request with ?mode=
+CLEANUP_MODE = os.environ.get("CLEANUP_MODE", "prefix")
+CLEANUP_MODES = ("prefix", "blob", "manifest")
+
+# Manifest mode checkpoints after this many jobs with files
+MANIFEST_PAGE_JOBS = int(os.environ.get("MANIFEST_PAGE_JOBS", "1000"))
+
+AUDIOBOOKS_PREFIX = "audiobooks/"
+
+# Valid-job index: "sorted" keeps an array of 64-bit id hashes, "bloom" a
+# fixed-size Bloom filter. Either way orphans are confirmed against Firestore
+# before anything is deleted.
+JOB_INDEX = os.environ.get("JOB_INDEX", "sorted")
+JOB_INDEX_PAGE_SIZE = int(os.environ.get("JOB_INDEX_PAGE_SIZE", "5000"))
+BLOOM_CAPACITY = int(os.environ.get("BLOOM_CAPACITY", "2000000"))
+BLOOM_ERROR_RATE = float(os.environ.get("BLOOM_ERROR_RATE", "0.001"))
+
+# Resumable sweeps: progress is checkpointed after every listing page and a
+# run stops taking new pages once this budget (below the 300 s timeout) is used
+CLEANUP_STATE_COLLECTION = os.environ.get("CLEANUP_STATE_COLLECTION", "cleanup_state")
+CLEANUP_TIME_BUDGET_SECONDS = float(os.environ.get("CLEANUP_TIME_BUDGET_SECONDS", "240"))
+
+# Sharded fan-out: the coordinator publishes one message per job-id shard
+# to CLEANUP_SHARDS_TOPIC and each message runs a worker invocation
+CLEANUP_SHARDS = int(os.environ.get("CLEANUP_SHARDS", "8"))
+CLEANUP_SHARDS_TOPIC = os.environ.get("CLEANUP_SHARDS_TOPIC", "")  # projects/{project}/topics/{name}
+CLEANUP_RUNS_COLLECTION = os.environ.get("CLEANUP_RUNS_COLLECTION", "cleanup_runs")
+COORDINATOR_WAIT_SECONDS = float(os.environ.get("COORDINATOR_WAIT_SECONDS", "240"))
+COORDINATOR_POLL_SECONDS = float(os.environ.get("COORDINATOR_POLL_SECONDS", "5"))
+
+# Archival: finished jobs older than this leave the hot collection, a bounded
+# number per run so each run fits in the function timeout
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_MAX_JOBS = int(os.environ.get("ARCHIVE_MAX_JOBS", "20000"))
+# Bucket for the archive segments and id index (the audio bucket if unset)
+ARCHIVE_BUCKET = os.environ.get("ARCHIVE_BUCKET") or BUCKET_NAME
+
+# Firestore's special field path for the document id
+DOCUMENT_ID = "__name__"
+
+# Status codes that mean "slow down and try again" rather than a hard failure
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+@clients.shared
+def get_storage_client():
+    from google.cloud import storage
+    return storage.Client()
+
+
+@clients.shared
+def get_firestore_client():
+    from google.cloud import firestore
+    return firestore.Client()
+
+
+@clients.shared
+def get_publisher():
+    from google.cloud import pubsub_v1
+    return pubsub_v1.PublisherClient()
+
+
+def iter_job_ids(collection, page_size=JOB_INDEX_PAGE_SIZE, start=None, end=None):
+    """
+    Yield every document id in the collection, in id order.
+    Queries are field-masked to the document name and paged with a cursor,
+    so no job fields are downloaded and only one page is held at a time.
+    start/end restrict the ids to the half-open range [start, end).
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    
+    query = collection.select([DOCUMENT_ID])
+    if start:
+        query = query.where(filter=FieldFilter(DOCUMENT_ID, ">=", collection.document(start)))
+    if end:
+        query = query.where(filter=FieldFilter(DOCUMENT_ID, "<", collection.document(end)))
+    query = query.order_by(DOCUMENT_ID).limit(page_size)
+    cursor = None
+    while True:
+        page = query.start_after(cursor) if cursor else query
+        count = 0
+        for snapshot in page.stream():
+            count += 1
+            cursor = snapshot
+            yield snapshot.id
+        if count < page_size:
+            return
+
+
+def _job_key(job_id):
+    return int.from_bytes(hashlib.blake2b(job_id.encode(), digest_size=8).digest(), "big")
+
+
+class SortedJobIndex:
+    """
+    Sorted array of 64-bit job id hashes, 8 bytes per job.
+    Ids arrive in pages; each page is sorted into its own run and the runs
+    are merged at the end, so peak memory stays close to the final array.
+    A hash collision can only make an orphan look valid, never the reverse.
+    """
+
+    def __init__(self, job_ids, page_size=JOB_INDEX_PAGE_SIZE):
+        runs = []
+        page = []
+        for job_id in job_ids:
+            page.append(_job_key(job_id))
+            if len(page) >= page_size:
+                runs.append(array("Q", sorted(page)))
+                page = []
+        if page:
+            runs.append(array("Q", sorted(page)))
+        self._keys = array("Q", heapq.merge(*runs))
+
+    def __contains__(self, job_id):
+        key = _job_key(job_id)
+        i = bisect.bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class BloomJobIndex:
+    """
+    Bloom filter sized up front for BLOOM_CAPACITY jobs, so memory does not
+    grow with the collection. False positives only make an orphan look
+    valid; they are skipped this run, never deleted by mistake.
+    """
+
+    def __init__(self, job_ids, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self._bits_count = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._bits_count / capacity * math.log(2)))
+        self._bits = bytearray(self._bits_count // 8 + 1)
+        self._count = 0
+        for job_id in job_ids:
+            for position in self._positions(job_id):
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self._count += 1
+
+    def _positions(self, job_id):
+        digest = hashlib.blake2b(job_id.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return ((h1 + i * h2) % self._bits_count for i in range(self._hashes))
+
+    def __contains__(self, job_id):
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(job_id))
+
+    def __len__(self):
+        return self._count
+
+
+JOB_INDEXES = {"sorted": SortedJobIndex, "bloom": BloomJobIndex}
+
+
+def _confirm_orphans(firestore_client, job_ids, archived=None):
+    """
+    Return the job ids that really have no document in Firestore.
+    With `archived`, jobs archived since the sweep started are not orphans.
+    """
+    jobs_ref = firestore_client.collection(FIRESTORE_COLLECTION)
+    refs = [jobs_ref.document(job_id) for job_id in job_ids]
+    snapshots = firestore_client.get_all(refs, field_paths=["status"])
+    missing = {snapshot.id for snapshot in snapshots if not snapshot.exists}
+    if missing and archived is not None:
+        missing -= archived.among(missing)
+    return missing
+
+
+@functools.lru_cache(maxsize=None)
+def _recording_batch_class():
+    from google.cloud.storage.batch import Batch
+
+    class RecordingBatch(Batch):
+        """Storage batch that keeps every sub-response instead of raising on the first error."""
+
+        def finish(self, raise_exception=True):
+            self.responses = super().finish(raise_exception=False)
+            return self.responses
+
+    return RecordingBatch
+
+
+class AdaptiveBackoff:
+    """
+    Delay shared by all deletion workers.
+    Doubles on every throttled batch and halves on every clean one, so the
+    pool slows down together when Storage pushes back.
+    """
+
+    def __init__(self, initial=0.5, maximum=32.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.throttled = 0
+        self._delay = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            delay = self._delay
+        if delay:
+            time.sleep(random.uniform(delay / 2, delay))
+
+    def on_throttled(self):
+        with self._lock:
+            self.throttled += 1
+            self._delay = min(max(self._delay * 2, self.initial), self.maximum)
+
+    def on_success(self):
+        with self._lock:
+            self._delay = self._delay / 2 if self._delay > self.initial else 0.0
+
+
+class BatchDeleter:
+    """
+    Deletion stage for orphaned objects.
+    Names are grouped into Storage batch requests and sent from a bounded
+    worker pool; at most two batches per worker are queued so listing
+    cannot run arbitrarily far ahead of deletion.
+    """
+
+    def __init__(self, client, bucket, batch_size=DELETE_BATCH_SIZE,
+                 workers=DELETE_WORKERS, max_attempts=DELETE_MAX_ATTEMPTS):
+        self._client = client
+        self._bucket = bucket
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._futures = []
+        self._started = time.monotonic()
+        self._span = telemetry.span("storage.delete")
+        self.backoff = AdaptiveBackoff()
+        self.deleted = 0
+        self.failed = 0
+        self.sample = []
+
+    def add(self, name):
+        self._pending.append(name)
+        if len(self.sample) < 10:
+            self.sample.append(name)
+        if len(self._pending) >= self._batch_size:
+            self._submit()
+
+    def _submit(self):
+        names, self._pending = self._pending, []
+        self._slots.acquire()
+        future = self._executor.submit(self._delete_batch, names)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def drain(self):
+        """Flush the last partial batch and wait until every queued batch is done."""
+        if self._pending:
+            self._submit()
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+    def counters(self):
+        return {
+            "orphaned_files_deleted": self.deleted,
+            "failed_deletes": self.failed,
+            "throttled_batches": self.backoff.throttled,
+        }
+
+    def close(self):
+        """Drain the pool, stop the workers and report deletion stats."""
+        self.drain()
+        self._executor.shutdown()
+        self._span.end()
+        elapsed = time.monotonic() - self._started
+        return {
+            **self.counters(),
+            "delete_seconds": round(elapsed, 3),
+            "deletes_per_second": round(self.deleted / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def _record(self, deleted, failed):
+        with self._lock:
+            self.deleted += deleted
+            self.failed += failed
+        self._span.add(items=deleted)
+
+    def _delete_batch(self, names):
+        from google.api_core import exceptions as api_exceptions
+        from google.auth import exceptions as auth_exceptions
+        from requests import exceptions as requests_exceptions
+        
+        for _ in range(self._max_attempts):
+            self.backoff.wait()
+            try:
+                with self._span.measure(), _recording_batch_class()(self._client) as batch:
+                    for name in names:
+                        self._bucket.delete_blob(name)
+            except api_exceptions.GoogleAPICallError as e:
+                # The whole multipart request was rejected
+                if e.code in RETRYABLE_STATUS_CODES:
+                    self.backoff.on_throttled()
+                    continue
+                print(f"Batch delete failed: {str(e)}")
+                self._record(0, len(names))
+                return
+            except (requests_exceptions.RequestException, auth_exceptions.GoogleAuthError) as e:
+                # Connection resets, timeouts, token refresh failures: retry the
+                # batch, and count it as failed rather than aborting the sweep
+                print(f"Batch delete transport error: {type(e).__name__}: {str(e)}")
+                self.backoff.on_throttled()
+                continue
+
+            retry = []
+            deleted = failed = 0
+            for name, response in zip(names, batch.responses):
+                # 404 means a previous attempt (or someone else) already removed it
+                if 200 <= response.status_code < 300 or response.status_code == 404:
+                    deleted += 1
+                elif response.status_code in RETRYABLE_STATUS_CODES:
+                    retry.append(name)
+                else:
+                    failed += 1
+            self._record(deleted, failed)
+
+            if not retry:
+                self.backoff.on_success()
+                return
+            self.backoff.on_throttled()
+            names = retry
+
+        self._record(0, len(names))
+
+
+def _request_arg(request, name):
+    """Read a query parameter; scheduler-built requests may not carry any."""
+    args = getattr(request, "args", None)
+    return args.get(name) if args else None
+
+
+def _shard_offsets(shard):
+    """Storage start/end offsets covering the job ids of a shard."""
+    if not shard:
+        return {}
+    return {
+        "start_offset": f"{AUDIOBOOKS_PREFIX}{shard['start']}" if shard["start"] else None,
+        "end_offset": f"{AUDIOBOOKS_PREFIX}{shard['end']}" if shard["end"] else None,
+    }
+
+
+def _scan_blobs(bucket, firestore_client, valid_job_ids, deleter, stats, page_token=None, shard=None, archived=None):
+    """
+    Walk every object under audiobooks/ and queue those without a job.
+    Yields the listing's next page token after each page has been handled.
+    """
+    stats.setdefault("objects_scanned", 0)
+    # Listings are sorted, so a job's files are contiguous: confirm each
+    # candidate job once and reuse the answer for the rest of its files.
+    candidate, confirmed = None, False
+    blobs = bucket.list_blobs(
+        prefix=AUDIOBOOKS_PREFIX, page_token=page_token, fields="items(name),nextPageToken",
+        **_shard_offsets(shard),
+    )
+    with telemetry.span("storage.list", mode="blob") as listing, \
+            telemetry.span("firestore.confirm") as confirming:
+        for page in listing.iterate(blobs.pages):
+            listing.add(items=page.num_items)
+            for blob in page:
+                stats["objects_scanned"] += 1
+                # Extract job_id from path: audiobooks/{job_id}/filename.wav
+                parts = blob.name.split("/")
+                if len(parts) >= 2:
+                    job_id = parts[1]
+                    if job_id and job_id not in valid_job_ids:
+                        if job_id != candidate:
+                            candidate = job_id
+                            with confirming.measure():
+                                confirmed = bool(_confirm_orphans(firestore_client, [job_id], archived))
+                            confirming.add(items=1)
+                        if confirmed:
+                            deleter.add(blob.name)
+            yield blobs.next_page_token
+
+
+def _scan_prefixes(bucket, firestore_client, valid_job_ids, deleter, stats, page_token=None, shard=None, archived=None):
+    """
+    List only the audiobooks/{job_id}/ prefixes and expand the orphaned ones.
+    Work is proportional to the number of jobs plus the number of orphaned
+    files, instead of the number of files in the bucket. Objects stored
+    directly under audiobooks/ are not job folders and are left alone.
+    Yields the listing's next page token after each page has been handled.
+    """
+    stats.setdefault("prefixes_scanned", 0)
+    stats.setdefault("orphaned_jobs", 0)
+    prefixes = bucket.list_blobs(
+        prefix=AUDIOBOOKS_PREFIX, delimiter="/", page_token=page_token,
+        fields="prefixes,nextPageToken", **_shard_offsets(shard),
+    )
+    with telemetry.span("storage.list", mode="prefix") as listing, \
+            telemetry.span("firestore.confirm") as confirming:
+        for page in listing.iterate(prefixes.pages):
+            listing.add(items=len(page.prefixes))
+            stats["prefixes_scanned"] += len(page.prefixes)
+            job_ids = (prefix[len(AUDIOBOOKS_PREFIX):].rstrip("/") for prefix in page.prefixes)
+            candidates = [job_id for job_id in job_ids if job_id not in valid_job_ids]
+            orphans = ()
+            if candidates:
+                with confirming.measure():
+                    orphans = sorted(_confirm_orphans(firestore_client, candidates, archived))
+                confirming.add(items=len(candidates))
+            for job_id in orphans:
+                stats["orphaned_jobs"] += 1
+                prefix = f"{AUDIOBOOKS_PREFIX}{job_id}/"
+                for blob in listing.iterate(bucket.list_blobs(prefix=prefix, fields="items(name),nextPageToken")):
+                    deleter.add(blob.name)
+            yield prefixes.next_page_token
+
+
+def _scan_manifest(bucket, firestore_client, job_ids, deleter, stats, page_token=None, shard=None, archived=None):
+    """
+    Merge-join the object manifest with the job ids, both sorted by job id,
+    and queue the files of jobs without a document. Nothing is listed:
+    `job_ids` is the sorted id stream itself rather than an index.
+    Yields the last job id handled after every MANIFEST_PAGE_JOBS jobs,
+    then None once the manifest is exhausted.
+    """
+    stats.setdefault("manifest_objects", 0)
+    stats.setdefault("manifest_jobs", 0)
+    stats.setdefault("orphaned_jobs", 0)
+    rows = manifest.entries(bucket, firestore_client, shard and shard["start"], shard and shard["end"])
+    job_ids = iter(job_ids)
+    current = next(job_ids, None)
+    candidates = {}
+    
+    with telemetry.span("manifest.read") as reading, \
+            telemetry.span("firestore.confirm") as confirming:
+        
+        def queue_orphans():
+            with confirming.measure():
+                orphans = _confirm_orphans(firestore_client, list(candidates), archived)
+            confirming.add(items=len(candidates))
+            for orphan in sorted(orphans):
+                stats["orphaned_jobs"] += 1
+                for name in candidates[orphan]:
+                    deleter.add(name)
+            candidates.clear()
+        
+        for job_id, group in itertools.groupby(reading.iterate(rows), key=lambda row: row[0]):
+            names = [row[1] for row in group]
+            # Resuming: everything up to the checkpointed job id is done
+            if page_token and job_id <= page_token:
+                continue
+            reading.add(items=len(names))
+            stats["manifest_jobs"] += 1
+            stats["manifest_objects"] += len(names)
+            while current is not None and current < job_id:
+                current = next(job_ids, None)
+            if current != job_id:
+                candidates[job_id] = names
+            if stats["manifest_jobs"] % MANIFEST_PAGE_JOBS == 0:
+                if candidates:
+                    queue_orphans()
+                yield job_id
+        if candidates:
+            queue_orphans()
+        yield None
+
+
+class SweepCheckpoint:
+    """
+    Cursor of an unfinished sweep, kept in a small Firestore document.
+    The cursor is the Storage page token of the next page to process; it is
+    written only after every delete for the previous page has completed,
+    and removed once the listing is exhausted so the next run starts over.
+    """
+
+    def __init__(self, firestore_client, key, restart=False):
+        self._ref = firestore_client.collection(CLEANUP_STATE_COLLECTION).document(key)
+        snapshot = None if restart else self._ref.get()
+        data = snapshot.to_dict() if snapshot and snapshot.exists else {}
+        self.page_token = data.get("page_token")
+        self.sweep_started_at = data.get("sweep_started_at") or datetime.utcnow().isoformat()
+        self.invocation = data.get("invocations", 0) + 1
+        self.totals = data.get("totals", {})
+
+    @property
+    def resumed(self):
+        return self.page_token is not None
+
+    def sweep_totals(self, stats):
+        """Counters for the whole sweep: earlier invocations plus this one."""
+        totals = dict(self.totals)
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def save(self, page_token, stats):
+        self._ref.set({
+            "page_token": page_token,
+            "sweep_started_at": self.sweep_started_at,
+            "invocations": self.invocation,
+            "totals": self.sweep_totals(stats),
+            "updated_at": datetime.utcnow().isoformat(),
+        })
+
+    def clear(self):
+        self._ref.delete()
+
+
+def shard_ranges(count):
+    """
+    Split the job-id keyspace into `count` contiguous [start, end) ranges.
+    Job ids are UUIDs, so boundaries are spread evenly over the first four
+    hex digits; the outer ranges are open so any other id still lands in
+    exactly one shard.
+    """
+    bounds = [None] + [f"{i * 0x10000 // count:04x}" for i in range(1, count)] + [None]
+    return [
+        {"index": i, "count": count, "start": bounds[i], "end": bounds[i + 1]}
+        for i in range(count)
+    ]
+
+
+def checkpoint_key(mode, shard=None, run_id=None):
+    """
+    Firestore id of a sweep's checkpoint. A shard's checkpoint belongs to
+    its coordinator run, so workers of different runs never share one.
+    """
+    key = f"orphaned_files_{mode}"
+    if shard:
+        key += f"_{run_id}_shard{shard['index']}of{shard['count']}"
+    return key
+
+
+def run_sweep(storage_client, firestore_client, mode, shard=None, restart=False, started=None, run_id=None):
+    """
+    Diff Storage against Firestore and delete the orphans, optionally
+    limited to one job-id shard of coordinator run `run_id`. Returns the
+    result dict for the response.
+    """
+    started = started or time.monotonic()
+    bucket = storage_client.bucket(BUCKET_NAME)
+    
+    # Index the job IDs from Firestore (keys only) plus the archived ones,
+    # whose files are kept. The manifest is sorted by job id like the id
+    # streams, so manifest mode merge-joins the merged stream
+    jobs_ref = firestore_client.collection(FIRESTORE_COLLECTION)
+    start, end = shard and shard["start"], shard and shard["end"]
+    archived = archive.ArchivedIds(storage_client.bucket(ARCHIVE_BUCKET))
+    job_ids = heapq.merge(iter_job_ids(jobs_ref, start=start, end=end), archived.stream(start, end))
+    if mode == "manifest":
+        valid_job_ids = job_ids
+    else:
+        with telemetry.span("firestore.job_index", index=JOB_INDEX) as indexing:
+            valid_job_ids = JOB_INDEXES[JOB_INDEX](job_ids)
+            indexing.add(items=len(valid_job_ids))
+    
+    # Resume an unfinished sweep, if the previous run left a cursor
+    checkpoint = SweepCheckpoint(firestore_client, checkpoint_key(mode, shard, run_id), restart=restart)
+    
+    # Find orphans in Storage and feed them to the deletion stage,
+    # one listing page at a time until the listing or the budget runs out
+    deleter = BatchDeleter(storage_client, bucket)
+    scan = {"prefix": _scan_prefixes, "blob": _scan_blobs, "manifest": _scan_manifest}[mode]
+    scan_stats = {}
+    sweep_complete = True
+    
+    pages = scan(bucket, firestore_client, valid_job_ids, deleter,
+                 scan_stats, checkpoint.page_token, shard, archived)
+    try:
+        for next_page_token in pages:
+            deleter.drain()
+            if not next_page_token:
+                break
+            checkpoint.save(next_page_token, {**scan_stats, **deleter.counters()})
+            if time.monotonic() - started > CLEANUP_TIME_BUDGET_SECONDS:
+                sweep_complete = False
+                break
+    finally:
+        pages.close()
+        delete_stats = deleter.close()
+    
+    if sweep_complete:
+        checkpoint.clear()
+    
+    return {
+        "status": "success",
+        "mode": mode,
+        "shard": shard,
+        "valid_jobs": len(valid_job_ids) if mode != "manifest" else None,
+        "job_index": JOB_INDEX if mode != "manifest" else "merge-join",
+        **scan_stats,
+        **delete_stats,
+        "deleted_files": deleter.sample,  # Limit response size
+        "sweep_complete": sweep_complete,
+        "resumed": checkpoint.resumed,
+        "sweep_invocation": checkpoint.invocation,
+        "sweep_started_at": checkpoint.sweep_started_at,
+        "sweep_totals": checkpoint.sweep_totals({**scan_stats, **deleter.counters()}),
+    }
+
 
 @functions_framework.http
 def cleanup_orphaned_files(request):
     """
     HTTP Cloud Function to clean up orphaned audio files.
-    Called by Cloud Scheduler on a schedule.
+    Called by Cloud Scheduler on a schedule. A sweep that does not fit in
+    one invocation is checkpointed and resumed by the next one.
     """
+    started = time.monotonic()
     try:
-        # Initialize clients
-        storage_client = storage.Client()
-        firestore_client = firestore.Client()
+        mode = _request_arg(request, "mode") or CLEANUP_MODE
+        if mode not in CLEANUP_MODES:
+            error_result = {"status": "error", "message": f"Unknown cleanup mode: {mode}"}
+            return json.dumps(error_result), 400, {"Content-Type": "application/json"}
+        
+        with telemetry.invocation("cleanup_orphaned_files", mode=mode):
+            result = run_sweep(
+                get_storage_client(), get_firestore_client(), mode,
+                restart=_request_arg(request, "restart") == "true", started=started,
+            )
         
-        # Get all job IDs from Firestore
-        jobs_ref = firestore_client.collection(FIRESTORE_COLLECTION)
-        valid_job_ids = set()
-        for doc in jobs_ref.stream():
-            valid_job_ids.add(doc.id)
+        print(f"Cleanup completed: {json.dumps(result)}")
+        return json.dumps(result), 200, {"Content-Type": "application/json"}
         
-        # Get all folders in Storage
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blobs = bucket.list_blobs(prefix="audiobooks/")
+    except Exception as e:
+        error_result = {"status": "error", "message": str(e)}
+        print(f"Cleanup error: {str(e)}")
+        return json.dumps(error_result), 500, {"Content-Type": "application/json"}
+
+
+def _aggregate_run(run_ref):
+    """Combine the per-shard results recorded for a coordinator run."""
+    run = run_ref.get().to_dict() or {}
+    shards = {doc.id: doc.to_dict() for doc in run_ref.collection("shards").stream()}
+    done = [s for s in shards.values() if s.get("status") in ("success", "error")]
+    totals = {}
+    for shard_result in done:
+        for key, value in (shard_result.get("sweep_totals") or {}).items():
+            totals[key] = totals.get(key, 0) + value
+    return {
+        "status": "success" if len(done) == run.get("shards", 0) else "running",
+        "run_id": run_ref.id,
+        "mode": run.get("mode"),
+        "shards": run.get("shards", 0),
+        "shards_completed": len(done),
+        "shards_failed": sum(1 for s in done if s.get("status") == "error"),
+        "started_at": run.get("started_at"),
+        **totals,
+    }
+
+
+def _coordinator_run_id(request):
+    """
+    Run id of a coordinator request: derived from the schedule time for
+    Cloud Scheduler calls, so its retries map to the same run, and unique
+    otherwise, even for coordinators started in the same second.
+    """
+    headers = getattr(request, "headers", None) or {}
+    schedule_time = headers.get("X-CloudScheduler-ScheduleTime")
+    if schedule_time:
+        return "scheduled-" + "".join(c for c in schedule_time if c.isalnum())
+    return f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+@functions_framework.http
+def cleanup_coordinator(request):
+    """
+    HTTP Cloud Function that fans a full cleanup out to parallel workers.
+    Splits the job-id keyspace into shards, publishes one message per shard
+    to the shards topic and waits (up to COORDINATOR_WAIT_SECONDS) for the
+    workers to report back. ?run_id= returns the aggregate of an earlier run.
+    Cloud Scheduler retries of one scheduled run carry the same schedule
+    time and join that run instead of starting another.
+    """
+    from google.api_core import exceptions as api_exceptions
+
+    try:
+        firestore_client = get_firestore_client()
+        runs_ref = firestore_client.collection(CLEANUP_RUNS_COLLECTION)
         
-        orphaned_files = []
-        deleted_count = 0
+        run_id = _request_arg(request, "run_id")
+        if run_id:
+            result = _aggregate_run(runs_ref.document(run_id))
+            return json.dumps(result), 200, {"Content-Type": "application/json"}
         
-        for blob in blobs:
-            # Extract job_id from path: audiobooks/{job_id}/filename.wav
-            parts = blob.name.split("/")
-            if len(parts) >= 2:
-                job_id = parts[1]
-                if job_id and job_id not in valid_job_ids:
-                    orphaned_files.append(blob.name)
-                    blob.delete()
-                    deleted_count += 1
+        mode = _request_arg(request, "mode") or CLEANUP_MODE
+        count = int(_request_arg(request, "shards") or CLEANUP_SHARDS)
+        if mode not in CLEANUP_MODES or not 1 <= count <= 256:
+            error_result = {"status": "error", "message": "Invalid mode or shard count"}
+            return json.dumps(error_result), 400, {"Content-Type": "application/json"}
         
-        result = {
-            "status": "success",
-            "valid_jobs": len(valid_job_ids),
-            "orphaned_files_deleted": deleted_count,
-            "deleted_files": orphaned_files[:10]  # Limit response size
-        }
+        run_id = _coordinator_run_id(request)
+        run_ref = runs_ref.document(run_id)
+        try:
+            run_ref.create({"mode": mode, "shards": count, "started_at": datetime.utcnow().isoformat()})
+        except api_exceptions.AlreadyExists:
+            # A retry of a scheduled run: its shards are already out
+            print(f"Cleanup run {run_id} already started, waiting for it")
+        else:
+            # Dispatch one worker invocation per shard
+            publisher = get_publisher()
+            futures = [
+                publisher.publish(CLEANUP_SHARDS_TOPIC, json.dumps({"run_id": run_id, "mode": mode, "shard": shard}).encode())
+                for shard in shard_ranges(count)
+            ]
+            for future in futures:
+                future.result()
         
-        print(f"Cleanup completed: {json.dumps(result)}")
+        # Wait for the workers to report, then aggregate what is there
+        deadline = time.monotonic() + COORDINATOR_WAIT_SECONDS
+        result = _aggregate_run(run_ref)
+        while result["status"] == "running" and time.monotonic() < deadline:
+            time.sleep(COORDINATOR_POLL_SECONDS)
+            result = _aggregate_run(run_ref)
+        
+        print(f"Cleanup coordinator: {json.dumps(result)}")
         return json.dumps(result), 200, {"Content-Type": "application/json"}
         
     except Exception as e:
         error_result = {"status": "error", "message": str(e)}
-        print(f"Cleanup error: {str(e)}")
+        print(f"Cleanup coordinator error: {str(e)}")
+        return json.dumps(error_result), 500, {"Content-Type": "application/json"}
+
+
+@functions_framework.cloud_event
+def cleanup_shard_worker(cloud_event):
+    """
+    Pub/Sub-triggered worker: cleans one shard published by the coordinator.
+    If the shard does not finish within the time budget, the worker
+    republishes its own message and the next invocation resumes from the
+    shard's checkpoint. A worker killed by the timeout never acks, so
+    Pub/Sub redelivers its message and the shard resumes the same way;
+    a redelivery of a shard that already reported is ignored.
+    """
+    started = time.monotonic()
+    data = base64.b64decode(cloud_event.data["message"]["data"])
+    task = json.loads(data)
+    shard = task["shard"]
+    
+    firestore_client = get_firestore_client()
+    shard_ref = (
+        firestore_client.collection(CLEANUP_RUNS_COLLECTION)
+        .document(task["run_id"])
+        .collection("shards")
+        .document(str(shard["index"]))
+    )
+    reported = shard_ref.get()
+    if reported.exists and (reported.to_dict() or {}).get("status") in ("success", "error"):
+        print(f"Cleanup shard {shard['index']} of run {task['run_id']} already reported, skipping")
+        return
+    
+    try:
+        with telemetry.invocation("cleanup_shard_worker", mode=task["mode"], shard=shard["index"]):
+            result = run_sweep(
+                get_storage_client(), firestore_client, task["mode"],
+                shard=shard, started=started, run_id=task["run_id"],
+            )
+    except Exception as e:
+        print(f"Cleanup shard {shard['index']} error: {str(e)}")
+        shard_ref.set({"status": "error", "message": str(e)})
+        return
+    
+    if result["sweep_complete"]:
+        shard_ref.set(result)
+    else:
+        shard_ref.set({**result, "status": "running"})
+        get_publisher().publish(CLEANUP_SHARDS_TOPIC, data).result()
+    
+    print(f"Cleanup shard {shard['index']}/{shard['count']}: {json.dumps(result)}")
+
+
+def purge_job(storage_client, firestore_client, job_id):
+    """
+    Delete every object under audiobooks/{job_id}/, unless the job document
+    exists again. Safe to repeat: objects already gone count as deleted.
+    """
+    if not _confirm_orphans(firestore_client, [job_id]):
+        return {"status": "skipped", "job_id": job_id, "reason": "job exists"}
+    
+    bucket = storage_client.bucket(BUCKET_NAME)
+    deleter = BatchDeleter(storage_client, bucket)
+    try:
+        with telemetry.span("storage.list", mode="job") as listing:
+            prefix = f"{AUDIOBOOKS_PREFIX}{job_id}/"
+            for blob in listing.iterate(bucket.list_blobs(prefix=prefix, fields="items(name),nextPageToken")):
+                listing.add(items=1)
+                deleter.add(blob.name)
+    finally:
+        delete_stats = deleter.close()
+    return {"status": "success", "job_id": job_id, **delete_stats}
+
+
+@functions_framework.cloud_event
+@telemetry.traced("on_job_deleted")
+def on_job_deleted(cloud_event):
+    """
+    Triggered when an audiobook_jobs document is deleted: purges the job's
+    files right away, so the scheduled sweep only has to catch what this
+    misses (failed deliveries, files uploaded after the delete).
+    """
+    event = job_events.JobEvent(cloud_event)
+    
+    # Without a job id the prefix would cover every job
+    if event.exists or not event.job_id:
+        print(f"Ignoring event {event.id}: not a job deletion")
+        return
+    # Archived jobs keep their files
+    if event.old(archive.ARCHIVED_FIELD):
+        print(f"Ignoring event {event.id}: job {event.job_id} was archived")
+        return
+    
+    result = purge_job(get_storage_client(), get_firestore_client(), event.job_id)
+    print(f"Job purge: {json.dumps(result)}")
+
+
+@functions_framework.cloud_event
+@telemetry.traced("on_object_changed")
+def on_object_changed(cloud_event):
+    """
+    Triggered by Storage object finalize and delete events: records the
+    object's new state as a manifest delta (objects outside audiobooks/
+    are ignored).
+    """
+    deleted = cloud_event["type"] == "google.cloud.storage.object.v1.deleted"
+    with telemetry.span("manifest.record") as recording:
+        recorded = manifest.record_event(get_firestore_client(), cloud_event.data, deleted)
+        recording.add(items=int(recorded))
+
+
+@functions_framework.http
+@telemetry.traced("compact_manifest")
+def compact_manifest(request):
+    """
+    HTTP Cloud Function, called by Cloud Scheduler: merges the pending
+    manifest deltas into a new segment and refreshes the storage summary.
+    ?rebuild=true starts over from a bucket listing.
+    """
+    try:
+        storage_client = get_storage_client()
+        summary = manifest.compact(
+            storage_client.bucket(BUCKET_NAME), get_firestore_client(), FIRESTORE_COLLECTION,
+            rebuild=_request_arg(request, "rebuild") == "true",
+            archived_ids=archive.ArchivedIds(storage_client.bucket(ARCHIVE_BUCKET)).stream(),
+        )
+        result = {"status": "success", **summary}
+        print(f"Manifest compacted: {json.dumps(result)}")
+        return json.dumps(result), 200, {"Content-Type": "application/json"}
+        
+    except Exception as e:
+        error_result = {"status": "error", "message": str(e)}
+        print(f"Manifest compaction error: {str(e)}")
+        return json.dumps(error_result), 500, {"Content-Type": "application/json"}
+
+
+@functions_framework.http
+@telemetry.traced("archive_finished_jobs")
+def archive_finished_jobs(request):
+    """
+    HTTP Cloud Function, called by Cloud Scheduler: moves completed and
+    failed jobs older than ARCHIVE_AFTER_DAYS (?days= overrides) out of
+    Firestore into date-partitioned segments in the bucket, at most
+    ARCHIVE_MAX_JOBS per run. Their files are kept.
+    """
+    try:
+        days = float(_request_arg(request, "days") or ARCHIVE_AFTER_DAYS)
+        with telemetry.span("archive.run") as archiving:
+            result = archive.archive_finished(
+                get_firestore_client(), get_storage_client().bucket(ARCHIVE_BUCKET), FIRESTORE_COLLECTION,
+                older_than=timedelta(days=days), limit=ARCHIVE_MAX_JOBS,
+            )
+            archiving.add(items=result["archived"])
+        result = {"status": "success", "older_than_days": days, **result}
+        print(f"Jobs archived: {json.dumps(result)}")
+        return json.dumps(result), 200, {"Content-Type": "application/json"}
+        
+    except Exception as e:
+        error_result = {"status": "error", "message": str(e)}
+        print(f"Job archival error: {str(e)}")
         return json.dumps(error_result), 500, {"Content-Type": "application/json"}
 
 
@@ -66,8 +924,6 @@ def cleanup_on_schedule(cloud_event):
     """
     Cloud Event handler for Pub/Sub trigger from Cloud Scheduler.
     """
-    import base64
-    
     # Decode message if present
     if cloud_event.data and "message" in cloud_event.data:
         message = cloud_event.data["message"]
@@ -0,0 +1,128 @@
+"""
+Processing-latency and throughput analytics for get_stats.
+
+Completed jobs are grouped into hourly windows by completion time. Each
+window keeps a t-digest of processing times (completed - created) and its
+completion count. Once a window is closed it is persisted, so later calls
+only read jobs completed after the last persisted window and merge the
+stored sketches for everything older.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+from job_times import JOB_COMPLETED_FIELD, JOB_CREATED_FIELD, as_datetime, query_value
+from sketches import TDigest
+
+FIRESTORE_COLLECTION = os.environ.get("FIRESTORE_COLLECTION", "audiobook_jobs")
+WINDOWS_COLLECTION = os.environ.get("LATENCY_WINDOWS_COLLECTION", "stats_latency_windows")
+
+# Window covered by the quantiles, and how long a closed window waits for
+# late writes before it is persisted
+LOOKBACK_HOURS = int(os.environ.get("LATENCY_LOOKBACK_HOURS", "168"))
+WINDOW = timedelta(hours=1)
+PERSIST_GRACE = timedelta(minutes=5)
+
+
+def _window_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _window_id(start):
+    return start.strftime("%Y%m%d%H")
+
+
+def _load_windows(db, since):
+    """Persisted windows starting at or after `since`, keyed by start time."""
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = db.collection(WINDOWS_COLLECTION).where(filter=FieldFilter("start", ">=", since))
+    windows = {}
+    for doc in query.stream():
+        data = doc.to_dict()
+        windows[as_datetime(data["start"])] = (TDigest.from_dict(data["digest"]), data["completions"])
+    return windows
+
+
+def _scan_completions(db, since, until):
+    """One pass over jobs completed in [since, until), bucketed per hour."""
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = (
+        db.collection(FIRESTORE_COLLECTION)
+        .where(filter=FieldFilter(JOB_COMPLETED_FIELD, ">=", query_value(since)))
+        .where(filter=FieldFilter(JOB_COMPLETED_FIELD, "<", query_value(until)))
+        .select(["status", JOB_CREATED_FIELD, JOB_COMPLETED_FIELD])
+    )
+    windows = {}
+    for doc in query.stream():
+        data = doc.to_dict()
+        if data.get("status") != "completed":
+            continue
+        created = as_datetime(data.get(JOB_CREATED_FIELD))
+        completed = as_datetime(data.get(JOB_COMPLETED_FIELD))
+        if not created or not completed:
+            continue
+        digest, completions = windows.get(_window_start(completed), (None, 0))
+        digest = digest or TDigest()
+        digest.add(max(0.0, (completed - created).total_seconds()))
+        windows[_window_start(completed)] = (digest, completions + 1)
+    return windows
+
+
+def processing_analytics(db, now=None):
+    """
+    Processing-time quantiles over the lookback period and completions per
+    hour for the last 24 hours. Persists any newly closed hourly windows.
+    """
+    now = now or datetime.now(timezone.utc)
+    lookback_start = _window_start(now) - timedelta(hours=LOOKBACK_HOURS - 1)
+    persist_until = _window_start(now - PERSIST_GRACE)
+
+    windows = _load_windows(db, lookback_start)
+    scan_from = max(windows) + WINDOW if windows else lookback_start
+    fresh = _scan_completions(db, scan_from, now)
+
+    # Persist closed windows that are past the grace period, empty ones too,
+    # so the next call does not rescan them
+    batch, pending = db.batch(), 0
+    start = scan_from
+    while start + WINDOW <= persist_until:
+        digest, completions = fresh.get(start, (TDigest(), 0))
+        batch.set(db.collection(WINDOWS_COLLECTION).document(_window_id(start)), {
+            "start": start,
+            "digest": digest.to_dict(),
+            "completions": completions,
+            "expire_at": start + timedelta(hours=LOOKBACK_HOURS + 24),
+        })
+        pending += 1
+        if pending == 400:
+            batch.commit()
+            batch, pending = db.batch(), 0
+        start += WINDOW
+    if pending:
+        batch.commit()
+
+    windows.update(fresh)
+    merged = TDigest()
+    for digest, _ in windows.values():
+        merged.merge(digest)
+
+    hourly = []
+    for hours_ago in range(23, -1, -1):
+        start = _window_start(now) - timedelta(hours=hours_ago)
+        hourly.append({"hour": start.isoformat(), "completions": windows.get(start, (None, 0))[1]})
+
+    return {
+        "processing_time_seconds": {
+            "window_hours": LOOKBACK_HOURS,
+            "count": merged.count,
+            "p50": merged.quantile(0.50),
+            "p95": merged.quantile(0.95),
+            "p99": merged.quantile(0.99),
+        },
+        "throughput": {
+            "completions_last_hour": hourly[-1]["completions"],
+            "completions_last_24h": sum(h["completions"] for h in hourly),
+            "completions_per_hour": hourly,
+        },
+    }
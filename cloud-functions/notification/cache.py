@@ -0,0 +1,128 @@
+"""
+In-process response cache for the HTTP stats endpoints.
+Entries live on the function instance and are shared by every request it
+serves. Each entry carries an ETag so clients can revalidate with
+If-None-Match without the function touching Firestore.
+
+The ETag covers the body without its generation time (VOLATILE_FIELDS), so
+a recomputed body with the same data keeps its ETag and a client holding it
+still gets a 304 after the entry expires.
+"""
+import hashlib
+import json
+import threading
+import time
+
+VOLATILE_FIELDS = ("timestamp",)
+
+
+def etag_of(body):
+    """ETag of a JSON body, ignoring top-level VOLATILE_FIELDS."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if isinstance(payload, dict):
+        stable = {key: value for key, value in payload.items() if key not in VOLATILE_FIELDS}
+        body = json.dumps(stable, sort_keys=True, separators=(",", ":"))
+    return '"' + hashlib.sha1(body.encode()).hexdigest()[:20] + '"'
+
+
+class ResponseCache:
+    """
+    TTL cache of serialized responses keyed by request shape.
+
+    Within `ttl` seconds an entry is served as is. For a further `stale`
+    seconds it is still served, and a background thread recomputes it
+    (stale-while-revalidate); after that the next request recomputes it
+    inline. Note that Cloud Functions throttle CPU outside of requests
+    unless CPU is always allocated, so a background refresh may only
+    finish during the next request.
+    """
+
+    def __init__(self, ttl, stale=0.0):
+        self.ttl = ttl
+        self.stale = stale
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """
+        Return (body, etag, age, state) for a servable entry, or None.
+        state is "HIT" for a fresh entry and "STALE" for one being refreshed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            body, etag, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age <= self.ttl:
+                self.hits += 1
+                return body, etag, age, "HIT"
+            if age <= self.ttl + self.stale:
+                self.stale_hits += 1
+                return body, etag, age, "STALE"
+            return None
+
+    def store(self, key, body):
+        etag = etag_of(body)
+        with self._lock:
+            self._entries[key] = (body, etag, time.monotonic())
+        return etag
+
+    def refresh_async(self, key, compute):
+        """Recompute an entry in the background, at most once at a time per key."""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.store(key, compute())
+            except Exception as e:
+                print(f"Cache refresh failed for {key!r}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def counters(self):
+        return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses}
+
+    def serve(self, request, key, compute):
+        """
+        Answer a request from the cache, computing the body on a miss.
+        compute() must return the JSON response body as a string.
+        Returns a (body, status, headers) tuple for functions_framework.
+        """
+        cached = self.lookup(key)
+        if cached is None:
+            with self._lock:
+                self.misses += 1
+            body = compute()
+            etag, age, state = self.store(key, body), 0.0, "MISS"
+        else:
+            body, etag, age, state = cached
+            if state == "STALE":
+                self.refresh_async(key, compute)
+
+        headers = {
+            "Content-Type": "application/json",
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={max(0, int(self.ttl - age))}, "
+                             f"stale-while-revalidate={int(self.stale)}",
+            "X-Cache": state,
+        }
+        print(json.dumps({"message": "stats cache", "key": key, "result": state, **self.counters()}))
+
+        if_none_match = getattr(request, "headers", {}).get("If-None-Match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return "", 304, headers
+        return body, 200, headers
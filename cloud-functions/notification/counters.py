@@ -0,0 +1,134 @@
+"""
+Sharded status counters for audiobook_jobs.
+Maintained by on_job_completed on every status transition so get_stats can
+answer from a handful of small documents instead of querying the jobs.
+
+Each transition increments one randomly chosen shard document, so busy
+statuses are spread over STATS_COUNTER_SHARDS documents instead of hitting
+the per-document write limit. Firestore triggers are delivered at least
+once, so every event id is recorded in the same transaction and replays
+are ignored.
+
+The shards only hold the deltas applied since the last rebuild, so they
+are not read until a rebuild has written the BUILT_MARKER document.
+Rebuild the counters from a full scan to build them, or to correct drift:
+    python counters.py rebuild
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+FIRESTORE_COLLECTION = os.environ.get("FIRESTORE_COLLECTION", "audiobook_jobs")
+COUNTERS_COLLECTION = os.environ.get("STATS_COUNTERS_COLLECTION", "stats_counters")
+COUNTER_SHARDS = int(os.environ.get("STATS_COUNTER_SHARDS", "10"))
+BUILT_MARKER = "built"
+
+# Processed event ids; a TTL policy on expire_at removes them after a while
+PROCESSED_EVENTS_COLLECTION = os.environ.get("PROCESSED_EVENTS_COLLECTION", "stats_processed_events")
+PROCESSED_EVENT_TTL = timedelta(days=7)
+
+
+def _shard_refs(db):
+    counters_ref = db.collection(COUNTERS_COLLECTION)
+    return [counters_ref.document(f"shard-{i}") for i in range(COUNTER_SHARDS)]
+
+
+def transition_deltas(old_status, new_status, existed, exists):
+    """Counter changes implied by one document write."""
+    deltas = {}
+    if existed != exists:
+        deltas["total_jobs"] = 1 if exists else -1
+    if existed and old_status and (old_status != new_status or not exists):
+        deltas[old_status] = deltas.get(old_status, 0) - 1
+    if exists and new_status and (old_status != new_status or not existed):
+        deltas[new_status] = deltas.get(new_status, 0) + 1
+    return deltas
+
+
+def apply_transition(db, event_id, old_status, new_status, existed, exists):
+    """
+    Apply one job write to the counters, at most once per event id.
+    Returns False when the write does not move any counter or the event
+    was already applied.
+    """
+    deltas = transition_deltas(old_status, new_status, existed, exists)
+    if not deltas:
+        return False
+
+    from google.cloud import firestore
+
+    marker_ref = db.collection(PROCESSED_EVENTS_COLLECTION).document(event_id)
+    shard_ref = random.choice(_shard_refs(db))
+    # A merge replaces a map it is given whole, so an empty statuses map
+    # would wipe the shard's counts: only send the statuses that move
+    update = {}
+    for key, delta in deltas.items():
+        if key == "total_jobs":
+            update["total_jobs"] = firestore.Increment(delta)
+        else:
+            update.setdefault("statuses", {})[key] = firestore.Increment(delta)
+
+    @firestore.transactional
+    def apply(transaction):
+        if marker_ref.get(transaction=transaction).exists:
+            return False
+        transaction.create(marker_ref, {
+            "expire_at": datetime.now(timezone.utc) + PROCESSED_EVENT_TTL,
+        })
+        transaction.set(shard_ref, update, merge=True)
+        return True
+
+    return apply(db.transaction())
+
+
+def read_counters(db):
+    """
+    Sum all counter shards into {"total_jobs": n, "statuses": {...}}.
+    Returns None if the counters have never been built.
+    """
+    marker_ref = db.collection(COUNTERS_COLLECTION).document(BUILT_MARKER)
+    snapshots = list(db.get_all([marker_ref] + _shard_refs(db)))
+    if not any(s.exists and s.id == BUILT_MARKER for s in snapshots):
+        return None
+    snapshots = [s for s in snapshots if s.exists and s.id != BUILT_MARKER]
+    totals = {"total_jobs": 0, "statuses": {}}
+    for snapshot in snapshots:
+        data = snapshot.to_dict()
+        totals["total_jobs"] += data.get("total_jobs", 0)
+        for status, count in (data.get("statuses") or {}).items():
+            totals["statuses"][status] = totals["statuses"].get(status, 0) + count
+    return totals
+
+
+def rebuild(db):
+    """
+    Recompute the counters from a full scan of the jobs collection.
+    The totals go to shard 0 and every other shard is reset. Transitions
+    that land while the scan runs may be counted twice or not at all, so
+    run this when the job rate is low.
+    """
+    totals = {"total_jobs": 0, "statuses": {}}
+    for doc in db.collection(FIRESTORE_COLLECTION).select(["status"]).stream():
+        totals["total_jobs"] += 1
+        status = (doc.to_dict() or {}).get("status")
+        if status:
+            totals["statuses"][status] = totals["statuses"].get(status, 0) + 1
+
+    batch = db.batch()
+    for i, shard_ref in enumerate(_shard_refs(db)):
+        batch.set(shard_ref, totals if i == 0 else {"total_jobs": 0, "statuses": {}})
+    batch.set(db.collection(COUNTERS_COLLECTION).document(BUILT_MARKER), {
+        "built_at": datetime.now(timezone.utc),
+        "shards": COUNTER_SHARDS,
+    })
+    batch.commit()
+    return totals
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python counters.py rebuild")
+    from google.cloud import firestore
+
+    print(rebuild(firestore.Client()))
@@ -0,0 +1,149 @@
+"""
+Webhook delivery for job notifications.
+
+A WebhookDispatcher owns an asyncio event loop on a background thread and
+one aiohttp session whose keep-alive connection pool is reused by every
+invocation served by the instance. Each endpoint gets its own concurrency
+limit, failed attempts are retried with jittered exponential backoff, and
+deliveries are remembered by (event id, endpoint) so a redelivered
+CloudEvent is not sent twice.
+"""
+import aiohttp
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+WEBHOOK_URLS = [url.strip() for url in os.environ.get("WEBHOOK_URLS", "").split(",") if url.strip()]
+WEBHOOK_CONCURRENCY = int(os.environ.get("WEBHOOK_CONCURRENCY_PER_ENDPOINT", "8"))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.environ.get("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_BACKOFF_SECONDS = float(os.environ.get("WEBHOOK_BACKOFF_SECONDS", "0.5"))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.environ.get("WEBHOOK_BACKOFF_MAX_SECONDS", "8"))
+
+# Delivered (event id, endpoint) pairs remembered per instance
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("WEBHOOK_IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class WebhookDispatcher:
+    """Delivers JSON payloads to webhook endpoints from a shared event loop."""
+
+    def __init__(self, urls, concurrency=WEBHOOK_CONCURRENCY, max_attempts=WEBHOOK_MAX_ATTEMPTS,
+                 timeout=WEBHOOK_TIMEOUT_SECONDS, backoff=WEBHOOK_BACKOFF_SECONDS,
+                 backoff_max=WEBHOOK_BACKOFF_MAX_SECONDS, cache_size=IDEMPOTENCY_CACHE_SIZE):
+        self.urls = list(urls)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.cache_size = cache_size
+        self._loop = None
+        self._session = None
+        self._limits = {}
+        self._delivered = OrderedDict()
+        self._in_flight = {}
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="webhook-delivery", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def submit(self, payload, event_id, urls=None):
+        """
+        Schedule delivery of `payload` to every endpoint.
+        Returns a concurrent.futures.Future resolving to one result per endpoint.
+        """
+        coroutine = self._deliver_all(payload, event_id, urls or self.urls)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    def deliver(self, payload, event_id, urls=None):
+        """Deliver and block until every endpoint has succeeded or given up."""
+        budget = self.max_attempts * (self.timeout + self.backoff_max)
+        return self.submit(payload, event_id, urls).result(timeout=budget)
+
+    def close(self):
+        """Close the shared session and stop the loop (benchmarks and local runs)."""
+        if self._loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+            self._session = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+    async def _deliver_all(self, payload, event_id, urls):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        body = json.dumps(payload).encode()
+        return await asyncio.gather(*(self._deliver_once(url, body, event_id) for url in urls))
+
+    async def _deliver_once(self, url, body, event_id):
+        """Deliver to one endpoint unless this event id already went there."""
+        key = (event_id, url)
+        if key in self._delivered:
+            self._delivered.move_to_end(key)
+            return {**self._delivered[key], "duplicate": True}
+        if key in self._in_flight:
+            result = await asyncio.shield(self._in_flight[key])
+            return {**result, "duplicate": True}
+
+        task = asyncio.ensure_future(self._post_with_retries(url, body, event_id))
+        self._in_flight[key] = task
+        try:
+            result = await task
+        finally:
+            del self._in_flight[key]
+        if result["delivered"]:
+            self._delivered[key] = result
+            while len(self._delivered) > self.cache_size:
+                self._delivered.popitem(last=False)
+        return result
+
+    async def _post_with_retries(self, url, body, event_id):
+        limit = self._limits.setdefault(url, asyncio.Semaphore(self.concurrency))
+        headers = {"Content-Type": "application/json", "Idempotency-Key": event_id}
+        started = time.perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            status, error = None, None
+            try:
+                async with limit:
+                    async with self._session.post(url, data=body, headers=headers) as response:
+                        status = response.status
+                        await response.read()
+                if status < 300 or status not in RETRYABLE_STATUS_CODES:
+                    break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+            if attempt < self.max_attempts:
+                # Full jitter: spreads retries from many events over time
+                cap = min(self.backoff_max, self.backoff * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, cap))
+        delivered = status is not None and status < 300
+        if not delivered and error is None:
+            error = f"HTTP {status}"
+        return {
+            "url": url,
+            "delivered": delivered,
+            "status": status,
+            "attempts": attempt,
+            "error": error,
+            "duplicate": False,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+
+# Shared by every invocation on this instance
+dispatcher = WebhookDispatcher(WEBHOOK_URLS)
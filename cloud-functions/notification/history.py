@@ -0,0 +1,215 @@
+"""
+Daily stats snapshots as fixed-width binary records in the archive bucket.
+
+Each run of the daily stats report appends one RECORD_SIZE-byte record
+(status counts, archived jobs, bytes stored, processing-time percentiles
+and completions) to the segment of its UTC year,
+stats/history/v1/<year>.bin. Record n of a segment is day n of the year,
+and days without a snapshot are zero-filled, so the records of any date
+range are one contiguous byte range: a history query costs one ranged
+GET per calendar year it spans, and never reads Firestore.
+
+GCS objects are immutable, so appending uploads the new record(s) and
+composes them onto the segment, pinned to the generation that was read.
+A day that already has a record is left as it is.
+"""
+import math
+import struct
+from datetime import date, datetime, timedelta, timezone
+
+SEGMENT_PREFIX = "stats/history/v1/"
+
+# present flag, snapshot time (Unix s), total, completed, processing, failed,
+# pending, archived jobs, bytes stored, objects stored, processing-time
+# count, p50, p95, p99 (s), completions in the last 24h
+RECORD = struct.Struct("<B3xI6IQI I3f I")
+RECORD_SIZE = RECORD.size
+EMPTY_RECORD = bytes(RECORD_SIZE)
+
+COUNTS = ("total_jobs", "completed", "processing", "failed", "pending", "archived")
+ROLLUPS = ("daily", "weekly", "monthly")
+MAX_DAYS = 3660
+
+
+class HistoryError(ValueError):
+    """Invalid history query arguments; reported as a 400."""
+
+
+def segment_name(year):
+    return f"{SEGMENT_PREFIX}{year}.bin"
+
+
+def _day_index(day):
+    return (day - date(day.year, 1, 1)).days
+
+
+def _float(value):
+    return float(value) if value is not None else math.nan
+
+
+def _optional(value):
+    return None if math.isnan(value) else round(value, 3)
+
+
+def _count(value):
+    # Drifted counters can go below zero, which the unsigned fields cannot hold
+    return max(int(value or 0), 0)
+
+
+def encode(stats, taken_at):
+    """The record of a compute_stats() result taken at `taken_at`."""
+    processing = stats.get("processing_time_seconds") or {}
+    storage = stats.get("storage") or {}
+    return RECORD.pack(
+        1,
+        int(taken_at.timestamp()),
+        _count(stats.get("total_jobs")),
+        _count(stats.get("completed")),
+        _count(stats.get("processing")),
+        _count(stats.get("failed")),
+        _count(stats.get("pending")),
+        _count((stats.get("archived") or {}).get("jobs")),
+        _count(storage.get("bytes")),
+        _count(storage.get("objects")),
+        _count(processing.get("count")),
+        _float(processing.get("p50")),
+        _float(processing.get("p95")),
+        _float(processing.get("p99")),
+        _count((stats.get("throughput") or {}).get("completions_last_24h")),
+    )
+
+
+def decode(record, day):
+    """Snapshot dict of a record, or None for a day without one."""
+    (present, taken_at, *counts, stored_bytes, objects,
+     latency_count, p50, p95, p99, completions) = RECORD.unpack(record)
+    if not present:
+        return None
+    return {
+        "date": day.isoformat(),
+        "taken_at": datetime.fromtimestamp(taken_at, timezone.utc).isoformat(),
+        **dict(zip(COUNTS, counts)),
+        "bytes": stored_bytes,
+        "objects": objects,
+        "processing_time_seconds": {
+            "count": latency_count, "p50": _optional(p50), "p95": _optional(p95), "p99": _optional(p99),
+        },
+        "completions": completions,
+    }
+
+
+def append(bucket, stats, taken_at=None):
+    """Record today's snapshot; False if the day already has one."""
+    taken_at = taken_at or datetime.now(timezone.utc)
+    day = taken_at.date()
+    name = segment_name(day.year)
+    segment = bucket.get_blob(name)
+    size = segment.size if segment is not None else 0
+    if size % RECORD_SIZE:
+        raise ValueError(f"{name} is {size} bytes, not a whole number of {RECORD_SIZE}-byte records")
+
+    index = _day_index(day)
+    if size // RECORD_SIZE > index:
+        return False
+    data = EMPTY_RECORD * (index - size // RECORD_SIZE) + encode(stats, taken_at)
+
+    if segment is None:
+        bucket.blob(name).upload_from_string(data, content_type="application/octet-stream", if_generation_match=0)
+        return True
+    tail = bucket.blob(f"{name}.append-{taken_at:%Y%m%dT%H%M%S%f}")
+    tail.upload_from_string(data, content_type="application/octet-stream")
+    try:
+        # A concurrent append fails here; the scheduler's retry then finds today's record
+        bucket.blob(name).compose([segment, tail], if_generation_match=segment.generation)
+    finally:
+        tail.delete()
+    return True
+
+
+def read(bucket, start, end):
+    """Snapshots from `start` to `end` (dates, inclusive), oldest first."""
+    from google.api_core import exceptions as api_exceptions
+
+    snapshots = []
+    for year in range(start.year, end.year + 1):
+        first = max(start, date(year, 1, 1))
+        last = min(end, date(year, 12, 31))
+        offset = _day_index(first) * RECORD_SIZE
+        length = ((last - first).days + 1) * RECORD_SIZE
+        try:
+            data = bucket.blob(segment_name(year)).download_as_bytes(
+                start=offset, end=offset + length - 1, checksum=None,
+            )
+        except (api_exceptions.NotFound, api_exceptions.RequestRangeNotSatisfiable):
+            continue  # No segment for that year, or no records that late yet
+        for i in range(len(data) // RECORD_SIZE):
+            snapshot = decode(data[i * RECORD_SIZE:(i + 1) * RECORD_SIZE], first + timedelta(days=i))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+    return snapshots
+
+
+def _period_start(day, period):
+    if period == "weekly":
+        return day - timedelta(days=day.weekday())  # ISO weeks, from Monday
+    if period == "monthly":
+        return day.replace(day=1)
+    return day
+
+
+def rollup(snapshots, period):
+    """
+    One point per day, ISO week or month. Counts and storage are the last
+    snapshot of the period, completions are summed, and processing times
+    are the count-weighted mean of the daily percentiles (max for p99).
+    """
+    if period == "daily":
+        return snapshots
+    periods = {}
+    for snapshot in snapshots:
+        start = _period_start(date.fromisoformat(snapshot["date"]), period)
+        periods.setdefault(start, []).append(snapshot)
+
+    points = []
+    for start, group in sorted(periods.items()):
+        last = group[-1]
+        timed = [s["processing_time_seconds"] for s in group]
+
+        def mean(key):
+            known = [t for t in timed if t[key] is not None and t["count"]]
+            weight = sum(t["count"] for t in known)
+            return round(sum(t[key] * t["count"] for t in known) / weight, 3) if weight else None
+
+        points.append({
+            "period_start": start.isoformat(),
+            "days": len(group),
+            "last_date": last["date"],
+            **{key: last[key] for key in COUNTS},
+            "bytes": last["bytes"],
+            "objects": last["objects"],
+            "processing_time_seconds": {
+                "count": sum(t["count"] for t in timed),
+                "p50": mean("p50"),
+                "p95": mean("p95"),
+                "p99": max((t["p99"] for t in timed if t["p99"] is not None), default=None),
+            },
+            "completions": sum(s["completions"] for s in group),
+        })
+    return points
+
+
+def parse(args):
+    """(start, end, rollup) from the request arguments."""
+    try:
+        end = date.fromisoformat(args["to"]) if args.get("to") else datetime.now(timezone.utc).date()
+        start = date.fromisoformat(args["from"]) if args.get("from") else end - timedelta(days=29)
+    except ValueError:
+        raise HistoryError("from and to must be dates (YYYY-MM-DD)")
+    if start > end:
+        raise HistoryError("from must not be after to")
+    if (end - start).days >= MAX_DAYS:
+        raise HistoryError(f"range too long (max {MAX_DAYS} days)")
+    period = args.get("rollup") or "daily"
+    if period not in ROLLUPS:
+        raise HistoryError(f"rollup must be one of {', '.join(ROLLUPS)}")
+    return start, end, period
@@ -0,0 +1,177 @@
+"""
+Job lifecycle events on Pub/Sub.
+
+Every status transition of an audiobook_jobs document (including creates
+and deletes) is published to JOB_EVENTS_TOPIC as a JobLifecycleEvent,
+serialized with the protobuf schema of job_lifecycle.proto, so consumers
+can follow jobs without polling Firestore.
+
+One PublisherClient per instance batches the events of concurrent
+invocations: a batch is sent when it holds JOB_EVENTS_BATCH_MAX_MESSAGES
+messages or JOB_EVENTS_BATCH_MAX_BYTES bytes, or JOB_EVENTS_BATCH_MAX_LATENCY_SECONDS
+after its first message. Each invocation waits for its own message to be
+acknowledged, so the latency setting is also the most a transition can be
+delayed. Messages carry the job id as ordering key, so a subscription with
+message ordering enabled receives the transitions of each job in order.
+Delivery is at least once: a retried CloudEvent is published again with
+the same event_id.
+"""
+import os
+import re
+import threading
+from datetime import datetime, timezone
+
+import proto
+
+JOB_EVENTS_TOPIC = os.environ.get("JOB_EVENTS_TOPIC", "")
+JOB_EVENTS_BATCH_MAX_MESSAGES = int(os.environ.get("JOB_EVENTS_BATCH_MAX_MESSAGES", "100"))
+JOB_EVENTS_BATCH_MAX_BYTES = int(os.environ.get("JOB_EVENTS_BATCH_MAX_BYTES", "1000000"))
+JOB_EVENTS_BATCH_MAX_LATENCY_SECONDS = float(os.environ.get("JOB_EVENTS_BATCH_MAX_LATENCY_SECONDS", "0.025"))
+JOB_EVENTS_PUBLISH_TIMEOUT_SECONDS = float(os.environ.get("JOB_EVENTS_PUBLISH_TIMEOUT_SECONDS", "30"))
+# Messages waiting to be sent per instance before publish() blocks
+JOB_EVENTS_MAX_OUTSTANDING = int(os.environ.get("JOB_EVENTS_MAX_OUTSTANDING", "1000"))
+
+__protobuf__ = proto.module(package="fognode.jobs.v1")
+
+
+# Same message as job_lifecycle.proto, enums nested like there
+class JobLifecycleEvent(proto.Message):
+    class JobStatus(proto.Enum):
+        JOB_STATUS_UNSPECIFIED = 0
+        PENDING = 1
+        PROCESSING = 2
+        COMPLETED = 3
+        FAILED = 4
+        OTHER = 5
+
+    class Change(proto.Enum):
+        CHANGE_UNSPECIFIED = 0
+        CREATED = 1
+        UPDATED = 2
+        DELETED = 3
+
+    event_id = proto.Field(proto.STRING, number=1)
+    job_id = proto.Field(proto.STRING, number=2)
+    old_status = proto.Field(JobStatus, number=3)
+    new_status = proto.Field(JobStatus, number=4)
+    change = proto.Field(Change, number=5)
+    event_time_micros = proto.Field(proto.INT64, number=6)
+    filename = proto.Field(proto.STRING, number=7)
+
+
+JobStatus = JobLifecycleEvent.JobStatus
+Change = JobLifecycleEvent.Change
+
+
+def _status(value):
+    if value is None:
+        return JobStatus.JOB_STATUS_UNSPECIFIED
+    return JobStatus.__members__.get(str(value).upper(), JobStatus.OTHER)
+
+
+def _micros(value):
+    """CloudEvent time (RFC 3339, up to nanoseconds) -> Unix microseconds."""
+    if value:
+        # fromisoformat takes at most 6 fractional digits
+        value = re.sub(r"(\.\d{6})\d+", r"\1", value).replace("Z", "+00:00")
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            moment = None
+        if moment is not None:
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            return int(moment.timestamp() * 1_000_000)
+    return int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+
+
+def transition(event, event_time=None):
+    """
+    The JobLifecycleEvent of a job_events.JobEvent, or None when the write
+    left the status unchanged (progress updates and the like).
+    """
+    old_status, new_status = event.old("status"), event.new("status")
+    if old_status == new_status and event.existed == event.exists:
+        return None
+    if not event.existed:
+        change = Change.CREATED
+    elif not event.exists:
+        change = Change.DELETED
+    else:
+        change = Change.UPDATED
+    return JobLifecycleEvent(
+        event_id=event.id,
+        job_id=event.job_id or "",
+        old_status=_status(old_status),
+        new_status=_status(new_status),
+        change=change,
+        event_time_micros=_micros(event_time),
+        filename=event.new("filename") or event.old("filename") or "",
+    )
+
+
+def attributes(message):
+    """Message attributes, for subscription filters such as attributes.new_status = "FAILED"."""
+    return {
+        "change": Change(message.change).name,
+        "new_status": JobStatus(message.new_status).name,
+        "old_status": JobStatus(message.old_status).name,
+    }
+
+
+class LifecyclePublisher:
+    """Batching, ordered publisher of JobLifecycleEvents to one topic."""
+
+    def __init__(self, topic, max_messages=JOB_EVENTS_BATCH_MAX_MESSAGES, max_bytes=JOB_EVENTS_BATCH_MAX_BYTES,
+                 max_latency=JOB_EVENTS_BATCH_MAX_LATENCY_SECONDS, timeout=JOB_EVENTS_PUBLISH_TIMEOUT_SECONDS,
+                 max_outstanding=JOB_EVENTS_MAX_OUTSTANDING):
+        self.topic = topic
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.timeout = timeout
+        self.max_outstanding = max_outstanding
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from google.cloud import pubsub_v1
+
+                self._client = pubsub_v1.PublisherClient(
+                    batch_settings=pubsub_v1.types.BatchSettings(
+                        max_messages=self.max_messages,
+                        max_bytes=self.max_bytes,
+                        max_latency=self.max_latency,
+                    ),
+                    publisher_options=pubsub_v1.types.PublisherOptions(
+                        enable_message_ordering=True,
+                        flow_control=pubsub_v1.types.PublishFlowControl(
+                            message_limit=self.max_outstanding,
+                            limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.BLOCK,
+                        ),
+                    ),
+                )
+        return self._client
+
+    def submit(self, message):
+        """Queue `message` in the current batch; returns the publish future."""
+        data = JobLifecycleEvent.serialize(message)
+        return self.client().publish(self.topic, data, ordering_key=message.job_id, **attributes(message))
+
+    def wait(self, future, message):
+        """Message id once the publish is acknowledged."""
+        try:
+            return future.result(timeout=self.timeout)
+        except Exception:
+            # A failed publish pauses its ordering key; let the retried event through
+            self.client().resume_publish(self.topic, message.job_id)
+            raise
+
+    def publish(self, message):
+        return self.wait(self.submit(message), message)
+
+
+# Shared by every invocation on this instance
+publisher = LifecyclePublisher(JOB_EVENTS_TOPIC)
@@ -4,39 +4,120 @@ Triggered by Firestore when a job status changes to 'completed'.
 Can send notifications via email, webhook, or log for monitoring.
 """
 import functions_framework
-from google.cloud import firestore
-from google.events.cloud import firestore as firestoredata
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
 from datetime import datetime
 
+import analytics
+import archive
+import clients
+import counters
+import history
+import job_events
+import manifest
+import queries
+import telemetry
+from cache import ResponseCache
+
+FIRESTORE_COLLECTION = os.environ.get("FIRESTORE_COLLECTION", "audiobook_jobs")
+
+# Statuses reported by get_stats
+STATUSES = ("completed", "processing", "failed", "pending")
+
+# get_stats response cache; STALE_SECONDS > 0 enables stale-while-revalidate
+STATS_CACHE_TTL_SECONDS = float(os.environ.get("STATS_CACHE_TTL_SECONDS", "60"))
+STATS_CACHE_STALE_SECONDS = float(os.environ.get("STATS_CACHE_STALE_SECONDS", "0"))
+stats_cache = ResponseCache(STATS_CACHE_TTL_SECONDS, STATS_CACHE_STALE_SECONDS)
+
+# Bucket holding the daily snapshots read by get_stats_history (see history.py)
+STATS_HISTORY_BUCKET = os.environ.get("STATS_HISTORY_BUCKET", "")
+
+
+@clients.shared
+def get_firestore_client():
+    from google.cloud import firestore
+    return firestore.Client()
+
+
+@clients.shared
+def get_storage_client():
+    from google.cloud import storage
+    return storage.Client()
+
+
+def _send_webhooks(notification, event_id):
+    """Deliver a notification to every WEBHOOK_URLS endpoint and log failures."""
+    if not os.environ.get("WEBHOOK_URLS"):
+        return
+    import delivery
+    
+    for result in delivery.dispatcher.deliver(notification, event_id):
+        if not result["delivered"]:
+            print(f"Webhook delivery failed: {json.dumps(result)}")
+
+
+def _publish_transition(event, cloud_event):
+    """Publish a status transition to the JOB_EVENTS_TOPIC lifecycle stream."""
+    if not os.environ.get("JOB_EVENTS_TOPIC"):
+        return
+    import lifecycle
+    
+    message = lifecycle.transition(event, cloud_event.get("time"))
+    if message is None:
+        return
+    with telemetry.span("pubsub.publish") as publishing:
+        lifecycle.publisher.publish(message)
+        publishing.add(items=1, bytes=lifecycle.JobLifecycleEvent.pb(message).ByteSize())
+
+
 @functions_framework.cloud_event
+@telemetry.traced("on_job_completed")
 def on_job_completed(cloud_event: functions_framework.CloudEvent):
     """
-    Triggered when a Firestore document in audiobook_jobs is updated.
-    Checks if status changed to 'completed' and sends notification.
+    Triggered when a Firestore document in audiobook_jobs is written.
+    Keeps the sharded status counters in step with every transition,
+    marks the job for the next manifest compaction, publishes each
+    transition to the lifecycle topic and sends a notification when the
+    status changes to 'completed' or 'failed'.
     """
     # Parse the Firestore event
-    firestore_payload = firestoredata.DocumentEventData()
-    firestore_payload._pb.ParseFromString(cloud_event.data)
-    
-    # Get the updated document data
-    new_value = firestore_payload.value
-    old_value = firestore_payload.old_value
-    
-    # Extract fields
-    def get_field_value(doc, field_name):
-        if field_name in doc.fields:
-            field = doc.fields[field_name]
-            if field.string_value:
-                return field.string_value
-            elif field.integer_value:
-                return field.integer_value
-        return None
-    
-    new_status = get_field_value(new_value, "status")
-    old_status = get_field_value(old_value, "status") if old_value else None
-    filename = get_field_value(new_value, "filename")
-    job_id = cloud_event.subject.split("/")[-1] if cloud_event.subject else "unknown"
+    with telemetry.span("decode") as decoding:
+        event = job_events.JobEvent(cloud_event)
+        decoding.add(items=1, bytes=len(cloud_event.data))
+    
+    # Progress updates: the update mask shows the status was not written,
+    # so neither document needs parsing
+    if not event.may_change("status"):
+        return {"event": "no_action"}
+    
+    new_status = event.new("status")
+    old_status = event.old("status")
+    if new_status == old_status and event.existed == event.exists:
+        return {"event": "no_action", "status": new_status}
+    
+    filename = event.new("filename")
+    job_id = event.job_id or "unknown"
+    
+    # Update status counters (creates and deletes arrive here too)
+    with telemetry.span("counters.apply") as applying:
+        applied = counters.apply_transition(
+            get_firestore_client(),
+            cloud_event["id"],
+            old_status,
+            new_status,
+            existed=event.existed,
+            exists=event.exists,
+        )
+        applying.add(items=int(applied))
+    
+    # The next manifest compaction re-reads this job's status
+    if event.job_id:
+        with telemetry.span("manifest.touch"):
+            manifest.touch_job(get_firestore_client(), event.job_id)
+    
+    # Stream the transition to Pub/Sub consumers
+    _publish_transition(event, cloud_event)
     
     # Check if status changed to completed
     if new_status == "completed" and old_status != "completed":
@@ -48,14 +129,13 @@ def on_job_completed(cloud_event: functions_framework.CloudEvent):
             "message": f"Audiobook '{filename}' has been successfully processed!"
         }
         
-        # Log notification (in production, send to email/webhook/push)
+        # Log notification and deliver it to the configured webhooks
         print(f"🎉 NOTIFICATION: {json.dumps(notification)}")
+        _send_webhooks(notification, cloud_event["id"])
         
         # Here you could add:
         # - Send email via SendGrid/Mailgun
         # - Send push notification via Firebase
-        # - Call webhook to external service
-        # - Send to Pub/Sub for further processing
         
         return notification
     
@@ -69,39 +149,194 @@ def on_job_completed(cloud_event: functions_framework.CloudEvent):
         }
         
         print(f"❌ NOTIFICATION: {json.dumps(notification)}")
+        _send_webhooks(notification, cloud_event["id"])
         return notification
     
     return {"event": "no_action", "status": new_status}
 
 
+def count_by_aggregation(jobs_ref):
+    """
+    Count jobs with server-side count() aggregations, one query per status
+    plus one for the total, all issued concurrently. Each query is billed
+    per 1000 index entries instead of one read per document.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    
+    queries = {"total_jobs": jobs_ref}
+    for status in STATUSES:
+        queries[status] = jobs_ref.where(filter=FieldFilter("status", "==", status))
+    
+    def count(query):
+        return query.count(alias="count").get()[0][0].value
+    
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        futures = {key: pool.submit(count, query) for key, query in queries.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+
+def count_by_scan(jobs_ref):
+    """
+    Count jobs by streaming the collection, masked to the status field.
+    Fallback for emulators without aggregation query support.
+    """
+    stats = {"total_jobs": 0, **{status: 0 for status in STATUSES}}
+    with telemetry.span("firestore.stream") as streaming, telemetry.span("decode") as decoding:
+        for doc in streaming.iterate(jobs_ref.select(["status"]).stream()):
+            stats["total_jobs"] += 1
+            with decoding.measure():
+                status = (doc.to_dict() or {}).get("status")
+            if status in stats:
+                stats[status] += 1
+        streaming.add(items=stats["total_jobs"])
+        decoding.add(items=stats["total_jobs"])
+    return stats
+
+
+def compute_stats():
+    """
+    Current status counts plus processing-time and throughput analytics.
+    Counts come from the sharded counters; until they have been built it
+    falls back to aggregation queries, then to a scan. Archived jobs are
+    reported separately, from the archive summary.
+    """
+    from google.api_core import exceptions as api_exceptions
+    
+    db = get_firestore_client()
+    jobs_ref = db.collection(FIRESTORE_COLLECTION)
+    
+    with telemetry.span("counters.read"):
+        totals = counters.read_counters(db)
+    if totals is not None:
+        stats = {"total_jobs": totals["total_jobs"]}
+        for status in STATUSES:
+            stats[status] = totals["statuses"].get(status, 0)
+        stats["source"] = "counters"
+    else:
+        try:
+            with telemetry.span("firestore.aggregation"):
+                stats = count_by_aggregation(jobs_ref)
+            stats["source"] = "aggregation"
+        except (api_exceptions.GoogleAPICallError, NotImplementedError) as e:
+            print(f"Aggregation queries unavailable, scanning instead: {str(e)}")
+            stats = count_by_scan(jobs_ref)
+            stats["source"] = "scan"
+    
+    with telemetry.span("analytics"):
+        stats.update(analytics.processing_analytics(db))
+    
+    # Bytes stored per job status, as of the last manifest compaction
+    with telemetry.span("manifest.summary"):
+        summary = manifest.read_summary(db)
+    if summary is not None:
+        stats["storage"] = {
+            "objects": summary["objects"],
+            "bytes": summary["bytes"],
+            "bytes_by_status": summary["bytes_by_status"],
+            "as_of": summary["compacted_at"],
+        }
+    
+    # Jobs moved out of the collection by the archival stage
+    with telemetry.span("archive.summary"):
+        archived = archive.read_summary(db)
+    if archived is not None:
+        stats["archived"] = {
+            "jobs": archived.get("jobs", 0),
+            **{status: archived.get("statuses", {}).get(status, 0) for status in archive.FINISHED_STATUSES},
+            "as_of": archived.get("updated_at"),
+        }
+        stats["all_time_jobs"] = stats["total_jobs"] + stats["archived"]["jobs"]
+    stats["timestamp"] = datetime.utcnow().isoformat()
+    return stats
+
+
+def _stats_body():
+    with telemetry.span("response") as responding:
+        body = json.dumps(compute_stats())
+        responding.add(bytes=len(body))
+    return body
+
+
+def _snapshot_body():
+    """Fresh stats, appended to the daily history (the scheduled report)."""
+    stats = compute_stats()
+    if STATS_HISTORY_BUCKET:
+        with telemetry.span("history.append") as appending:
+            bucket = get_storage_client().bucket(STATS_HISTORY_BUCKET)
+            stats["history_appended"] = history.append(bucket, stats)
+            appending.add(items=int(stats["history_appended"]))
+    with telemetry.span("response") as responding:
+        body = json.dumps(stats)
+        responding.add(bytes=len(body))
+    return body
+
+
+def query_jobs(args):
+    """Filtered job listing or grouped counts; see queries.py for the arguments."""
+    query = queries.parse(args)
+    jobs_ref = get_firestore_client().collection(FIRESTORE_COLLECTION)
+    with telemetry.span("firestore.query", shape=query["group_by"] or "list") as querying:
+        result = queries.run(jobs_ref, query)
+        querying.add(items=len(result.get("groups") or result.get("jobs") or ()))
+    return result
+
+
 @functions_framework.http
+@telemetry.traced("get_stats")
 def get_stats(request):
     """
     HTTP endpoint to get processing statistics.
+    Responses are cached on the instance for STATS_CACHE_TTL_SECONDS and
+    carry an ETag; a matching If-None-Match gets a 304.
+    
+    With from/to/status/group_by/cursor/limit arguments it answers a job
+    query instead (not cached): ?status=failed&from=2026-01-01 lists
+    matching jobs newest first, ?group_by=day counts them per day.
+    ?snapshot=true (the daily report) computes fresh stats and appends
+    them to the history served by get_stats_history.
     """
     try:
-        db = firestore.Client()
-        jobs_ref = db.collection("audiobook_jobs")
-        
-        stats = {
-            "total_jobs": 0,
-            "completed": 0,
-            "processing": 0,
-            "failed": 0,
-            "pending": 0
-        }
-        
-        for doc in jobs_ref.stream():
-            data = doc.to_dict()
-            stats["total_jobs"] += 1
-            status = data.get("status", "unknown")
-            if status in stats:
-                stats[status] += 1
-        
-        stats["timestamp"] = datetime.utcnow().isoformat()
-        
-        return json.dumps(stats), 200, {"Content-Type": "application/json"}
+        args = getattr(request, "args", None) or {}
+        if args.get("snapshot") == "true":
+            return _snapshot_body(), 200, {"Content-Type": "application/json"}
+        if any(name in args for name in queries.QUERY_ARGS):
+            body = json.dumps(query_jobs(args))
+            return body, 200, {"Content-Type": "application/json"}
+        return stats_cache.serve(request, "stats", _stats_body)
         
+    except queries.QueryError as e:
+        return json.dumps({"error": str(e)}), 400, {"Content-Type": "application/json"}
     except Exception as e:
         return json.dumps({"error": str(e)}), 500, {"Content-Type": "application/json"}
 
+
+@functions_framework.http
+@telemetry.traced("get_stats_history")
+def get_stats_history(request):
+    """
+    HTTP endpoint for stats trends from the daily snapshots, without
+    touching Firestore: ?from=2026-01-01&to=2026-06-30&rollup=weekly.
+    rollup is daily (default), weekly or monthly; the range defaults to
+    the last 30 days.
+    """
+    try:
+        if not STATS_HISTORY_BUCKET:
+            raise RuntimeError("STATS_HISTORY_BUCKET is not set")
+        args = getattr(request, "args", None) or {}
+        start, end, period = history.parse(args)
+        bucket = get_storage_client().bucket(STATS_HISTORY_BUCKET)
+        with telemetry.span("history.read") as reading:
+            snapshots = history.read(bucket, start, end)
+            reading.add(items=len(snapshots), bytes=len(snapshots) * history.RECORD_SIZE)
+        body = json.dumps({
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "rollup": period,
+            "points": history.rollup(snapshots, period),
+        })
+        return body, 200, {"Content-Type": "application/json", "Cache-Control": "private, max-age=300"}
+        
+    except history.HistoryError as e:
+        return json.dumps({"error": str(e)}), 400, {"Content-Type": "application/json"}
+    except Exception as e:
+        return json.dumps({"error": str(e)}), 500, {"Content-Type": "application/json"}
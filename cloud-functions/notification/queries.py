@@ -0,0 +1,183 @@
+"""
+Filtered, grouped and paginated job queries for get_stats.
+
+Every query shape is an indexed range read over the matching jobs, never a
+collection scan. The composite indexes are declared in pulumi/__main__.py:
+
+- list: optional status ==, from <= created_at < to, newest first, paged
+  with an opaque cursor. Index (status ASC, created_at DESC, __name__ DESC);
+  without a status the single-field index on created_at serves it.
+- group_by=day|hour: one count() aggregation per UTC bucket of the range,
+  issued concurrently. Index (status ASC, created_at ASC); again
+  single-field without a status. Each count is billed per 1000 index
+  entries, not per job.
+"""
+import base64
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from job_times import JOB_CREATED_FIELD, JOB_TIMESTAMP_FORMAT, query_value
+
+STATUSES = ("completed", "processing", "failed", "pending")
+GROUPS = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+DEFAULT_RANGE = timedelta(days=7)
+DEFAULT_LIMIT = 50
+MAX_LIMIT = int(os.environ.get("STATS_QUERY_MAX_LIMIT", "500"))
+# Count queries one grouped request may issue
+MAX_BUCKETS = int(os.environ.get("STATS_QUERY_MAX_BUCKETS", "400"))
+COUNT_WORKERS = 16
+
+# Fields returned for each listed job
+LIST_FIELDS = ["status", "filename", JOB_CREATED_FIELD, "completed_at"]
+
+# Request arguments that turn get_stats into a query
+QUERY_ARGS = ("from", "to", "status", "group_by", "cursor", "limit")
+
+
+class QueryError(ValueError):
+    """Invalid query arguments; reported as a 400."""
+
+
+def _parse_time(value, name):
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise QueryError(f"{name} must be an ISO 8601 date or datetime")
+    return moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def parse(args):
+    """Validated query from the request arguments (a mapping of strings)."""
+    now = datetime.now(timezone.utc)
+    end = _parse_time(args["to"], "to") if args.get("to") else now
+    start = _parse_time(args["from"], "from") if args.get("from") else end - DEFAULT_RANGE
+    if start >= end:
+        raise QueryError("from must be before to")
+
+    status = args.get("status") or None
+    if status is not None and status not in STATUSES:
+        raise QueryError(f"status must be one of {', '.join(STATUSES)}")
+
+    group_by = args.get("group_by") or None
+    if group_by is not None:
+        if group_by not in GROUPS:
+            raise QueryError(f"group_by must be one of {', '.join(GROUPS)}")
+        if (end - start) / GROUPS[group_by] > MAX_BUCKETS:
+            raise QueryError(f"range too long for group_by={group_by} (max {MAX_BUCKETS} buckets)")
+
+    try:
+        limit = int(args.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise QueryError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    return {
+        "from": start, "to": end, "status": status, "group_by": group_by,
+        "cursor": args.get("cursor") or None, "limit": limit,
+    }
+
+
+def _filtered(jobs_ref, status, start, end):
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = jobs_ref
+    if status:
+        query = query.where(filter=FieldFilter("status", "==", status))
+    return (
+        query.where(filter=FieldFilter(JOB_CREATED_FIELD, ">=", query_value(start)))
+        .where(filter=FieldFilter(JOB_CREATED_FIELD, "<", query_value(end)))
+    )
+
+
+def encode_cursor(created, job_id):
+    raw = json.dumps([_jsonable(created), job_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        created, job_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise QueryError("invalid cursor")
+    if JOB_TIMESTAMP_FORMAT != "iso":
+        created = _parse_time(created, "cursor")
+    return created, job_id
+
+
+def list_jobs(jobs_ref, query):
+    """One page of matching jobs, newest first, and the cursor of the next."""
+    from google.cloud import firestore
+
+    page = (
+        _filtered(jobs_ref, query["status"], query["from"], query["to"])
+        .select(LIST_FIELDS)
+        .order_by(JOB_CREATED_FIELD, direction=firestore.Query.DESCENDING)
+        .order_by("__name__", direction=firestore.Query.DESCENDING)
+        .limit(query["limit"] + 1)
+    )
+    if query["cursor"]:
+        created, job_id = decode_cursor(query["cursor"])
+        page = page.start_after({JOB_CREATED_FIELD: created, "__name__": job_id})
+
+    jobs = []
+    next_cursor = None
+    for snapshot in page.stream():
+        if len(jobs) == query["limit"]:
+            last = jobs[-1]
+            next_cursor = encode_cursor(last[JOB_CREATED_FIELD], last["id"])
+            break
+        data = snapshot.to_dict() or {}
+        jobs.append({"id": snapshot.id, **{field: data.get(field) for field in LIST_FIELDS}})
+    return {
+        "jobs": [{key: _jsonable(value) for key, value in job.items()} for job in jobs],
+        "next_cursor": next_cursor,
+    }
+
+
+def group_counts(jobs_ref, query):
+    """Job counts per day or hour bucket of the range, oldest first."""
+    step = GROUPS[query["group_by"]]
+    start = query["from"].replace(minute=0, second=0, microsecond=0)
+    if query["group_by"] == "day":
+        start = start.replace(hour=0)
+    buckets = []
+    while start < query["to"]:
+        buckets.append((max(start, query["from"]), min(start + step, query["to"])))
+        start += step
+
+    def count(bucket):
+        aggregation = _filtered(jobs_ref, query["status"], *bucket).count(alias="count")
+        return aggregation.get()[0][0].value
+
+    with ThreadPoolExecutor(max_workers=min(COUNT_WORKERS, len(buckets))) as pool:
+        counts = list(pool.map(count, buckets))
+    return {
+        "groups": [
+            {"start": bucket[0].isoformat(), "end": bucket[1].isoformat(), "count": n}
+            for bucket, n in zip(buckets, counts)
+        ],
+        "total": sum(counts),
+    }
+
+
+def run(jobs_ref, query):
+    """Answer a parsed query: grouped counts or a page of jobs."""
+    result = {
+        "from": query["from"].isoformat(),
+        "to": query["to"].isoformat(),
+        "status": query["status"],
+    }
+    if query["group_by"]:
+        result["group_by"] = query["group_by"]
+        result.update(group_counts(jobs_ref, query))
+    else:
+        result["limit"] = query["limit"]
+        result.update(list_jobs(jobs_ref, query))
+    return result
@@ -0,0 +1,102 @@
+"""
+Mergeable quantile sketch (merging t-digest) for job processing times.
+Small enough to persist in a Firestore document and cheap to merge, so
+per-window sketches can be combined without rescanning the jobs.
+"""
+import math
+
+
+class TDigest:
+    """
+    Merging t-digest. Values are buffered and periodically folded into
+    centroids whose size is bounded by 4·n·q·(1-q)/compression, which keeps
+    the tails (p95/p99) accurate with a few hundred centroids.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._centroids = []
+        self._buffer = []
+
+    def add(self, value, weight=1):
+        self._buffer.append((float(value), weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        if not other.count:
+            return self
+        self._buffer.extend(other._centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self._centroids + self._buffer)
+        self._buffer = []
+        merged = []
+        cumulative = 0.0
+        mean, weight = points[0]
+        for next_mean, next_weight in points[1:]:
+            q = (cumulative + (weight + next_weight) / 2) / self.count
+            if weight + next_weight <= 4 * self.count * q * (1 - q) / self.compression:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                mean, weight = next_mean, next_weight
+        merged.append((mean, weight))
+        self._centroids = merged
+
+    def quantile(self, q):
+        """Estimated value at quantile q (0..1), or None for an empty sketch."""
+        self._compress()
+        centroids = self._centroids
+        if not centroids:
+            return None
+        if len(centroids) == 1:
+            return centroids[0][0]
+
+        target = q * self.count
+        cumulative = 0.0
+        previous_mean, previous_mid = self.min, 0.0
+        for mean, weight in centroids:
+            mid = cumulative + weight / 2
+            if target < mid:
+                span = mid - previous_mid
+                return previous_mean + (mean - previous_mean) * ((target - previous_mid) / span if span else 0)
+            cumulative += weight
+            previous_mean, previous_mid = mean, mid
+        span = self.count - previous_mid
+        return previous_mean + (self.max - previous_mean) * ((target - previous_mid) / span if span else 0)
+
+    def to_dict(self):
+        self._compress()
+        return {
+            "means": [mean for mean, _ in self._centroids],
+            "weights": [weight for _, weight in self._centroids],
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data, compression=100):
+        digest = cls(compression)
+        digest._centroids = list(zip(data.get("means", []), data.get("weights", [])))
+        digest.count = data.get("count", 0)
+        if digest.count:
+            digest.min, digest.max = data["min"], data["max"]
+        return digest
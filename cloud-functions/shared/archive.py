@@ -0,0 +1,250 @@
+"""
+Cold-tier archive of finished audiobook_jobs.
+
+Completed and failed jobs older than ARCHIVE_AFTER_DAYS are copied into
+gzip'd JSON-lines segments in the archive bucket, partitioned by creation date
+(archive/jobs/dt=YYYY-MM-DD/part-<run>-<n>.jsonl.gz), and then deleted from
+Firestore, so scans of the hot collection stop growing with history. Only
+jobs whose segment was written out completely are deleted.
+
+Two small structures describe what has been archived:
+- ids.txt.gz, every archived job id, sorted. It is rewritten before any
+  document is deleted, so a job missing from Firestore because it was
+  archived is always listed there and cleanup keeps its files, and
+  rewritten again without the jobs whose delete did not go through.
+- the summary document, with archived job counts per status and the
+  segments of each partition, for get_stats.
+
+Before a job is deleted it is stamped with archived_at, so functions
+triggered by the delete can tell an archival from a user deleting the job.
+"""
+import gzip
+import heapq
+import json
+import os
+from datetime import date, datetime, timezone
+
+from job_times import JOB_CREATED_FIELD, as_datetime, query_value
+
+ARCHIVE_PREFIX = os.environ.get("ARCHIVE_PREFIX", "archive/jobs/")
+IDS_NAME = f"{ARCHIVE_PREFIX}ids.txt.gz"
+SUMMARY_COLLECTION = os.environ.get("ARCHIVE_SUMMARY_COLLECTION", "job_archive")
+SUMMARY_DOCUMENT = "summary"
+
+ARCHIVED_FIELD = "archived_at"
+FINISHED_STATUSES = ("completed", "failed")
+
+
+# =============================================================================
+# Archived job ids
+# =============================================================================
+
+def ids_generation(bucket):
+    """Object generation of the id index (0 before the first archival)."""
+    blob = bucket.get_blob(IDS_NAME)
+    return blob.generation if blob is not None else 0
+
+
+def read_ids(bucket, generation, start=None, end=None):
+    """Stream the archived job ids of one index generation, in id order."""
+    if not generation:
+        return
+    blob = bucket.blob(IDS_NAME, generation=generation)
+    with blob.open("rb") as raw, gzip.open(raw, "rt", encoding="utf-8") as lines:
+        for line in lines:
+            job_id = line.rstrip("\n")
+            if start and job_id < start:
+                continue
+            if end and job_id >= end:
+                return
+            yield job_id
+
+
+class ArchivedIds:
+    """
+    The archived ids as seen by one sweep: the index generation it started
+    from, plus a check for jobs archived after that.
+    """
+
+    def __init__(self, bucket):
+        self._bucket = bucket
+        self.generation = ids_generation(bucket)
+
+    def stream(self, start=None, end=None):
+        return read_ids(self._bucket, self.generation, start, end)
+
+    def among(self, job_ids):
+        """Those of `job_ids` archived since the sweep started."""
+        generation = ids_generation(self._bucket)
+        if not job_ids or generation == self.generation:
+            return set()
+        wanted = set(job_ids)
+        return {job_id for job_id in read_ids(self._bucket, generation) if job_id in wanted}
+
+
+def _write_ids(bucket, job_ids, if_generation_match):
+    """Replace the index with `job_ids` (sorted); returns (count, new generation)."""
+    # Pinned to the generation that was read: a concurrent archival fails here
+    writer = bucket.blob(IDS_NAME).open(
+        "wb", ignore_flush=True, content_type="application/gzip", if_generation_match=if_generation_match,
+    )
+    count = 0
+    with writer, gzip.GzipFile(fileobj=writer, mode="wb", mtime=0) as out:
+        previous = None
+        for job_id in job_ids:
+            if job_id != previous:
+                out.write(f"{job_id}\n".encode())
+                count += 1
+                previous = job_id
+    return count, ids_generation(bucket)
+
+
+# =============================================================================
+# Archival
+# =============================================================================
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _segment_writer(bucket, name):
+    raw = bucket.blob(name).open("wb", ignore_flush=True, content_type="application/gzip")
+    return raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0)
+
+
+def _close(writer):
+    raw, out = writer
+    out.close()
+    raw.close()
+
+
+def archive_finished(db, bucket, collection, older_than, limit):
+    """
+    Archive up to `limit` finished jobs created more than `older_than` ago,
+    oldest first. Jobs written to while the run is in progress stay in
+    Firestore and are picked up again next time. Returns the run summary.
+    """
+    from google.api_core import exceptions as api_exceptions
+    from google.cloud import firestore
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    now = datetime.now(timezone.utc)
+    cutoff = query_value(now - older_than)
+    query = (
+        db.collection(collection)
+        .where(filter=FieldFilter("status", "in", list(FINISHED_STATUSES)))
+        .where(filter=FieldFilter(JOB_CREATED_FIELD, "<", cutoff))
+        .order_by(JOB_CREATED_FIELD)
+        .limit(limit)
+    )
+
+    # Stream the jobs into segments by creation date. The query is in
+    # creation order, so one segment is open at a time; a date that comes
+    # round again (mixed timestamp types) gets a segment of its own.
+    run_id = now.strftime("%Y%m%dT%H%M%S%fZ")
+    candidates = []  # (job_id, status, partition, segment, reference, update_time)
+    segments = []
+    writer, partition, pending = None, None, []
+    try:
+        for snapshot in query.stream():
+            data = snapshot.to_dict()
+            created = as_datetime(data.get(JOB_CREATED_FIELD))
+            day = created.date().isoformat() if created else "unknown"
+            if day != partition:
+                if writer:
+                    _close(writer)
+                    candidates.extend(pending)
+                partition, pending = day, []
+                segments.append(f"{ARCHIVE_PREFIX}dt={day}/part-{run_id}-{len(segments)}.jsonl.gz")
+                writer = _segment_writer(bucket, segments[-1])
+            line = json.dumps({"id": snapshot.id, "data": data}, default=_jsonable, separators=(",", ":"))
+            writer[1].write(line.encode() + b"\n")
+            pending.append((snapshot.id, data.get("status"), day, segments[-1], snapshot.reference, snapshot.update_time))
+    finally:
+        if writer:
+            _close(writer)
+    # Only reached once the last segment is written out, like each one before it
+    candidates.extend(pending)
+
+    result = {"candidates": len(candidates), "archived": 0, "segments": sorted(segments)}
+    if not candidates:
+        return result
+
+    # Stamp each job unless it changed after it was copied
+    stamped = {}
+    bulk = db.bulk_writer()
+    bulk.on_write_error(lambda error: False)
+    bulk.on_write_result(lambda reference, write_result, _: stamped.__setitem__(reference.id, write_result.update_time))
+    for job_id, _, _, _, reference, update_time in candidates:
+        bulk.update(reference, {ARCHIVED_FIELD: now.isoformat()}, option=db.write_option(last_update_time=update_time))
+    bulk.close()
+    if not stamped:
+        result["kept"] = len(candidates)
+        return result
+
+    # Index the stamped jobs before deleting any of them
+    generation = ids_generation(bucket)
+    try:
+        indexed, indexed_generation = _write_ids(
+            bucket, heapq.merge(read_ids(bucket, generation), sorted(stamped)), generation,
+        )
+    except api_exceptions.PreconditionFailed:
+        for name in segments:
+            bucket.blob(name).delete()
+        raise
+
+    deleted = set()
+    bulk = db.bulk_writer()
+    bulk.on_write_error(lambda error: False)
+    bulk.on_write_result(lambda reference, write_result, _: deleted.add(reference.id))
+    for job_id, _, _, _, reference, _ in candidates:
+        if job_id in stamped:
+            bulk.delete(reference, option=db.write_option(last_update_time=stamped[job_id]))
+    bulk.close()
+
+    # Jobs whose delete did not go through stay in Firestore, so they lose
+    # the stamp and come out of the index again
+    kept = [reference for job_id, _, _, _, reference, _ in candidates if job_id in stamped and job_id not in deleted]
+    if kept:
+        bulk = db.bulk_writer()
+        bulk.on_write_error(lambda error: False)
+        for reference in kept:
+            bulk.update(reference, {ARCHIVED_FIELD: firestore.DELETE_FIELD})
+        bulk.close()
+    if deleted == set(stamped):
+        result["index_ids"] = indexed
+    else:
+        result["index_ids"], _ = _write_ids(
+            bucket, heapq.merge(read_ids(bucket, generation), sorted(deleted)), indexed_generation,
+        )
+
+    # Count only what actually left the hot collection
+    statuses, partitions = {}, {}
+    for job_id, status, day, segment, _, _ in candidates:
+        if job_id in deleted:
+            statuses[status] = statuses.get(status, 0) + 1
+            partition = partitions.setdefault(day, {"jobs": 0, "segments": set()})
+            partition["jobs"] += 1
+            partition["segments"].add(segment)
+    if deleted:
+        db.collection(SUMMARY_COLLECTION).document(SUMMARY_DOCUMENT).set({
+            "jobs": firestore.Increment(len(deleted)),
+            "statuses": {status: firestore.Increment(n) for status, n in statuses.items()},
+            "partitions": {
+                day: {"jobs": firestore.Increment(p["jobs"]), "segments": firestore.ArrayUnion(sorted(p["segments"]))}
+                for day, p in partitions.items()
+            },
+            "updated_at": now.isoformat(),
+        }, merge=True)
+
+    result["archived"] = len(deleted)
+    result["kept"] = len(candidates) - len(deleted)
+    return result
+
+
+def read_summary(db):
+    """Archived job counts and partitions, or None before the first archival."""
+    snapshot = db.collection(SUMMARY_COLLECTION).document(SUMMARY_DOCUMENT).get()
+    return snapshot.to_dict() if snapshot.exists else None
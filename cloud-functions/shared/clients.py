@@ -0,0 +1,26 @@
+"""
+Lazily built Google Cloud clients, shared across requests.
+
+Both functions decorate a factory per client with `shared`: the client is
+built on first use and then reused by every request (and request thread)
+on the instance. The google.cloud imports live inside the factories, so
+cold starts only pay for the clients a function actually uses.
+"""
+import functools
+import threading
+
+
+def shared(factory):
+    """Build the wrapped client on first call; later calls on this instance reuse it."""
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    return get
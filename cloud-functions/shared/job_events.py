@@ -0,0 +1,129 @@
+"""
+Decoding of Firestore events for audiobook_jobs documents.
+
+Eventarc delivers Firestore triggers as DocumentEventData protobufs: the
+document after the write (value, field 1), the document before it
+(old_value, field 2), either of which is absent for creates and deletes,
+and for updates the paths the write changed (update_mask, field 3).
+Shared by every function triggered by job writes and deletes.
+
+Most writes are progress updates that never touch the fields these
+functions read, so the payload is not parsed up front: one pass over its
+three top-level fields finds the documents and the update mask, and a
+document is parsed (as a raw protobuf, without proto-plus wrappers) only
+when one of its fields is asked for.
+"""
+import functools
+from datetime import timezone
+
+VALUE_FIELD = 1
+OLD_VALUE_FIELD = 2
+UPDATE_MASK_FIELD = 3
+
+_SCALAR_KINDS = ("string_value", "integer_value", "double_value", "boolean_value", "reference_value")
+
+
+@functools.lru_cache(maxsize=None)
+def _message_types():
+    from google.events.cloud import firestore as firestoredata
+
+    return firestoredata.Document.pb(), firestoredata.DocumentMask.pb()
+
+
+def _varint(data, position):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def top_level_fields(data):
+    """{field number: bytes} of the length-delimited fields of a message."""
+    data = memoryview(data)
+    fields = {}
+    position, end = 0, len(data)
+    while position < end:
+        key, position = _varint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 2:
+            length, position = _varint(data, position)
+            chunk = data[position:position + length]
+            # A repeated message field is merged, which parsing the concatenation does
+            fields[number] = bytes(fields[number]) + bytes(chunk) if number in fields else chunk
+            position += length
+        elif wire_type == 0:
+            _, position = _varint(data, position)
+        elif wire_type == 1:
+            position += 8
+        elif wire_type == 5:
+            position += 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire_type}")
+    return fields
+
+
+class JobEvent:
+    """One write to (or delete of) an audiobook_jobs document."""
+
+    def __init__(self, cloud_event):
+        self.id = cloud_event["id"]
+        self._fields = top_level_fields(cloud_event.data)
+        self._documents = {}
+        self.existed = OLD_VALUE_FIELD in self._fields
+        self.exists = VALUE_FIELD in self._fields
+        if UPDATE_MASK_FIELD in self._fields:
+            mask = _message_types()[1].FromString(self._fields[UPDATE_MASK_FIELD])
+            self.update_mask = frozenset(mask.field_paths)
+        else:
+            self.update_mask = None  # Creates, deletes and events without a mask
+        subject = cloud_event.get("subject")
+        if subject:
+            self.job_id = _job_id(subject, None)
+        else:
+            self.job_id = _job_id(None, self._document(VALUE_FIELD if self.exists else OLD_VALUE_FIELD).name)
+
+    def _document(self, number):
+        if number not in self._documents:
+            self._documents[number] = _message_types()[0].FromString(self._fields.get(number, b""))
+        return self._documents[number]
+
+    def may_change(self, *field_names):
+        """False when the update mask shows the write left all of `field_names` alone."""
+        if self.update_mask is None:
+            return True
+        return any(name in self.update_mask for name in field_names)
+
+    def old(self, field_name):
+        """Field of the document before the write (None if it did not exist)."""
+        return field_value(self._document(OLD_VALUE_FIELD), field_name) if self.existed else None
+
+    def new(self, field_name):
+        """Field of the document after the write (None if it was deleted)."""
+        return field_value(self._document(VALUE_FIELD), field_name) if self.exists else None
+
+
+def _job_id(subject, document_name):
+    # subject: documents/audiobook_jobs/{jobId}; name: projects/.../documents/audiobook_jobs/{jobId}
+    path = subject or document_name
+    return path.split("/")[-1] if path else None
+
+
+def field_value(document, field_name):
+    """
+    Value of a top-level field of a raw Document protobuf: str, int, float,
+    bool, or an aware datetime for timestamps. None if the field is absent,
+    null, or an array, map, bytes or geo point.
+    """
+    if field_name not in document.fields:
+        return None
+    field = document.fields[field_name]
+    kind = field.WhichOneof("value_type")
+    if kind in _SCALAR_KINDS:
+        return getattr(field, kind)
+    if kind == "timestamp_value":
+        return field.timestamp_value.ToDatetime(tzinfo=timezone.utc)
+    return None
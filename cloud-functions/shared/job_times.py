@@ -0,0 +1,33 @@
+"""
+Timestamp fields of audiobook_jobs documents.
+
+Jobs store created_at and completed_at either as ISO strings or as
+Firestore timestamps (JOB_TIMESTAMP_FORMAT "iso" or "timestamp"), and range
+queries must compare against the same type. Shared by the latency
+analytics, the job queries and the archival stage.
+"""
+import os
+from datetime import datetime, timezone
+
+JOB_CREATED_FIELD = os.environ.get("JOB_CREATED_FIELD", "created_at")
+JOB_COMPLETED_FIELD = os.environ.get("JOB_COMPLETED_FIELD", "completed_at")
+JOB_TIMESTAMP_FORMAT = os.environ.get("JOB_TIMESTAMP_FORMAT", "iso")
+
+
+def as_datetime(value):
+    """Firestore timestamp or ISO string -> aware UTC datetime (None if unusable)."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def query_value(moment):
+    """An aware UTC datetime as stored in the jobs, for range filters."""
+    if JOB_TIMESTAMP_FORMAT == "iso":
+        return moment.replace(tzinfo=None).isoformat()
+    return moment
@@ -0,0 +1,374 @@
+"""
+Manifest of the objects under audiobooks/.
+
+The manifest is a gzip'd, tab-separated segment file in the bucket with one
+row per object (job_id, name, size, created, generation), sorted by job id
+and then name, plus a small pointer object naming the current segment.
+Object finalize/delete events record per-object deltas in Firestore;
+compaction periodically merges the deltas into a new segment and writes a
+summary (objects and bytes per job status) that get_stats can read with
+a single document get.
+
+Each segment has a statuses file beside it (job_id, status of every job in
+the segment), so compaction only looks up the jobs whose status changed
+since the last one, which on_job_completed records with touch_job, and
+those with new deltas. Delete deltas are kept as tombstones for
+TOMBSTONE_RETENTION after they are merged, so a finalize event of the same
+generation retried late is still recognised as stale.
+
+Readers merge the segment with the pending deltas, so the view is current
+as of the last recorded event. Object names containing tabs or newlines
+cannot be stored and are skipped; the pipeline never produces them.
+"""
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+AUDIOBOOKS_PREFIX = "audiobooks/"
+MANIFEST_PREFIX = os.environ.get("MANIFEST_PREFIX", "manifests/audiobooks/")
+POINTER_NAME = f"{MANIFEST_PREFIX}CURRENT.json"
+DELTAS_COLLECTION = os.environ.get("MANIFEST_DELTAS_COLLECTION", "manifest_deltas")
+SUMMARY_COLLECTION = os.environ.get("MANIFEST_SUMMARY_COLLECTION", "storage_manifest")
+SUMMARY_DOCUMENT = "summary"
+# Jobs whose status changed since the last compaction
+TOUCHED_COLLECTION = os.environ.get("MANIFEST_TOUCHED_COLLECTION", "manifest_touched_jobs")
+# Longer than the 24h Eventarc keeps retrying an event
+TOMBSTONE_RETENTION = timedelta(hours=int(os.environ.get("MANIFEST_TOMBSTONE_HOURS", "48")))
+
+# Bytes of objects whose job document does not exist are reported under this key
+ORPHANED = "orphaned"
+# ...and those of archived jobs under this one
+ARCHIVED = "archived"
+
+
+def job_id_of(name):
+    """audiobooks/{job_id}/file -> job_id; None for anything else."""
+    if not name.startswith(AUDIOBOOKS_PREFIX) or "\t" in name or "\n" in name:
+        return None
+    parts = name.split("/")
+    return parts[1] if len(parts) >= 3 and parts[1] else None
+
+
+def _sort_key(entry):
+    return entry[0], entry[1]
+
+
+# =============================================================================
+# Deltas (written by the Storage event function)
+# =============================================================================
+
+def _delta_ref(db, name):
+    # Object names contain slashes, which document ids cannot
+    return db.collection(DELTAS_COLLECTION).document(hashlib.sha1(name.encode()).hexdigest())
+
+
+def record_event(db, data, deleted):
+    """
+    Record one object finalize/delete event as the object's pending delta.
+    Events can arrive late or twice; the delta only moves forward in
+    object generation (a delete wins over a finalize of the same one).
+    Returns False for objects outside audiobooks/ and stale events.
+    """
+    from google.cloud import firestore
+
+    name = data["name"]
+    job_id = job_id_of(name)
+    if job_id is None:
+        return False
+    generation = int(data.get("generation") or 0)
+    ref = _delta_ref(db, name)
+    delta = {
+        "name": name,
+        "job_id": job_id,
+        "size": int(data.get("size") or 0),
+        "created": data.get("timeCreated"),
+        "generation": generation,
+        "deleted": deleted,
+    }
+
+    @firestore.transactional
+    def apply(transaction):
+        snapshot = ref.get(transaction=transaction)
+        if snapshot.exists:
+            current = snapshot.to_dict()
+            if (current["generation"], current["deleted"]) >= (generation, deleted):
+                return False
+        transaction.set(ref, delta)
+        return True
+
+    return apply(db.transaction())
+
+
+def touch_job(db, job_id):
+    """Record that a job's status changed, for the next compaction."""
+    from google.cloud import firestore
+
+    db.collection(TOUCHED_COLLECTION).document(job_id).set({"touched_at": firestore.SERVER_TIMESTAMP})
+
+
+def load_deltas(db, start=None, end=None):
+    """Pending deltas as (sorted [(job_id, name, delta)], snapshots)."""
+    snapshots = list(db.collection(DELTAS_COLLECTION).stream())
+    deltas = []
+    for snapshot in snapshots:
+        delta = snapshot.to_dict()
+        if (start and delta["job_id"] < start) or (end and delta["job_id"] >= end):
+            continue
+        deltas.append((delta["job_id"], delta["name"], delta))
+    deltas.sort(key=_sort_key)
+    return deltas, snapshots
+
+
+# =============================================================================
+# Segments
+# =============================================================================
+
+def read_pointer(bucket):
+    """Current pointer {"segment": name, ...} and its object generation, or (None, 0)."""
+    blob = bucket.get_blob(POINTER_NAME)
+    if blob is None:
+        return None, 0
+    return json.loads(blob.download_as_bytes()), blob.generation
+
+
+def read_segment(bucket, segment_name, start=None, end=None):
+    """Stream (job_id, name, size, created, generation) rows of a segment."""
+    with bucket.blob(segment_name).open("rb") as raw, gzip.open(raw, "rt", encoding="utf-8") as rows:
+        for row in rows:
+            job_id, name, size, created, generation = row.rstrip("\n").split("\t")
+            if start and job_id < start:
+                continue
+            if end and job_id >= end:
+                return
+            yield job_id, name, int(size), created, int(generation)
+
+
+def entries(bucket, db, start=None, end=None):
+    """
+    Live objects under audiobooks/ in (job_id, name) order: the current
+    segment merged with the pending deltas, restricted to job ids in
+    [start, end) when given.
+    """
+    pointer, _ = read_pointer(bucket)
+    segment = read_segment(bucket, pointer["segment"], start, end) if pointer else iter(())
+    deltas, _ = load_deltas(db, start, end)
+    return _merge(segment, deltas)
+
+
+def _merge(segment, deltas):
+    """Apply sorted deltas to sorted segment rows; the newer generation wins."""
+    pending = iter(deltas)
+    delta = next(pending, None)
+    for row in segment:
+        while delta is not None and _sort_key(delta) < _sort_key(row):
+            yield from _delta_row(delta)
+            delta = next(pending, None)
+        if delta is not None and _sort_key(delta) == _sort_key(row):
+            if delta[2]["generation"] >= row[4]:
+                yield from _delta_row(delta)
+            else:
+                yield row
+            delta = next(pending, None)
+        else:
+            yield row
+    while delta is not None:
+        yield from _delta_row(delta)
+        delta = next(pending, None)
+
+
+def _delta_row(delta):
+    job_id, name, fields = delta
+    if not fields["deleted"]:
+        yield job_id, name, fields["size"], fields["created"] or "", fields["generation"]
+
+
+def _listing_rows(bucket):
+    blobs = bucket.list_blobs(
+        prefix=AUDIOBOOKS_PREFIX, fields="items(name,size,timeCreated,generation),nextPageToken",
+    )
+    for blob in blobs:
+        job_id = job_id_of(blob.name)
+        if job_id is not None:
+            created = blob.time_created.isoformat() if blob.time_created else ""
+            yield job_id, blob.name, blob.size or 0, created, blob.generation or 0
+
+
+def _listing(bucket):
+    """
+    Stream every object under audiobooks/ from a bucket listing (bootstrap
+    only), in (job_id, name) order.
+
+    The listing is in name order: the objects of a job are contiguous, but
+    jobs come in audiobooks/{job_id}/ order, which differs from job id order
+    when an id is a prefix of another followed by a character sorting
+    before "/" ("a-b/" < "a/"). A job is only held back until no job still
+    to be listed can precede it.
+    """
+    held = []
+    for job_id, group in itertools.groupby(_listing_rows(bucket), key=lambda row: row[0]):
+        heapq.heappush(held, (job_id, list(group)))
+        # Jobs listed later than job_id sort before it only if their id is
+        # a prefix of job_id followed by a character below "/"
+        bound = min([job_id] + [job_id[:i] for i in range(1, len(job_id)) if job_id[i] < "/"])
+        while held and held[0][0] < bound:
+            yield from heapq.heappop(held)[1]
+    while held:
+        yield from heapq.heappop(held)[1]
+
+
+# =============================================================================
+# Compaction
+# =============================================================================
+
+def _job_statuses(db, collection):
+    """(job_id, status) for every job, in id order (first compaction and rebuilds)."""
+    for doc in db.collection(collection).select(["status"]).order_by("__name__").stream():
+        yield doc.id, (doc.to_dict() or {}).get("status") or "unknown"
+
+
+def _read_statuses(bucket, statuses_name):
+    """Stream the (job_id, status) rows of a segment's statuses file."""
+    with bucket.blob(statuses_name).open("rb") as raw, gzip.open(raw, "rt", encoding="utf-8") as rows:
+        for row in rows:
+            job_id, status = row.rstrip("\n").split("\t")
+            yield job_id, status
+
+
+def _lookup_statuses(db, collection, job_ids):
+    """{job_id: status, or None if the job does not exist} of a few jobs."""
+    refs = [db.collection(collection).document(job_id) for job_id in sorted(job_ids)]
+    statuses = {}
+    for snapshot in db.get_all(refs, field_paths=["status"]) if refs else ():
+        statuses[snapshot.id] = ((snapshot.to_dict() or {}).get("status") or "unknown") if snapshot.exists else None
+    return statuses
+
+
+class _Cursor:
+    """Membership tests of ascending keys against a sorted stream."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._row = next(self._rows, None)
+
+    def find(self, key):
+        """The row whose first item is key, or None; keys must not decrease."""
+        while self._row is not None and self._row[0] < key:
+            self._row = next(self._rows, None)
+        return self._row if self._row is not None and self._row[0] == key else None
+
+
+def _delete_unchanged(db, snapshots):
+    """Delete documents that no write has touched since they were read."""
+    bulk = db.bulk_writer()
+    bulk.on_write_error(lambda error: False)
+    for snapshot in snapshots:
+        bulk.delete(snapshot.reference, option=db.write_option(last_update_time=snapshot.update_time))
+    bulk.close()
+
+
+def compact(bucket, db, jobs_collection, rebuild=False, archived_ids=()):
+    """
+    Merge the pending deltas into a new segment, swap the pointer to it and
+    write the summary. The first run (or rebuild=True) starts from a
+    bucket listing and a scan of the jobs instead of the previous segment
+    and its statuses. `archived_ids` (sorted) attributes the files of
+    archived jobs. Returns the summary.
+    """
+    from google.api_core import exceptions as api_exceptions
+
+    pointer, pointer_generation = read_pointer(bucket)
+    touched = list(db.collection(TOUCHED_COLLECTION).stream())
+    deltas, snapshots = load_deltas(db)
+    incremental = bool(pointer and pointer.get("statuses")) and not rebuild
+    if incremental:
+        base = read_segment(bucket, pointer["segment"])
+        known = _Cursor(_read_statuses(bucket, pointer["statuses"]))
+        looked_up = _lookup_statuses(db, jobs_collection, {t.id for t in touched} | {d[0] for d in deltas})
+    else:
+        base = read_segment(bucket, pointer["segment"]) if pointer and not rebuild else _listing(bucket)
+        known = _Cursor(_job_statuses(db, jobs_collection))
+        looked_up = {}
+    archived = _Cursor((job_id,) for job_id in archived_ids)
+
+    def status_of(job_id):
+        if job_id in looked_up and looked_up[job_id] is not None:
+            return looked_up[job_id]
+        row = known.find(job_id) if job_id not in looked_up else None
+        if row is not None:
+            return row[1]
+        return ARCHIVED if archived.find(job_id) else ORPHANED
+
+    now = datetime.now(timezone.utc)
+    stamp = now.strftime('%Y%m%dT%H%M%S%fZ')
+    segment_name = f"{MANIFEST_PREFIX}segment-{stamp}.tsv.gz"
+    statuses_name = f"{MANIFEST_PREFIX}statuses-{stamp}.tsv.gz"
+    summary = {"objects": 0, "bytes": 0, "jobs": 0, "bytes_by_status": {}, "objects_by_status": {}}
+
+    # Streamed to the bucket as they are merged; nothing is held in memory
+    writer = bucket.blob(segment_name).open("wb", ignore_flush=True, content_type="application/gzip")
+    statuses_writer = bucket.blob(statuses_name).open("wb", ignore_flush=True, content_type="application/gzip")
+    with writer, gzip.GzipFile(fileobj=writer, mode="wb", mtime=0) as out, \
+            statuses_writer, gzip.GzipFile(fileobj=statuses_writer, mode="wb", mtime=0) as statuses_out:
+        job_id, status = None, None
+        for row_job_id, name, size, created, generation in _merge(base, deltas):
+            out.write(f"{row_job_id}\t{name}\t{size}\t{created}\t{generation}\n".encode())
+            if row_job_id != job_id:
+                # Rows and statuses are both in id order, so each is a merge-join
+                job_id, status = row_job_id, status_of(row_job_id)
+                statuses_out.write(f"{job_id}\t{status}\n".encode())
+                summary["jobs"] += 1
+            summary["objects"] += 1
+            summary["bytes"] += size
+            summary["bytes_by_status"][status] = summary["bytes_by_status"].get(status, 0) + size
+            summary["objects_by_status"][status] = summary["objects_by_status"].get(status, 0) + 1
+
+    new_pointer = {
+        "segment": segment_name,
+        "statuses": statuses_name,
+        "previous": pointer and pointer["segment"],
+        "previous_statuses": pointer and pointer.get("statuses"),
+        "compacted_at": now.isoformat(),
+    }
+    try:
+        # Another compaction that swapped the pointer first wins
+        bucket.blob(POINTER_NAME).upload_from_string(
+            json.dumps(new_pointer), content_type="application/json", if_generation_match=pointer_generation,
+        )
+    except api_exceptions.PreconditionFailed:
+        bucket.blob(segment_name).delete()
+        bucket.blob(statuses_name).delete()
+        raise
+
+    # Keep the previous segment for readers that are still streaming it
+    for previous in ((pointer or {}).get("previous"), (pointer or {}).get("previous_statuses")):
+        if previous:
+            try:
+                bucket.blob(previous).delete()
+            except api_exceptions.NotFound:
+                pass
+
+    # Drop the merged deltas and touched jobs, except those rewritten by an
+    # event meanwhile, and recent delete tombstones
+    cutoff = now - TOMBSTONE_RETENTION
+    merged = [s for s in snapshots if not (s.to_dict()["deleted"] and s.update_time > cutoff)]
+    _delete_unchanged(db, merged + touched)
+
+    summary.update({
+        "segment": segment_name,
+        "compacted_at": now.isoformat(),
+        "deltas_merged": len(snapshots),
+        "tombstones_kept": len(snapshots) - len(merged),
+        "statuses_looked_up": len(looked_up),
+    })
+    db.collection(SUMMARY_COLLECTION).document(SUMMARY_DOCUMENT).set(summary)
+    return summary
+
+
+def read_summary(db):
+    """The summary written by the last compaction, or None."""
+    snapshot = db.collection(SUMMARY_COLLECTION).document(SUMMARY_DOCUMENT).get()
+    return snapshot.to_dict() if snapshot.exists else None
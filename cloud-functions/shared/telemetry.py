@@ -0,0 +1,232 @@
+"""
+Phase timing for the Cloud Functions.
+
+A span times one phase of an invocation and counts the items and bytes it
+handled. Each finished span is printed as one JSON line, which Cloud
+Logging stores as jsonPayload, so log-based metrics can be built from
+jsonPayload.duration_ms / items / bytes filtered on jsonPayload.span.
+
+    with telemetry.invocation("get_stats"):
+        with telemetry.span("firestore.stream") as span:
+            for doc in span.iterate(query.stream()):
+                ...
+
+Spans only record inside a sampled invocation. With TELEMETRY_ENABLED off
+(the default) invocation() does nothing and span() returns a shared no-op
+object, so instrumented code pays one context lookup per span.
+
+This module lives in cloud-functions/shared and is copied into every
+function archive at deploy time.
+"""
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("TELEMETRY_ENABLED", "false").lower() == "true"
+# Fraction of invocations whose spans are recorded
+SAMPLE_RATE = float(os.environ.get("TELEMETRY_SAMPLE_RATE", "1.0"))
+
+
+def _log_exporter(record):
+    print(json.dumps(record))
+
+
+class MemoryExporter:
+    """Keeps records in a list instead of logging them (tests, benchmarks)."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def spans(self, name=None):
+        return [r for r in self.records if r["kind"] == "span" and name in (None, r["span"])]
+
+
+_exporter = _log_exporter
+_current = contextvars.ContextVar("telemetry_invocation", default=None)
+
+
+def configure(enabled=None, sample_rate=None, exporter=None):
+    """Override the environment settings; returns the previous exporter."""
+    global ENABLED, SAMPLE_RATE, _exporter
+    previous = _exporter
+    if enabled is not None:
+        ENABLED = enabled
+    if sample_rate is not None:
+        SAMPLE_RATE = sample_rate
+    if exporter is not None:
+        _exporter = exporter
+    return previous
+
+
+class _Invocation:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.id = uuid.uuid4().hex[:16]
+
+    def emit(self, kind, fields):
+        _exporter({
+            "severity": "INFO",
+            "message": f"telemetry {kind}",
+            "kind": kind,
+            "invocation": self.name,
+            "invocation_id": self.id,
+            **self.labels,
+            **fields,
+        })
+
+
+class Span:
+    """
+    Wall time of a phase plus item/byte counters. Work done in other
+    threads (or interleaved with other phases) can be timed with measure()
+    or iterate(); that time is reported separately as busy_ms.
+    Counters and busy time are safe to update from several threads.
+    """
+
+    def __init__(self, invocation, name, labels):
+        self._invocation = invocation
+        self.name = name
+        self.labels = labels
+        self.items = 0
+        self.bytes = 0
+        self.busy = None
+        self.error = False
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._ended = False
+
+    def add(self, items=0, bytes=0):
+        with self._lock:
+            self.items += items
+            self.bytes += bytes
+
+    @contextmanager
+    def measure(self):
+        """Time a block as busy time of this span."""
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.busy = (self.busy or 0.0) + elapsed
+
+    def iterate(self, iterable):
+        """Yield from iterable, counting the time spent fetching as busy time."""
+        iterator = iter(iterable)
+        while True:
+            with self.measure():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def end(self):
+        if self._ended:
+            return
+        self._ended = True
+        fields = {
+            "span": self.name,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "items": self.items,
+            "bytes": self.bytes,
+            "error": self.error,
+            **self.labels,
+        }
+        if self.busy is not None:
+            fields["busy_ms"] = round(self.busy * 1000, 3)
+        self._invocation.emit("span", fields)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.error = exc_type is not None and exc_type is not GeneratorExit
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Stand-in returned when nothing is being recorded."""
+    items = bytes = 0
+
+    def add(self, items=0, bytes=0):
+        pass
+
+    @contextmanager
+    def measure(self):
+        yield self
+
+    def iterate(self, iterable):
+        return iterable
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+@contextmanager
+def invocation(name, **labels):
+    """
+    Scope of one function invocation. Decides once whether it is sampled;
+    spans opened inside it (in this thread) are recorded and an invocation
+    record with the total duration is emitted at the end.
+    """
+    if not ENABLED or random.random() >= SAMPLE_RATE:
+        yield None
+        return
+    current = _Invocation(name, labels)
+    token = _current.set(current)
+    started = time.perf_counter()
+    error = False
+    try:
+        yield current
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _current.reset(token)
+        current.emit("invocation", {
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "error": error,
+        })
+
+
+def traced(name, **labels):
+    """Decorator running each call of the function inside invocation(name)."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with invocation(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def span(name, **labels):
+    """A Span of the current sampled invocation, or the shared no-op span."""
+    current = _current.get()
+    if current is None:
+        return NOOP_SPAN
+    return Span(current, name, labels)
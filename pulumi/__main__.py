@@ -14,6 +14,10 @@ import pulumi_gcp as gcp
 import pulumi_docker as docker
 from pulumi import Config, export, Output
 
+from archives import function_source
+from images import content_tag
+import profiles
+
 # =============================================================================
 # Configuración
 # =============================================================================
@@ -25,8 +29,30 @@ PROJECT_ID = gcp_config.require("project")
 REGION = gcp_config.require("region")
 ENVIRONMENT = config.get("environment") or "dev"
 BUCKET_NAME = config.get("bucket_name") or "fognode-audiobooks"
-CLEANUP_SCHEDULE = config.get("cleanup_schedule") or "0 2 * * *"
+# Barrido de respaldo: los archivos de cada job se borran al eliminar su documento
+CLEANUP_SCHEDULE = config.get("cleanup_schedule") or "0 2 * * 0"
 STATS_SCHEDULE = config.get("stats_schedule") or "0 8 * * *"
+MANIFEST_COMPACTION_SCHEDULE = config.get("manifest_compaction_schedule") or "15 * * * *"
+# Archivo de jobs terminados: salen de Firestore pasados ARCHIVE_AFTER_DAYS días
+ARCHIVE_SCHEDULE = config.get("archive_schedule") or "30 3 * * *"
+ARCHIVE_AFTER_DAYS = config.get_int("archive_after_days") or 30
+# Webhooks (separados por comas) que reciben las notificaciones de jobs
+WEBHOOK_URLS = config.get("webhook_urls") or ""
+CLEANUP_SHARDS = config.get_int("cleanup_shards") or 8
+# Los triggers de Firestore deben estar en la ubicación de la base de datos
+FIRESTORE_LOCATION = config.get("firestore_location") or REGION
+# Fracción de eventos de jobs con métricas de fases (cleanup y stats se miden siempre)
+TELEMETRY_SAMPLE_RATE = config.get_float("telemetry_sample_rate") or 0.1
+# Descargas de audio por Cloud CDN con URLs firmadas (requiere cdn_signing_key)
+CDN_ENABLED = config.get_bool("cdn_enabled") or False
+# Dominio propio para servir el CDN por HTTPS; sin él se usa HTTP sobre la IP
+CDN_DOMAIN = config.get("cdn_domain")
+# Escalado y recursos de la API y de cada función (ver profiles.py)
+PERFORMANCE = profiles.load(
+    config.get("performance_profile") or "dev",
+    config.get_object("performance"),
+    cleanup_shards=CLEANUP_SHARDS,
+)
 
 # =============================================================================
 # Habilitar APIs necesarias
@@ -43,6 +69,8 @@ apis = [
     "eventarc.googleapis.com",
     "artifactregistry.googleapis.com",  # Requerido para Cloud Functions v2 y Docker images
 ]
+if CDN_ENABLED:
+    apis += ["compute.googleapis.com", "secretmanager.googleapis.com"]
 
 enabled_apis = []
 for api in apis:
@@ -76,6 +104,27 @@ audio_bucket = gcp.storage.Bucket(
     },
 )
 
+# Archivo frío de jobs terminados (segmentos por fecha que nunca se borran) y
+# el histórico diario de estadísticas (stats/history/, ver notification/history.py)
+archive_bucket = gcp.storage.Bucket(
+    "job-archive-bucket",
+    name=f"fognode-job-archive-{PROJECT_ID}",
+    location=REGION,
+    force_destroy=False,
+    uniform_bucket_level_access=True,
+    lifecycle_rules=[
+        # Los segmentos casi no se leen; el índice de ids se reescribe en cada archivado
+        gcp.storage.BucketLifecycleRuleArgs(
+            condition=gcp.storage.BucketLifecycleRuleConditionArgs(age=30, matches_prefixes=["archive/jobs/dt="]),
+            action=gcp.storage.BucketLifecycleRuleActionArgs(type="SetStorageClass", storage_class="COLDLINE"),
+        )
+    ],
+    labels={
+        "environment": ENVIRONMENT,
+        "project": "fognode-audiobooks",
+    },
+)
+
 # =============================================================================
 # Firestore - Base de datos NoSQL
 # =============================================================================
@@ -137,6 +186,18 @@ scheduler_sa = gcp.serviceaccount.Account(
     display_name="FogNode Cloud Scheduler Service Account",
 )
 
+# =============================================================================
+# Código de las Cloud Functions
+# =============================================================================
+
+# Zips reproducibles nombrados por su hash (ver archives.py): una función solo
+# se reconstruye cuando cambia su código o el de cloud-functions/shared
+cleanup_zip, cleanup_object = function_source("cleanup")
+notification_zip, notification_object = function_source("notification")
+
+# Métricas de fases como logs JSON (ver cloud-functions/shared/telemetry.py)
+TELEMETRY_ENV = {"TELEMETRY_ENABLED": "true", "TELEMETRY_SAMPLE_RATE": "1.0"}
+
 # =============================================================================
 # Cloud Function - Cleanup (Limpieza de archivos huérfanos)
 # =============================================================================
@@ -145,8 +206,8 @@ scheduler_sa = gcp.serviceaccount.Account(
 cleanup_code = gcp.storage.BucketObject(
     "cleanup-function-code",
     bucket=audio_bucket.name,
-    name="cloud-functions/cleanup.zip",
-    source=pulumi.FileArchive("../cloud-functions/cleanup"),
+    name=cleanup_object,
+    source=pulumi.FileAsset(cleanup_zip),
 )
 
 cleanup_function = gcp.cloudfunctionsv2.Function(
@@ -165,18 +226,113 @@ cleanup_function = gcp.cloudfunctionsv2.Function(
         ),
     ),
     service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
-        max_instance_count=1,
-        available_memory="256M",
-        timeout_seconds=300,
+        # Una petición por instancia: dos barridos a la vez competirían por el checkpoint
+        **PERFORMANCE.function("cleanup").service_config(),
         service_account_email=functions_sa.email,
         environment_variables={
             "BUCKET_NAME": audio_bucket.name,
             "FIRESTORE_COLLECTION": "audiobook_jobs",
+            # Deja margen antes del timeout para guardar el checkpoint
+            "CLEANUP_TIME_BUDGET_SECONDS": "240",
+            "ARCHIVE_BUCKET": archive_bucket.name,
+            **TELEMETRY_ENV,
         },
     ),
     opts=pulumi.ResourceOptions(depends_on=enabled_apis),
 )
 
+# =============================================================================
+# Cleanup en paralelo - Coordinador + workers por shard (Pub/Sub)
+# =============================================================================
+
+# Un mensaje por shard de job_id; cada mensaje dispara un worker
+cleanup_shards_topic = gcp.pubsub.Topic(
+    "cleanup-shards-topic",
+    name="fognode-cleanup-shards",
+    message_retention_duration="86400s",
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+)
+
+# IAM: Pub/Sub Publisher (el coordinador publica y los workers se re-encolan)
+pubsub_iam = gcp.projects.IAMMember(
+    "functions-pubsub-iam",
+    project=PROJECT_ID,
+    role="roles/pubsub.publisher",
+    member=functions_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+)
+
+cleanup_worker_function = gcp.cloudfunctionsv2.Function(
+    "cleanup-worker-function",
+    name="fognode-cleanup-worker",
+    location=REGION,
+    description="Worker de limpieza: procesa un shard de job_id",
+    build_config=gcp.cloudfunctionsv2.FunctionBuildConfigArgs(
+        runtime="python311",
+        entry_point="cleanup_shard_worker",
+        source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceArgs(
+            storage_source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceStorageSourceArgs(
+                bucket=audio_bucket.name,
+                object=cleanup_code.name,
+            ),
+        ),
+    ),
+    service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
+        # Un worker por shard en paralelo (ver profiles.load)
+        **PERFORMANCE.function("cleanup-worker").service_config(),
+        service_account_email=functions_sa.email,
+        environment_variables={
+            "BUCKET_NAME": audio_bucket.name,
+            "FIRESTORE_COLLECTION": "audiobook_jobs",
+            "CLEANUP_TIME_BUDGET_SECONDS": "240",
+            "CLEANUP_SHARDS_TOPIC": cleanup_shards_topic.id,
+            "ARCHIVE_BUCKET": archive_bucket.name,
+            **TELEMETRY_ENV,
+        },
+    ),
+    event_trigger=gcp.cloudfunctionsv2.FunctionEventTriggerArgs(
+        trigger_region=REGION,
+        event_type="google.cloud.pubsub.topic.v1.messagePublished",
+        pubsub_topic=cleanup_shards_topic.id,
+        # Un worker que agota el timeout no confirma el mensaje: Pub/Sub lo
+        # reintenta y el shard sigue desde su checkpoint
+        retry_policy="RETRY_POLICY_RETRY",
+        service_account_email=functions_sa.email,
+    ),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis + [pubsub_iam]),
+)
+
+# Cloud Scheduler espera al coordinador todo su timeout (30 min como máximo
+# en un job HTTP) y el coordinador deja de esperar a los workers un minuto antes
+CLEANUP_COORDINATOR_DEADLINE = min(PERFORMANCE.function("cleanup-coordinator").timeout_seconds, 1800)
+
+cleanup_coordinator_function = gcp.cloudfunctionsv2.Function(
+    "cleanup-coordinator-function",
+    name="fognode-cleanup-coordinator",
+    location=REGION,
+    description="Coordinador de limpieza: reparte shards y agrega resultados",
+    build_config=gcp.cloudfunctionsv2.FunctionBuildConfigArgs(
+        runtime="python311",
+        entry_point="cleanup_coordinator",
+        source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceArgs(
+            storage_source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceStorageSourceArgs(
+                bucket=audio_bucket.name,
+                object=cleanup_code.name,
+            ),
+        ),
+    ),
+    service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
+        **PERFORMANCE.function("cleanup-coordinator").service_config(),
+        service_account_email=functions_sa.email,
+        environment_variables={
+            "FIRESTORE_COLLECTION": "audiobook_jobs",
+            "CLEANUP_SHARDS": str(CLEANUP_SHARDS),
+            "CLEANUP_SHARDS_TOPIC": cleanup_shards_topic.id,
+            "COORDINATOR_WAIT_SECONDS": str(max(CLEANUP_COORDINATOR_DEADLINE - 60, 0)),
+        },
+    ),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis + [pubsub_iam]),
+)
+
 # =============================================================================
 # Cloud Function - Stats (Estadísticas)
 # =============================================================================
@@ -184,8 +340,8 @@ cleanup_function = gcp.cloudfunctionsv2.Function(
 stats_code = gcp.storage.BucketObject(
     "stats-function-code",
     bucket=audio_bucket.name,
-    name="cloud-functions/notification.zip",
-    source=pulumi.FileArchive("../cloud-functions/notification"),
+    name=notification_object,
+    source=pulumi.FileAsset(notification_zip),
 )
 
 stats_function = gcp.cloudfunctionsv2.Function(
@@ -204,14 +360,352 @@ stats_function = gcp.cloudfunctionsv2.Function(
         ),
     ),
     service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
-        max_instance_count=1,
-        available_memory="256M",
-        timeout_seconds=60,
+        # Clientes compartidos y caché thread-safe: varias peticiones por instancia
+        **PERFORMANCE.function("stats").service_config(),
+        service_account_email=functions_sa.email,
+        environment_variables={
+            "FIRESTORE_COLLECTION": "audiobook_jobs",
+            "STATS_CACHE_TTL_SECONDS": "60",
+            "STATS_CACHE_STALE_SECONDS": "300",
+            "STATS_HISTORY_BUCKET": archive_bucket.name,
+            **TELEMETRY_ENV,
+        },
+    ),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+)
+
+# Tendencias desde las instantáneas diarias: lee rangos de bytes del bucket de
+# archivo, nunca Firestore
+stats_history_function = gcp.cloudfunctionsv2.Function(
+    "stats-history-function",
+    name="fognode-stats-history",
+    location=REGION,
+    description="Histórico de estadísticas por día, semana o mes",
+    build_config=gcp.cloudfunctionsv2.FunctionBuildConfigArgs(
+        runtime="python311",
+        entry_point="get_stats_history",
+        source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceArgs(
+            storage_source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceStorageSourceArgs(
+                bucket=audio_bucket.name,
+                object=stats_code.name,
+            ),
+        ),
+    ),
+    service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
+        **PERFORMANCE.function("stats-history").service_config(),
+        service_account_email=functions_sa.email,
+        environment_variables={
+            "STATS_HISTORY_BUCKET": archive_bucket.name,
+            **TELEMETRY_ENV,
+        },
+    ),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+)
+
+# Índice para las consultas de get_stats (ver notification/queries.py): listado
+# por estado y rango de fechas, del más reciente al más antiguo. Los conteos por
+# día u hora usan jobs-archive-query-index y, sin estado, el índice simple
+stats_list_query_index = gcp.firestore.Index(
+    "jobs-stats-list-index",
+    project=PROJECT_ID,
+    database="(default)",
+    collection="audiobook_jobs",
+    fields=[
+        gcp.firestore.IndexFieldArgs(field_path="status", order="ASCENDING"),
+        gcp.firestore.IndexFieldArgs(field_path="created_at", order="DESCENDING"),
+        gcp.firestore.IndexFieldArgs(field_path="__name__", order="DESCENDING"),
+    ],
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+)
+
+# =============================================================================
+# Cloud Function - Eventos de jobs (trigger de Firestore)
+# =============================================================================
+
+# IAM: recibir eventos de Eventarc
+eventarc_iam = gcp.projects.IAMMember(
+    "functions-eventarc-iam",
+    project=PROJECT_ID,
+    role="roles/eventarc.eventReceiver",
+    member=functions_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+)
+
+# Cada cambio de estado de un job se publica aquí en protobuf binario (ver
+# cloud-functions/notification/lifecycle.py), ordenado por job_id
+JOB_LIFECYCLE_PROTO = "../cloud-functions/notification/job_lifecycle.proto"
+with open(JOB_LIFECYCLE_PROTO) as f:
+    job_lifecycle_schema = gcp.pubsub.Schema(
+        "job-lifecycle-schema",
+        name="fognode-job-lifecycle",
+        type="PROTOCOL_BUFFER",
+        definition=f.read(),
+        opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+    )
+
+job_lifecycle_topic = gcp.pubsub.Topic(
+    "job-lifecycle-topic",
+    name="fognode-job-lifecycle",
+    message_retention_duration="604800s",
+    schema_settings=gcp.pubsub.TopicSchemaSettingsArgs(
+        schema=job_lifecycle_schema.id,
+        encoding="BINARY",
+    ),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis + [job_lifecycle_schema]),
+)
+
+# Mantiene los contadores de estados, publica los cambios y envía notificaciones
+job_events_function = gcp.cloudfunctionsv2.Function(
+    "job-events-function",
+    name="fognode-job-events",
+    location=FIRESTORE_LOCATION,
+    description="Contadores de estados y notificaciones por cambio de job",
+    build_config=gcp.cloudfunctionsv2.FunctionBuildConfigArgs(
+        runtime="python311",
+        entry_point="on_job_completed",
+        source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceArgs(
+            storage_source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceStorageSourceArgs(
+                bucket=audio_bucket.name,
+                object=stats_code.name,
+            ),
+        ),
+    ),
+    service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
+        **PERFORMANCE.function("job-events").service_config(),
+        service_account_email=functions_sa.email,
+        environment_variables={
+            "FIRESTORE_COLLECTION": "audiobook_jobs",
+            "WEBHOOK_URLS": WEBHOOK_URLS,
+            "JOB_EVENTS_TOPIC": job_lifecycle_topic.id,
+            **TELEMETRY_ENV,
+            "TELEMETRY_SAMPLE_RATE": str(TELEMETRY_SAMPLE_RATE),
+        },
+    ),
+    event_trigger=gcp.cloudfunctionsv2.FunctionEventTriggerArgs(
+        trigger_region=FIRESTORE_LOCATION,
+        event_type="google.cloud.firestore.document.v1.written",
+        # Eventarc solo filtra por base de datos, namespace y ruta del documento,
+        # no por los campos que cambian: las actualizaciones de progreso llegan
+        # igual y la función las descarta mirando la update_mask, sin parsear
+        # los documentos (ver cloud-functions/shared/job_events.py)
+        event_filters=[
+            gcp.cloudfunctionsv2.FunctionEventTriggerEventFilterArgs(
+                attribute="database",
+                value="(default)",
+            ),
+            gcp.cloudfunctionsv2.FunctionEventTriggerEventFilterArgs(
+                attribute="document",
+                value="audiobook_jobs/{jobId}",
+                operator="match-path-pattern",
+            ),
+        ],
+        # Entrega al menos una vez: los contadores ignoran eventos repetidos
+        retry_policy="RETRY_POLICY_RETRY",
+        service_account_email=functions_sa.email,
+    ),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis + [eventarc_iam, pubsub_iam]),
+)
+
+# Borra los archivos de un job en cuanto se elimina su documento
+job_purge_function = gcp.cloudfunctionsv2.Function(
+    "job-purge-function",
+    name="fognode-job-purge",
+    location=FIRESTORE_LOCATION,
+    description="Borra los audios de un job al eliminar su documento",
+    build_config=gcp.cloudfunctionsv2.FunctionBuildConfigArgs(
+        runtime="python311",
+        entry_point="on_job_deleted",
+        source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceArgs(
+            storage_source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceStorageSourceArgs(
+                bucket=audio_bucket.name,
+                object=cleanup_code.name,
+            ),
+        ),
+    ),
+    service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
+        **PERFORMANCE.function("job-purge").service_config(),
+        service_account_email=functions_sa.email,
+        environment_variables={
+            "BUCKET_NAME": audio_bucket.name,
+            "FIRESTORE_COLLECTION": "audiobook_jobs",
+            **TELEMETRY_ENV,
+        },
+    ),
+    event_trigger=gcp.cloudfunctionsv2.FunctionEventTriggerArgs(
+        trigger_region=FIRESTORE_LOCATION,
+        event_type="google.cloud.firestore.document.v1.deleted",
+        event_filters=[
+            gcp.cloudfunctionsv2.FunctionEventTriggerEventFilterArgs(
+                attribute="database",
+                value="(default)",
+            ),
+            gcp.cloudfunctionsv2.FunctionEventTriggerEventFilterArgs(
+                attribute="document",
+                value="audiobook_jobs/{jobId}",
+                operator="match-path-pattern",
+            ),
+        ],
+        # Borrar de nuevo un prefijo ya purgado no hace nada
+        retry_policy="RETRY_POLICY_RETRY",
+        service_account_email=functions_sa.email,
+    ),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis + [eventarc_iam]),
+)
+
+# TTL: los ids de eventos procesados se borran solos después de unos días
+processed_events_ttl = gcp.firestore.Field(
+    "processed-events-ttl",
+    project=PROJECT_ID,
+    database="(default)",
+    collection="stats_processed_events",
+    field="expire_at",
+    ttl_config=gcp.firestore.FieldTtlConfigArgs(),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+)
+
+# TTL: las ventanas horarias de latencia caducan al salir del periodo consultado
+latency_windows_ttl = gcp.firestore.Field(
+    "latency-windows-ttl",
+    project=PROJECT_ID,
+    database="(default)",
+    collection="stats_latency_windows",
+    field="expire_at",
+    ttl_config=gcp.firestore.FieldTtlConfigArgs(),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+)
+
+# =============================================================================
+# Manifiesto de objetos de audiobooks/ (eventos de Storage + compactación)
+# =============================================================================
+
+# IAM: el agente de Storage publica los eventos de objetos en Pub/Sub (Eventarc)
+storage_agent = gcp.storage.get_project_service_account(project=PROJECT_ID)
+storage_agent_pubsub_iam = gcp.projects.IAMMember(
+    "storage-agent-pubsub-iam",
+    project=PROJECT_ID,
+    role="roles/pubsub.publisher",
+    member=f"serviceAccount:{storage_agent.email_address}",
+)
+
+# Eventarc admite un tipo de evento por función: una para altas y otra para bajas
+manifest_event_functions = {}
+for event_name in ("finalized", "deleted"):
+    manifest_event_functions[event_name] = gcp.cloudfunctionsv2.Function(
+        f"manifest-{event_name}-function",
+        name=f"fognode-manifest-{event_name}",
+        location=REGION,
+        description=f"Registra en el manifiesto los objetos {event_name} de audiobooks/",
+        build_config=gcp.cloudfunctionsv2.FunctionBuildConfigArgs(
+            runtime="python311",
+            entry_point="on_object_changed",
+            source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceArgs(
+                storage_source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceStorageSourceArgs(
+                    bucket=audio_bucket.name,
+                    object=cleanup_code.name,
+                ),
+            ),
+        ),
+        service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
+            **PERFORMANCE.function("manifest-events").service_config(),
+            service_account_email=functions_sa.email,
+            environment_variables={
+                "FIRESTORE_COLLECTION": "audiobook_jobs",
+                **TELEMETRY_ENV,
+                "TELEMETRY_SAMPLE_RATE": str(TELEMETRY_SAMPLE_RATE),
+            },
+        ),
+        event_trigger=gcp.cloudfunctionsv2.FunctionEventTriggerArgs(
+            trigger_region=REGION,
+            event_type=f"google.cloud.storage.object.v1.{event_name}",
+            event_filters=[
+                gcp.cloudfunctionsv2.FunctionEventTriggerEventFilterArgs(
+                    attribute="bucket",
+                    value=audio_bucket.name,
+                ),
+            ],
+            # Los eventos repetidos o atrasados no retroceden la generación del objeto
+            retry_policy="RETRY_POLICY_RETRY",
+            service_account_email=functions_sa.email,
+        ),
+        opts=pulumi.ResourceOptions(depends_on=enabled_apis + [eventarc_iam, storage_agent_pubsub_iam]),
+    )
+
+# Fusiona los cambios en un nuevo segmento y actualiza el resumen por estado
+manifest_compact_function = gcp.cloudfunctionsv2.Function(
+    "manifest-compact-function",
+    name="fognode-manifest-compact",
+    location=REGION,
+    description="Compacta el manifiesto de objetos de audiobooks/",
+    build_config=gcp.cloudfunctionsv2.FunctionBuildConfigArgs(
+        runtime="python311",
+        entry_point="compact_manifest",
+        source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceArgs(
+            storage_source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceStorageSourceArgs(
+                bucket=audio_bucket.name,
+                object=cleanup_code.name,
+            ),
+        ),
+    ),
+    service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
+        # Una compactación a la vez; el puntero usa generación como precondición
+        **PERFORMANCE.function("manifest-compact").service_config(),
         service_account_email=functions_sa.email,
+        environment_variables={
+            "BUCKET_NAME": audio_bucket.name,
+            "FIRESTORE_COLLECTION": "audiobook_jobs",
+            "ARCHIVE_BUCKET": archive_bucket.name,
+            **TELEMETRY_ENV,
+        },
     ),
     opts=pulumi.ResourceOptions(depends_on=enabled_apis),
 )
 
+# =============================================================================
+# Archivo de jobs terminados (Firestore -> segmentos en el bucket de archivo)
+# =============================================================================
+
+# Índice para la consulta del archivado: status IN (...) y created_at < corte
+archive_query_index = gcp.firestore.Index(
+    "jobs-archive-query-index",
+    project=PROJECT_ID,
+    database="(default)",
+    collection="audiobook_jobs",
+    fields=[
+        gcp.firestore.IndexFieldArgs(field_path="status", order="ASCENDING"),
+        gcp.firestore.IndexFieldArgs(field_path="created_at", order="ASCENDING"),
+    ],
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+)
+
+job_archive_function = gcp.cloudfunctionsv2.Function(
+    "job-archive-function",
+    name="fognode-job-archive",
+    location=REGION,
+    description="Archiva los jobs terminados antiguos fuera de Firestore",
+    build_config=gcp.cloudfunctionsv2.FunctionBuildConfigArgs(
+        runtime="python311",
+        entry_point="archive_finished_jobs",
+        source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceArgs(
+            storage_source=gcp.cloudfunctionsv2.FunctionBuildConfigSourceStorageSourceArgs(
+                bucket=audio_bucket.name,
+                object=cleanup_code.name,
+            ),
+        ),
+    ),
+    service_config=gcp.cloudfunctionsv2.FunctionServiceConfigArgs(
+        # Un archivado a la vez; el índice de ids usa generación como precondición
+        **PERFORMANCE.function("job-archive").service_config(),
+        service_account_email=functions_sa.email,
+        environment_variables={
+            "BUCKET_NAME": audio_bucket.name,
+            "FIRESTORE_COLLECTION": "audiobook_jobs",
+            "ARCHIVE_BUCKET": archive_bucket.name,
+            "ARCHIVE_AFTER_DAYS": str(ARCHIVE_AFTER_DAYS),
+            **TELEMETRY_ENV,
+        },
+    ),
+    opts=pulumi.ResourceOptions(depends_on=enabled_apis + [archive_query_index]),
+)
+
 # =============================================================================
 # IAM - Permitir que Scheduler invoque las funciones
 # =============================================================================
@@ -224,6 +718,66 @@ cleanup_invoker = gcp.cloudrun.IamMember(
     member=scheduler_sa.email.apply(lambda email: f"serviceAccount:{email}"),
 )
 
+cleanup_coordinator_invoker = gcp.cloudrun.IamMember(
+    "cleanup-coordinator-invoker",
+    location=REGION,
+    service=cleanup_coordinator_function.name,
+    role="roles/run.invoker",
+    member=scheduler_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+)
+
+# El trigger de Pub/Sub invoca al worker con la cuenta de las funciones
+cleanup_worker_invoker = gcp.cloudrun.IamMember(
+    "cleanup-worker-invoker",
+    location=REGION,
+    service=cleanup_worker_function.name,
+    role="roles/run.invoker",
+    member=functions_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+)
+
+job_events_invoker = gcp.cloudrun.IamMember(
+    "job-events-invoker",
+    location=FIRESTORE_LOCATION,
+    service=job_events_function.name,
+    role="roles/run.invoker",
+    member=functions_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+)
+
+job_purge_invoker = gcp.cloudrun.IamMember(
+    "job-purge-invoker",
+    location=FIRESTORE_LOCATION,
+    service=job_purge_function.name,
+    role="roles/run.invoker",
+    member=functions_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+)
+
+manifest_event_invokers = [
+    gcp.cloudrun.IamMember(
+        f"manifest-{event_name}-invoker",
+        location=REGION,
+        service=function.name,
+        role="roles/run.invoker",
+        member=functions_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+    )
+    for event_name, function in manifest_event_functions.items()
+]
+
+manifest_compact_invoker = gcp.cloudrun.IamMember(
+    "manifest-compact-invoker",
+    location=REGION,
+    service=manifest_compact_function.name,
+    role="roles/run.invoker",
+    member=scheduler_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+)
+
+job_archive_invoker = gcp.cloudrun.IamMember(
+    "job-archive-invoker",
+    location=REGION,
+    service=job_archive_function.name,
+    role="roles/run.invoker",
+    member=scheduler_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+)
+
 stats_invoker = gcp.cloudrun.IamMember(
     "stats-invoker",
     location=REGION,
@@ -233,27 +787,75 @@ stats_invoker = gcp.cloudrun.IamMember(
 )
 
 # =============================================================================
-# Cloud Scheduler - Limpieza diaria
+# Cloud Scheduler - Limpieza de respaldo (semanal por defecto)
 # =============================================================================
 
 cleanup_scheduler = gcp.cloudscheduler.Job(
     "cleanup-scheduler",
+    # Conserva el nombre de cuando era diario: renombrarlo reemplaza el job
     name="fognode-cleanup-daily",
-    description="Limpieza diaria de archivos huérfanos",
+    description="Barrido de respaldo de archivos huérfanos",
     schedule=CLEANUP_SCHEDULE,
     time_zone="America/Lima",
     region=REGION,
     http_target=gcp.cloudscheduler.JobHttpTargetArgs(
         http_method="POST",
-        uri=cleanup_function.service_config.uri,
+        # El coordinador reparte la limpieza entre CLEANUP_SHARDS workers
+        uri=cleanup_coordinator_function.service_config.uri,
         oidc_token=gcp.cloudscheduler.JobHttpTargetOidcTokenArgs(
             service_account_email=scheduler_sa.email,
         ),
     ),
+    # Los reintentos llevan la misma hora programada y se unen a esa ejecución
+    attempt_deadline=f"{CLEANUP_COORDINATOR_DEADLINE}s",
     retry_config=gcp.cloudscheduler.JobRetryConfigArgs(
         retry_count=3,
     ),
-    opts=pulumi.ResourceOptions(depends_on=[cleanup_invoker]),
+    opts=pulumi.ResourceOptions(depends_on=[cleanup_coordinator_invoker]),
+)
+
+# =============================================================================
+# Cloud Scheduler - Compactación del manifiesto
+# =============================================================================
+
+manifest_compaction_scheduler = gcp.cloudscheduler.Job(
+    "manifest-compaction-scheduler",
+    name="fognode-manifest-compaction",
+    description="Compacta el manifiesto de objetos y el resumen de bytes por estado",
+    schedule=MANIFEST_COMPACTION_SCHEDULE,
+    time_zone="America/Lima",
+    region=REGION,
+    http_target=gcp.cloudscheduler.JobHttpTargetArgs(
+        http_method="POST",
+        uri=manifest_compact_function.service_config.uri,
+        oidc_token=gcp.cloudscheduler.JobHttpTargetOidcTokenArgs(
+            service_account_email=scheduler_sa.email,
+        ),
+    ),
+    attempt_deadline="540s",
+    opts=pulumi.ResourceOptions(depends_on=[manifest_compact_invoker]),
+)
+
+# =============================================================================
+# Cloud Scheduler - Archivo de jobs terminados (diario)
+# =============================================================================
+
+job_archive_scheduler = gcp.cloudscheduler.Job(
+    "job-archive-scheduler",
+    name="fognode-job-archive",
+    description="Mueve los jobs terminados antiguos al archivo frío",
+    schedule=ARCHIVE_SCHEDULE,
+    time_zone="America/Lima",
+    region=REGION,
+    http_target=gcp.cloudscheduler.JobHttpTargetArgs(
+        http_method="POST",
+        uri=job_archive_function.service_config.uri,
+        oidc_token=gcp.cloudscheduler.JobHttpTargetOidcTokenArgs(
+            service_account_email=scheduler_sa.email,
+        ),
+    ),
+    attempt_deadline="540s",
+    opts=pulumi.ResourceOptions(depends_on=[job_archive_invoker]),
 )
 
 # =============================================================================
@@ -269,7 +871,8 @@ stats_scheduler = gcp.cloudscheduler.Job(
     region=REGION,
     http_target=gcp.cloudscheduler.JobHttpTargetArgs(
         http_method="GET",
-        uri=stats_function.service_config.uri,
+        # Cada reporte añade la instantánea del día al histórico
+        uri=stats_function.service_config.uri.apply(lambda uri: f"{uri}?snapshot=true"),
         oidc_token=gcp.cloudscheduler.JobHttpTargetOidcTokenArgs(
             service_account_email=scheduler_sa.email,
         ),
@@ -320,36 +923,207 @@ fognode_firestore_iam = gcp.projects.IAMMember(
     member=fognode_api_sa.email.apply(lambda email: f"serviceAccount:{email}"),
 )
 
+# =============================================================================
+# Cloud CDN - Descarga de audios sin pasar por Cloud Run
+# =============================================================================
+
+# La API firma URLs del CDN para audiobooks/ en lugar de servir los archivos:
+# las descargas (con Range) salen de la caché y no ocupan instancias de TTS
+cdn_envs = []
+if CDN_ENABLED:
+    # Clave de 16 bytes en base64 url-safe, p. ej.:
+    #   head -c 16 /dev/urandom | base64 | tr +/ -_ | pulumi config set --secret fognode:cdn_signing_key
+    CDN_SIGNING_KEY = config.require_secret("cdn_signing_key")
+    CDN_KEY_NAME = "fognode-audio-key"
+
+    audio_backend_bucket = gcp.compute.BackendBucket(
+        "audio-backend-bucket",
+        name="fognode-audio-cdn",
+        bucket_name=audio_bucket.name,
+        enable_cdn=True,
+        cdn_policy=gcp.compute.BackendBucketCdnPolicyArgs(
+            # Los audios no cambian una vez escritos
+            cache_mode="CACHE_ALL_STATIC",
+            default_ttl=86400,
+            max_ttl=604800,
+            client_ttl=3600,
+            serve_while_stale=86400,
+            # Una URL firmada vale su tiempo de vida; la caché la sirve sin volver a validarla
+            signed_url_cache_max_age_sec=3600,
+            negative_caching=True,
+        ),
+        opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+    )
+
+    audio_cdn_key = gcp.compute.BackendBucketSignedUrlKey(
+        "audio-cdn-signed-url-key",
+        name=CDN_KEY_NAME,
+        backend_bucket=audio_backend_bucket.name,
+        key_value=CDN_SIGNING_KEY,
+    )
+
+    # IAM: el bucket es privado; Cloud CDN lo lee con su propia cuenta de servicio
+    cdn_fill_iam = gcp.storage.BucketIAMMember(
+        "cdn-fill-bucket-iam",
+        bucket=audio_bucket.name,
+        role="roles/storage.objectViewer",
+        member=f"serviceAccount:service-{gcp.organizations.get_project(project_id=PROJECT_ID).number}@cloud-cdn-fill.iam.gserviceaccount.com",
+        opts=pulumi.ResourceOptions(depends_on=[audio_cdn_key]),
+    )
+
+    # Solo audiobooks/ llega al bucket; cualquier otra ruta se redirige ahí
+    # (y sin una URL firmada el CDN responde 403)
+    audiobooks_redirect = gcp.compute.URLMapDefaultUrlRedirectArgs(path_redirect="/audiobooks/", strip_query=True)
+    audio_url_map = gcp.compute.URLMap(
+        "audio-cdn-url-map",
+        name="fognode-audio-cdn",
+        default_url_redirect=audiobooks_redirect,
+        host_rules=[gcp.compute.URLMapHostRuleArgs(hosts=["*"], path_matcher="audiobooks")],
+        path_matchers=[
+            gcp.compute.URLMapPathMatcherArgs(
+                name="audiobooks",
+                default_url_redirect=gcp.compute.URLMapPathMatcherDefaultUrlRedirectArgs(
+                    path_redirect="/audiobooks/",
+                    strip_query=True,
+                ),
+                path_rules=[
+                    gcp.compute.URLMapPathMatcherPathRuleArgs(
+                        paths=["/audiobooks/*"],
+                        service=audio_backend_bucket.self_link,
+                    ),
+                ],
+            ),
+        ],
+    )
+
+    audio_cdn_ip = gcp.compute.GlobalAddress(
+        "audio-cdn-ip",
+        name="fognode-audio-cdn-ip",
+        opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+    )
+
+    if CDN_DOMAIN:
+        audio_cdn_certificate = gcp.compute.ManagedSslCertificate(
+            "audio-cdn-certificate",
+            name="fognode-audio-cdn-cert",
+            managed=gcp.compute.ManagedSslCertificateManagedArgs(domains=[CDN_DOMAIN]),
+        )
+        audio_cdn_proxy = gcp.compute.TargetHttpsProxy(
+            "audio-cdn-https-proxy",
+            name="fognode-audio-cdn-https",
+            url_map=audio_url_map.self_link,
+            ssl_certificates=[audio_cdn_certificate.self_link],
+        )
+        cdn_port, cdn_url = "443", f"https://{CDN_DOMAIN}"
+    else:
+        audio_cdn_proxy = gcp.compute.TargetHttpProxy(
+            "audio-cdn-http-proxy",
+            name="fognode-audio-cdn-http",
+            url_map=audio_url_map.self_link,
+        )
+        cdn_port, cdn_url = "80", Output.concat("http://", audio_cdn_ip.address)
+
+    audio_cdn_forwarding_rule = gcp.compute.GlobalForwardingRule(
+        "audio-cdn-forwarding-rule",
+        name="fognode-audio-cdn",
+        target=audio_cdn_proxy.self_link,
+        ip_address=audio_cdn_ip.address,
+        port_range=cdn_port,
+    )
+
+    # La API firma con la clave guardada en Secret Manager
+    cdn_key_secret = gcp.secretmanager.Secret(
+        "cdn-signing-key-secret",
+        secret_id="fognode-cdn-signing-key",
+        replication=gcp.secretmanager.SecretReplicationArgs(
+            auto=gcp.secretmanager.SecretReplicationAutoArgs(),
+        ),
+        opts=pulumi.ResourceOptions(depends_on=enabled_apis),
+    )
+    cdn_key_secret_version = gcp.secretmanager.SecretVersion(
+        "cdn-signing-key-secret-version",
+        secret=cdn_key_secret.id,
+        secret_data=CDN_SIGNING_KEY,
+    )
+    fognode_cdn_secret_iam = gcp.secretmanager.SecretIamMember(
+        "fognode-api-cdn-secret-iam",
+        secret_id=cdn_key_secret.id,
+        role="roles/secretmanager.secretAccessor",
+        member=fognode_api_sa.email.apply(lambda email: f"serviceAccount:{email}"),
+    )
+
+    cdn_envs = [
+        gcp.cloudrunv2.ServiceTemplateContainerEnvArgs(name="CDN_URL", value=cdn_url),
+        gcp.cloudrunv2.ServiceTemplateContainerEnvArgs(name="CDN_KEY_NAME", value=CDN_KEY_NAME),
+        gcp.cloudrunv2.ServiceTemplateContainerEnvArgs(
+            name="CDN_SIGNING_KEY",
+            value_source=gcp.cloudrunv2.ServiceTemplateContainerEnvValueSourceArgs(
+                secret_key_ref=gcp.cloudrunv2.ServiceTemplateContainerEnvValueSourceSecretKeyRefArgs(
+                    secret=cdn_key_secret.secret_id,
+                    version="latest",
+                ),
+            ),
+        ),
+    ]
+
 # =============================================================================
 # Build & Push Docker Image del Fog Node
 # =============================================================================
 
-# Docker image name en Artifact Registry
-fognode_image_name = Output.concat(
+FOGNODE_CONTEXT = "../../fog_node"  # Ruta relativa desde pulumi/ al directorio fog_node
+FOGNODE_DOCKERFILE = "../../fog_node/Dockerfile"
+
+# Repositorio de la imagen en Artifact Registry
+fognode_image_repo = Output.concat(
     REGION,
     "-docker.pkg.dev/",
     PROJECT_ID,
     "/",
     docker_repo.repository_id,
-    "/fognode-api:latest",
+    "/fognode-api",
+)
+
+# Tag inmutable con el hash del contexto de build (ver images.py): si fog_node
+# no cambia, el tag tampoco y no hay build ni push
+FOGNODE_IMAGE_TAG = content_tag(FOGNODE_CONTEXT, FOGNODE_DOCKERFILE)
+
+# Los builds reutilizan las capas de la última imagen publicada en :buildcache
+# (BuildKit incluye los metadatos de caché en la propia imagen)
+fognode_build = docker.DockerBuildArgs(
+    context=FOGNODE_CONTEXT,
+    dockerfile=FOGNODE_DOCKERFILE,
+    platform="linux/amd64",
+    builder_version=docker.BuilderVersion.BUILDER_BUILD_KIT,
+    args={"BUILDKIT_INLINE_CACHE": "1"},
+    cache_from=docker.CacheFromArgs(
+        images=[fognode_image_repo.apply(lambda repo: f"{repo}:buildcache")],
+    ),
+)
+
+fognode_registry = docker.RegistryArgs(
+    server=Output.concat(REGION, "-docker.pkg.dev"),
 )
 
 # Construir y subir imagen Docker
 # Nota: Requiere Docker instalado y autenticado con gcloud
 fognode_app_image = docker.Image(
     "fognode-api-image",
-    image_name=fognode_image_name,
-    build=docker.DockerBuildArgs(
-        context="../../fog_node",  # Ruta relativa desde pulumi/ al directorio fog_node
-        dockerfile="../../fog_node/Dockerfile",
-        platform="linux/amd64",
-    ),
-    registry=docker.RegistryArgs(
-        server=Output.concat(REGION, "-docker.pkg.dev"),
-    ),
+    image_name=Output.concat(fognode_image_repo, ":", FOGNODE_IMAGE_TAG),
+    build=fognode_build,
+    registry=fognode_registry,
     opts=pulumi.ResourceOptions(depends_on=[docker_repo]),
 )
 
+# Mover :buildcache a la imagen recién publicada; el build sale entero de la
+# caché local, así que solo cuesta el push del tag
+fognode_cache_image = docker.Image(
+    "fognode-api-buildcache",
+    image_name=Output.concat(fognode_image_repo, ":buildcache"),
+    build=fognode_build,
+    registry=fognode_registry,
+    opts=pulumi.ResourceOptions(depends_on=[fognode_app_image]),
+)
+
 # =============================================================================
 # Cloud Run Service - Fog Node API
 # =============================================================================
@@ -362,17 +1136,15 @@ fognode_api_service = gcp.cloudrunv2.Service(
         service_account=fognode_api_sa.email,
         containers=[
             gcp.cloudrunv2.ServiceTemplateContainerArgs(
-                image=fognode_app_image.image_name,
+                # Fijada por digest: la revisión solo cambia si cambia la imagen
+                image=fognode_app_image.repo_digest,
                 ports=[
                     gcp.cloudrunv2.ServiceTemplateContainerPortArgs(
                         container_port=8000,
                     ),
                 ],
                 resources=gcp.cloudrunv2.ServiceTemplateContainerResourcesArgs(
-                    limits={
-                        "cpu": "2",
-                        "memory": "2Gi",
-                    },
+                    **PERFORMANCE.api.resources(),
                 ),
                 envs=[
                     gcp.cloudrunv2.ServiceTemplateContainerEnvArgs(
@@ -393,13 +1165,11 @@ fognode_api_service = gcp.cloudrunv2.Service(
                         name="GOOGLE_APPLICATION_CREDENTIALS",
                         value="",  # Vacío para forzar uso de ADC del Service Account
                     ),
+                    *cdn_envs,
                 ],
             ),
         ],
-        scaling=gcp.cloudrunv2.ServiceTemplateScalingArgs(
-            min_instance_count=0,
-            max_instance_count=10,
-        ),
+        **PERFORMANCE.api.template(),
     ),
     opts=pulumi.ResourceOptions(
         depends_on=[
@@ -407,7 +1177,7 @@ fognode_api_service = gcp.cloudrunv2.Service(
             fognode_storage_iam,
             fognode_firestore_iam,
             fognode_app_image,
-        ]
+        ] + ([cdn_key_secret_version, fognode_cdn_secret_iam] if CDN_ENABLED else [])
     ),
 )
 
@@ -427,12 +1197,24 @@ fognode_api_iam = gcp.cloudrunv2.ServiceIamBinding(
 export("bucket_name", audio_bucket.name)
 export("bucket_url", audio_bucket.url)
 export("cleanup_function_url", cleanup_function.service_config.uri)
+export("cleanup_coordinator_url", cleanup_coordinator_function.service_config.uri)
+export("cleanup_shards_topic", cleanup_shards_topic.name)
+export("job_lifecycle_topic", job_lifecycle_topic.name)
 export("stats_function_url", stats_function.service_config.uri)
+export("stats_history_url", stats_history_function.service_config.uri)
+export("job_purge_function", job_purge_function.name)
+export("manifest_compact_url", manifest_compact_function.service_config.uri)
+export("archive_bucket", archive_bucket.name)
+export("job_archive_url", job_archive_function.service_config.uri)
 export("cleanup_scheduler", cleanup_scheduler.name)
 export("stats_scheduler", stats_scheduler.name)
 export("functions_service_account", functions_sa.email)
 export("fognode_api_url", fognode_api_service.uri)
+export("fognode_api_image", fognode_app_image.repo_digest)
 export("fognode_api_service_account", fognode_api_sa.email)
+if CDN_ENABLED:
+    export("cdn_url", cdn_url)
+    export("cdn_key_name", CDN_KEY_NAME)
 
 # Resumen de arquitectura
 export("architecture_summary", Output.concat(
@@ -445,7 +1227,14 @@ export("architecture_summary", Output.concat(
     "║  ├── Cloud Storage: ", audio_bucket.name, "\n",
     "║  ├── Firestore: audiobook_jobs                                   ║\n",
     "║  ├── Cloud Function: fognode-cleanup                             ║\n",
+    "║  ├── Cloud Function: fognode-cleanup-coordinator (+ workers)     ║\n",
     "║  ├── Cloud Function: fognode-stats                               ║\n",
+    "║  ├── Cloud Function: fognode-stats-history                       ║\n",
+    "║  ├── Cloud Function: fognode-job-events (Firestore trigger)      ║\n",
+    "║  ├── Pub/Sub: fognode-job-lifecycle (cambios de estado)          ║\n",
+    "║  ├── Cloud Function: fognode-job-purge (Firestore delete)        ║\n",
+    "║  ├── Cloud Function: fognode-manifest-* (Storage events)         ║\n",
+    "║  ├── Cloud Function: fognode-job-archive (archivo frío)          ║\n",
     "║  ├── Cloud Scheduler: cleanup-daily                              ║\n",
     "║  └── Cloud Scheduler: stats-daily                                ║\n",
     "║                                                                  ║\n",
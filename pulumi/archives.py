@@ -0,0 +1,57 @@
+"""
+Zips reproducibles del código de las Cloud Functions.
+
+Cada zip contiene los archivos de cloud-functions/<función> más los módulos
+comunes de cloud-functions/shared, en orden alfabético y con fecha y permisos
+fijos, así que el mismo código produce siempre los mismos bytes. El objeto se
+nombra con el hash del zip: si el código no cambia, el nombre tampoco, y
+Pulumi no vuelve a subirlo ni a reconstruir la función.
+"""
+import hashlib
+import os
+import zipfile
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cloud-functions")
+BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".build")
+
+# Fecha mínima que admite el formato zip
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def source_files(name, functions_dir=FUNCTIONS_DIR):
+    """{nombre en el zip: ruta} de la función; sus archivos pisan a los comunes."""
+    files = {}
+    for directory in (os.path.join(functions_dir, "shared"), os.path.join(functions_dir, name)):
+        for entry in sorted(os.listdir(directory)):
+            path = os.path.join(directory, entry)
+            if os.path.isfile(path) and not entry.endswith((".pyc", ".pyo")):
+                files[entry] = path
+    return files
+
+
+def build_zip(files, path):
+    """Escribe un zip determinista con `files` y devuelve su sha256."""
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for arcname in sorted(files):
+            info = zipfile.ZipInfo(arcname, date_time=ZIP_EPOCH)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            info.create_system = 3  # Unix, para que external_attr no dependa del SO
+            with open(files[arcname], "rb") as f:
+                archive.writestr(info, f.read(), compresslevel=9)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def function_source(name, functions_dir=FUNCTIONS_DIR, build_dir=BUILD_DIR):
+    """
+    Construye el zip de la función en build_dir.
+    Devuelve (ruta del zip, nombre del objeto en el bucket con el hash).
+    """
+    os.makedirs(build_dir, exist_ok=True)
+    path = os.path.join(build_dir, f"{name}.zip")
+    digest = build_zip(source_files(name, functions_dir), path)
+    return path, f"cloud-functions/{name}-{digest[:16]}.zip"
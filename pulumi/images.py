@@ -0,0 +1,56 @@
+"""
+Tags de imagen Docker derivados del contenido del contexto de build.
+
+El tag es el hash de los archivos que Docker recibiría como contexto (se
+respeta .dockerignore), así que el mismo código produce siempre el mismo tag
+y un `pulumi up` sin cambios no genera una revisión nueva de Cloud Run.
+"""
+import fnmatch
+import hashlib
+import os
+
+
+def ignore_patterns(context):
+    """Patrones de .dockerignore (sin comentarios ni excepciones con "!")."""
+    path = os.path.join(context, ".dockerignore")
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        lines = (line.strip() for line in f)
+        return [line.strip("/") for line in lines if line and not line.startswith(("#", "!"))]
+
+
+def _ignored(relative, patterns):
+    # Un patrón que coincide con un directorio excluye todo lo que contiene
+    parts = relative.split("/")
+    prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    return any(fnmatch.fnmatch(prefix, pattern) for pattern in patterns for prefix in prefixes)
+
+
+def context_digest(context):
+    """sha256 de las rutas, permisos y contenidos del contexto de build."""
+    patterns = ignore_patterns(context)
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(context):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, context).replace(os.sep, "/")
+            if _ignored(relative, patterns):
+                continue
+            digest.update(f"{relative}\0{os.stat(path).st_mode & 0o111:o}\0".encode())
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 16), b""):
+                    digest.update(chunk)
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def content_tag(context, dockerfile=None):
+    """Tag inmutable para la imagen construida desde `context`."""
+    digest = hashlib.sha256(context_digest(context).encode())
+    # El Dockerfile puede vivir fuera del contexto
+    if dockerfile and os.path.isfile(dockerfile):
+        with open(dockerfile, "rb") as f:
+            digest.update(f.read())
+    return f"src-{digest.hexdigest()[:16]}"
@@ -0,0 +1,232 @@
+"""
+Perfiles de rendimiento por stack para Cloud Run y las Cloud Functions.
+
+Un perfil fija instancias mínimas/máximas, concurrencia por instancia, CPU,
+memoria y timeout de cada componente. Se elige uno de los perfiles
+predefinidos con `fognode:performance_profile` y se pueden sobrescribir
+campos sueltos con `fognode:performance`:
+
+    fognode:performance_profile: low-latency
+    fognode:performance:
+      api:
+        max_instances: 20
+      stats:
+        memory: 512M
+
+Los valores se validan al cargar el perfil, antes de crear ningún recurso.
+"""
+import re
+from dataclasses import dataclass, field, fields, replace
+from typing import Dict, Optional
+
+# Funciones que no pueden tener más de una instancia ni peticiones en paralelo:
+# el barrido guarda un checkpoint; la compactación y el archivado, un puntero
+SINGLETONS = ("cleanup", "cleanup-coordinator", "manifest-compact", "job-archive")
+
+# Límites de Cloud Functions (2nd gen) y Cloud Run
+MAX_EVENT_TIMEOUT_SECONDS = 540
+MAX_HTTP_TIMEOUT_SECONDS = 3600
+MAX_CONCURRENCY = 1000
+
+_MEMORY = re.compile(r"^\d+(M|Mi|G|Gi)$")
+
+
+class ProfileError(ValueError):
+    """Configuración de rendimiento inválida en Pulumi.<stack>.yaml."""
+
+
+def _cpus(cpu):
+    return float(cpu) if cpu is not None else 0.0
+
+
+@dataclass(frozen=True)
+class FunctionProfile:
+    """Escalado y recursos de una Cloud Function."""
+
+    max_instances: int
+    min_instances: int = 0
+    concurrency: int = 1
+    cpu: Optional[str] = None  # None: la CPU que corresponde a la memoria
+    memory: str = "256M"
+    timeout_seconds: int = 60
+    http: bool = False  # Las funciones HTTP admiten timeouts más largos
+
+    def validate(self, name):
+        _check(name, self.min_instances >= 0, "min_instances no puede ser negativo")
+        _check(name, 1 <= self.max_instances, "max_instances debe ser al menos 1")
+        _check(name, self.min_instances <= self.max_instances, "min_instances supera a max_instances")
+        _check(name, 1 <= self.concurrency <= MAX_CONCURRENCY, f"concurrency debe estar entre 1 y {MAX_CONCURRENCY}")
+        # Cloud Functions solo admite varias peticiones por instancia con 1 CPU o más
+        _check(name, self.concurrency == 1 or _cpus(self.cpu) >= 1, "concurrency > 1 requiere cpu >= 1")
+        _check(name, bool(_MEMORY.match(self.memory)), f"memoria inválida: {self.memory!r}")
+        limit = MAX_HTTP_TIMEOUT_SECONDS if self.http else MAX_EVENT_TIMEOUT_SECONDS
+        _check(name, 1 <= self.timeout_seconds <= limit, f"timeout_seconds debe estar entre 1 y {limit}")
+        if name in SINGLETONS:
+            _check(name, self.max_instances == 1 and self.concurrency == 1,
+                   "debe ejecutarse en una sola instancia con concurrency 1")
+        return self
+
+    def service_config(self):
+        """Argumentos de FunctionServiceConfigArgs."""
+        args = {
+            "min_instance_count": self.min_instances,
+            "max_instance_count": self.max_instances,
+            "max_instance_request_concurrency": self.concurrency,
+            "available_memory": self.memory,
+            "timeout_seconds": self.timeout_seconds,
+        }
+        if self.cpu is not None:
+            args["available_cpu"] = self.cpu
+        return args
+
+
+@dataclass(frozen=True)
+class ServiceProfile:
+    """Escalado y recursos del servicio Cloud Run de la API."""
+
+    max_instances: int
+    min_instances: int = 0
+    concurrency: int = 80
+    cpu: str = "2"
+    memory: str = "2Gi"
+    cpu_always_allocated: bool = False  # False: CPU solo durante las peticiones
+    startup_cpu_boost: bool = False
+    timeout_seconds: int = 300
+
+    def validate(self, name):
+        _check(name, self.min_instances >= 0, "min_instances no puede ser negativo")
+        _check(name, 1 <= self.max_instances, "max_instances debe ser al menos 1")
+        _check(name, self.min_instances <= self.max_instances, "min_instances supera a max_instances")
+        _check(name, 1 <= self.concurrency <= MAX_CONCURRENCY, f"concurrency debe estar entre 1 y {MAX_CONCURRENCY}")
+        _check(name, self.concurrency == 1 or _cpus(self.cpu) >= 1, "concurrency > 1 requiere cpu >= 1")
+        _check(name, not self.cpu_always_allocated or _cpus(self.cpu) >= 1,
+               "cpu_always_allocated requiere cpu >= 1")
+        _check(name, bool(_MEMORY.match(self.memory)), f"memoria inválida: {self.memory!r}")
+        _check(name, 1 <= self.timeout_seconds <= MAX_HTTP_TIMEOUT_SECONDS,
+               f"timeout_seconds debe estar entre 1 y {MAX_HTTP_TIMEOUT_SECONDS}")
+        return self
+
+    def template(self):
+        """Argumentos de ServiceTemplateArgs (sin contenedores)."""
+        return {
+            "max_instance_request_concurrency": self.concurrency,
+            "timeout": f"{self.timeout_seconds}s",
+            "scaling": {"min_instance_count": self.min_instances, "max_instance_count": self.max_instances},
+        }
+
+    def resources(self):
+        """Argumentos de ServiceTemplateContainerResourcesArgs."""
+        return {
+            "limits": {"cpu": self.cpu, "memory": self.memory},
+            "cpu_idle": not self.cpu_always_allocated,
+            "startup_cpu_boost": self.startup_cpu_boost,
+        }
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """Perfil de un stack: la API de Cloud Run y cada Cloud Function."""
+
+    name: str
+    api: ServiceProfile
+    functions: Dict[str, FunctionProfile] = field(default_factory=dict)
+
+    def function(self, name):
+        return self.functions[name]
+
+
+# Valores de partida de cada función; los perfiles solo indican lo que cambian
+_BASE_FUNCTIONS = {
+    "cleanup": FunctionProfile(max_instances=1, timeout_seconds=300, http=True),
+    "cleanup-worker": FunctionProfile(max_instances=8, timeout_seconds=300),
+    "cleanup-coordinator": FunctionProfile(max_instances=1, timeout_seconds=300, http=True),
+    "stats": FunctionProfile(max_instances=1, concurrency=20, cpu="1", http=True),
+    "stats-history": FunctionProfile(max_instances=1, concurrency=20, cpu="1", http=True),
+    "job-events": FunctionProfile(max_instances=10, concurrency=10, cpu="1"),
+    "job-purge": FunctionProfile(max_instances=10, timeout_seconds=120),
+    "manifest-events": FunctionProfile(max_instances=10, concurrency=10, cpu="1"),
+    "manifest-compact": FunctionProfile(max_instances=1, memory="512M", timeout_seconds=540, http=True),
+    "job-archive": FunctionProfile(max_instances=1, memory="512M", timeout_seconds=540, http=True),
+}
+
+
+def _preset(name, api, **functions):
+    # cleanup_worker=... -> "cleanup-worker"
+    merged = dict(_BASE_FUNCTIONS)
+    for key, changes in functions.items():
+        function_name = key.replace("_", "-")
+        merged[function_name] = replace(_BASE_FUNCTIONS[function_name], **changes)
+    return PerformanceProfile(name=name, api=api, functions=merged)
+
+
+PRESETS = {
+    # Lo mínimo para desarrollar: todo escala a cero
+    "dev": _preset("dev", ServiceProfile(max_instances=10)),
+    # Mucho TTS en segundo plano: CPU siempre asignada y pocas peticiones por
+    # instancia en la API; barridos y compactaciones con más memoria y tiempo
+    "batch-heavy": _preset(
+        "batch-heavy",
+        ServiceProfile(max_instances=20, concurrency=4, cpu="4", memory="8Gi",
+                       cpu_always_allocated=True, timeout_seconds=900),
+        cleanup_worker={"memory": "512M", "timeout_seconds": 540},
+        manifest_compact={"memory": "1G"},
+        job_events={"max_instances": 50},
+        manifest_events={"max_instances": 50},
+    ),
+    # Sin arranques en frío en el camino del usuario: instancias mínimas
+    # calientes y CPU extra al arrancar
+    "low-latency": _preset(
+        "low-latency",
+        ServiceProfile(max_instances=20, min_instances=1, startup_cpu_boost=True, cpu_always_allocated=True),
+        stats={"min_instances": 1, "max_instances": 3, "memory": "512M"},
+        job_events={"min_instances": 1, "max_instances": 20},
+    ),
+}
+
+
+def _check(name, condition, message):
+    if not condition:
+        raise ProfileError(f"fognode:performance.{name}: {message}")
+
+
+def _override(name, profile, changes):
+    """Aplica los campos de `changes` comprobando nombres y tipos."""
+    if not isinstance(changes, dict):
+        raise ProfileError(f"fognode:performance.{name}: se esperaba un objeto")
+    types = {f.name: f.type for f in fields(profile) if f.name != "http"}
+    for key, value in changes.items():
+        if key not in types:
+            raise ProfileError(f"fognode:performance.{name}: campo desconocido {key!r}")
+        expected = types[key] if types[key] in (bool, int) else str
+        if expected is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)  # cpu: 2 en YAML llega como número
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise ProfileError(f"fognode:performance.{name}.{key}: se esperaba {expected.__name__}")
+        changes = {**changes, key: value}
+    return replace(profile, **changes)
+
+
+def load(preset="dev", overrides=None, cleanup_shards=None):
+    """
+    Perfil `preset` con los campos de `overrides` aplicados y validado.
+    `cleanup_shards` da una instancia de cleanup-worker por shard, salvo
+    que `overrides` fije otro max_instances.
+    """
+    if preset not in PRESETS:
+        raise ProfileError(f"fognode:performance_profile: {preset!r} no existe ({', '.join(PRESETS)})")
+    profile = PRESETS[preset]
+    api = profile.api
+    functions = dict(profile.functions)
+    if cleanup_shards is not None:
+        functions["cleanup-worker"] = replace(functions["cleanup-worker"], max_instances=cleanup_shards)
+    for name, changes in (overrides or {}).items():
+        if name == "api":
+            api = _override(name, api, changes)
+        elif name in functions:
+            functions[name] = _override(name, functions[name], changes)
+        else:
+            raise ProfileError(f"fognode:performance: componente desconocido {name!r}")
+    api.validate("api")
+    for name, function in functions.items():
+        function.validate(name)
+    return replace(profile, api=api, functions=functions)
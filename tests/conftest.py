@@ -0,0 +1,480 @@
+"""
+Shared fixtures: the Cloud Functions are plain directories (each with its
+own main.py) that expect cloud-functions/shared on the import path, as in
+their deployed zips.
+"""
+import copy
+import importlib.util
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FUNCTIONS_DIR = os.path.join(REPO_ROOT, "cloud-functions")
+PULUMI_DIR = os.path.join(REPO_ROOT, "pulumi")
+
+for directory in (
+    os.path.join(FUNCTIONS_DIR, "shared"),
+    os.path.join(FUNCTIONS_DIR, "notification"),
+    PULUMI_DIR,
+):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+
+def load_function(name):
+    """Import cloud-functions/<name>/main.py as `<name>_main`."""
+    module_name = f"{name}_main"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    directory = os.path.join(FUNCTIONS_DIR, name)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(directory, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def cleanup_main():
+    pytest.importorskip("functions_framework")
+    pytest.importorskip("google.cloud.storage")
+    return load_function("cleanup")
+
+
+@pytest.fixture
+def notification_main():
+    pytest.importorskip("functions_framework")
+    pytest.importorskip("google.cloud.firestore")
+    return load_function("notification")
+
+
+STACK_CONFIG = {
+    "gcp:project": "fognode-test",
+    "gcp:region": "us-central1",
+    "fognode:environment": "dev",
+}
+
+
+class Stack:
+    """Resources and exports of one mocked run of the Pulumi program."""
+
+    def __init__(self):
+        self.resources = {}
+        self.exports = {}
+
+    def of_type(self, type_):
+        return {name: inputs for (kind, name), inputs in self.resources.items() if kind == type_}
+
+
+def run_stack(config=None):
+    """
+    Run pulumi/__main__.py against pulumi.runtime.set_mocks with the given
+    fognode config (on top of STACK_CONFIG); returns a Stack.
+    """
+    pulumi = pytest.importorskip("pulumi")
+    pytest.importorskip("pulumi_gcp")
+    pytest.importorskip("pulumi_docker")
+    import runpy
+
+    stack = Stack()
+
+    class Mocks(pulumi.runtime.Mocks):
+        def new_resource(self, args):
+            stack.resources[(args.typ, args.name)] = args.inputs
+            # Stand-ins for the outputs the provider would compute
+            outputs = {
+                "name": args.name, "uri": f"https://{args.name}.run.app", "email": f"{args.name}@test",
+                "address": "203.0.113.10", "repoDigest": f"{args.name}@sha256:0",
+                "selfLink": f"https://compute.googleapis.com/{args.name}", **args.inputs,
+            }
+            if "serviceConfig" in outputs:
+                outputs["serviceConfig"] = {"uri": f"https://{args.name}.run.app", **outputs["serviceConfig"]}
+            return f"{args.name}-id", outputs
+
+        def call(self, args):
+            if args.token == "gcp:organizations/getProject:getProject":
+                return {"number": "123456789", "projectId": STACK_CONFIG["gcp:project"]}
+            return {}
+
+    pulumi.runtime.set_mocks(Mocks(), project="fognode-infrastructure", stack="test", preview=False)
+    pulumi.runtime.set_all_config({**STACK_CONFIG, **{f"fognode:{k}": v for k, v in (config or {}).items()}})
+
+    def export(name, value):
+        stack.exports[name] = value
+
+    @pulumi.runtime.test
+    def program():
+        # Pulumi runs the program from its directory
+        original, cwd = pulumi.export, os.getcwd()
+        pulumi.export = export
+        os.chdir(PULUMI_DIR)
+        try:
+            runpy.run_path("__main__.py", run_name="__pulumi_main__")
+        finally:
+            pulumi.export = original
+            os.chdir(cwd)
+        names = list(stack.exports)
+        return pulumi.Output.all(*stack.exports.values()).apply(
+            lambda values: stack.exports.update(zip(names, values))
+        )
+
+    program()
+    return stack
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self.update_time = update_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocument) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, field_paths=None, transaction=None):
+        return FakeSnapshot(self, self.db.docs.get(self.path), self.db.update_times.get(self.path))
+
+    def set(self, data, merge=False):
+        self.db.write(self.path, data, merge=merge)
+
+    def create(self, data):
+        from google.api_core import exceptions as api_exceptions
+
+        if self.path in self.db.docs:
+            raise api_exceptions.AlreadyExists(f"{'/'.join(self.path)} already exists")
+        self.db.write(self.path, data)
+
+    def update(self, data):
+        assert self.path in self.db.docs, f"{self.path} does not exist"
+        self.db.write(self.path, data, update=True)
+
+    def delete(self):
+        self.db.docs.pop(self.path, None)
+
+    def collection(self, name):
+        return FakeQuery(self.db, self.path + (name,))
+
+
+class FakeQuery:
+    """
+    A collection or a query on it. Filters and ordering are ignored:
+    documents stream in insertion order, as the tests lay them out.
+    """
+
+    def __init__(self, db, path, limit=None, after=None):
+        self.db = db
+        self.path = path
+        self._limit = limit
+        self._after = after
+
+    def document(self, doc_id):
+        return FakeDocument(self.db, self.path + (doc_id,))
+
+    def where(self, *args, **kwargs):
+        return self
+
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def select(self, fields):
+        return self
+
+    def limit(self, count):
+        return FakeQuery(self.db, self.path, count, self._after)
+
+    def start_after(self, snapshot):
+        return FakeQuery(self.db, self.path, self._limit, snapshot.id)
+
+    def stream(self, transaction=None):
+        assert self.path not in self.db.unscannable, f"{'/'.join(self.path)} was scanned"
+        ids = [path[-1] for path in self.db.docs if path[:-1] == self.path]
+        if self._after is not None:
+            ids = ids[ids.index(self._after) + 1:]
+        return [self.document(doc_id).get() for doc_id in ids[:self._limit]]
+
+
+class FakeWriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class FakeBulkWriter:
+    """Applies each write at once; deletes of `undeletable` documents fail."""
+
+    def __init__(self, db):
+        self.db = db
+        self._on_result = lambda *args: None
+
+    def on_write_error(self, callback):
+        pass
+
+    def on_write_result(self, callback):
+        self._on_result = callback
+
+    def update(self, reference, data, option=None):
+        reference.update(data)
+        self._on_result(reference, FakeWriteResult(self.db.update_times[reference.path]), self)
+
+    def delete(self, reference, option=None):
+        if reference.path in self.db.undeletable:
+            return
+        reference.delete()
+        self._on_result(reference, FakeWriteResult(datetime.now(timezone.utc)), self)
+
+    def close(self):
+        pass
+
+
+class FakeBatch:
+    """Buffers writes until commit(); also serves as a transaction."""
+
+    _max_attempts = 1
+    _read_only = False
+    _id = b"fake"
+
+    def __init__(self, db):
+        self.db = db
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(lambda: reference.set(data, merge=merge))
+
+    def create(self, reference, data):
+        self._writes.append(lambda: reference.create(data))
+
+    def update(self, reference, data):
+        self._writes.append(lambda: reference.update(data))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        for write in self._writes:
+            write()
+        self._writes = []
+
+    # The hooks firestore.transactional drives a transaction through
+    def _clean_up(self):
+        self._writes = []
+
+    def _begin(self, retry_id=None):
+        pass
+
+    def _commit(self):
+        self.commit()
+
+    def _rollback(self):
+        self._writes = []
+
+
+class FakeFirestore:
+    """
+    In-memory stand-in for the parts of firestore.Client the functions use.
+    Documents are kept in `docs` under their path, such as
+    ("audiobook_jobs", "job-1") or ("cleanup_runs", "run-1", "shards", "0"),
+    and writes apply Increment, ArrayUnion, DELETE_FIELD and SERVER_TIMESTAMP
+    the way Firestore does.
+    """
+
+    def __init__(self, docs=None, undeletable=(), unscannable=()):
+        self.docs = dict(docs or {})
+        self.update_times = {path: datetime.now(timezone.utc) for path in self.docs}
+        self.undeletable = set(undeletable)  # Paths whose bulk deletes fail
+        self.unscannable = set(unscannable)  # Collection paths that must not be streamed
+
+    def collection(self, name):
+        return FakeQuery(self, (name,))
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        return [reference.get() for reference in references]
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self):
+        return FakeBatch(self)
+
+    def bulk_writer(self):
+        return FakeBulkWriter(self)
+
+    def write_option(self, **kwargs):
+        return kwargs
+
+    def collection_docs(self, name):
+        """{doc_id: data} of one collection."""
+        return {path[-1]: data for path, data in self.docs.items() if path[:-1] == (name,)}
+
+    def write(self, path, data, merge=False, update=False):
+        from google.cloud import firestore
+
+        def apply(fields, key, value):
+            if value is firestore.DELETE_FIELD:
+                fields.pop(key, None)
+            elif value is firestore.SERVER_TIMESTAMP:
+                fields[key] = datetime.now(timezone.utc)
+            elif isinstance(value, firestore.Increment):
+                fields[key] = fields.get(key, 0) + value.value
+            elif isinstance(value, firestore.ArrayUnion):
+                current = fields.get(key, [])
+                fields[key] = current + [v for v in value.values if v not in current]
+            elif merge and isinstance(value, dict) and value:
+                # Merges reach into nested maps; an empty map is a value like any other
+                if not isinstance(fields.get(key), dict):
+                    fields[key] = {}
+                for nested_key, nested_value in value.items():
+                    apply(fields[key], nested_key, nested_value)
+            else:
+                fields[key] = copy.deepcopy(value)
+
+        document = copy.deepcopy(self.docs.get(path, {})) if merge or update else {}
+        for key, value in data.items():
+            fields, name = document, key
+            if update:  # update() takes dotted field paths
+                *parents, name = key.split(".")
+                for parent in parents:
+                    fields = fields.setdefault(parent, {})
+            apply(fields, name, value)
+        self.docs[path] = document
+        self.update_times[path] = datetime.now(timezone.utc)
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def size(self):
+        return len(self.bucket.objects[self.name])
+
+    @property
+    def generation(self):
+        return self.bucket.generations.get(self.name)
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        self.bucket.check_generation(self.name, if_generation_match)
+        self.bucket.write(self.name, data.encode() if isinstance(data, str) else data)
+
+    def download_as_bytes(self, start=None, end=None, checksum=None):
+        from google.api_core import exceptions as api_exceptions
+
+        if self.name not in self.bucket.objects:
+            raise api_exceptions.NotFound(self.name)
+        data = self.bucket.objects[self.name]
+        if start is None:
+            return data
+        if start >= len(data):
+            raise api_exceptions.RequestRangeNotSatisfiable(self.name)
+        return data[start:None if end is None else end + 1]
+
+    def compose(self, sources, if_generation_match=None):
+        self.bucket.check_generation(self.name, if_generation_match)
+        self.bucket.write(self.name, b"".join(self.bucket.objects[source.name] for source in sources))
+
+    def delete(self):
+        self.bucket.delete_blob(self.name)
+
+
+class FakeListing:
+    """What list_blobs returns: pages of blobs, or of prefixes with a delimiter."""
+
+    def __init__(self, pages):
+        self._pages = pages
+        self.next_page_token = None
+
+    @property
+    def pages(self):
+        for page, token in self._pages:
+            self.next_page_token = token
+            yield page
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+class FakePage(list):
+    def __init__(self, blobs=(), prefixes=()):
+        super().__init__(blobs)
+        self.prefixes = set(prefixes)
+        self.num_items = len(self)
+
+
+class FakeBucket:
+    """
+    In-memory Cloud Storage bucket: objects by name, listed in name order
+    in pages of `page_size`, with the page token being the last name or
+    prefix of the previous page.
+    """
+
+    def __init__(self, objects=None, page_size=1000):
+        self.objects = {}
+        self.generations = {}
+        self.page_size = page_size
+        for name, data in (objects or {}).items():
+            self.write(name, data)
+
+    def write(self, name, data):
+        self.objects[name] = data
+        self.generations[name] = self.generations.get(name, 0) + 1
+
+    def check_generation(self, name, expected):
+        from google.api_core import exceptions as api_exceptions
+
+        if expected is not None and self.generations.get(name, 0) != expected:
+            raise api_exceptions.PreconditionFailed(name)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return FakeBlob(self, name) if name in self.objects else None
+
+    def delete_blob(self, name):
+        self.objects.pop(name, None)
+
+    def list_blobs(self, prefix="", delimiter=None, page_token=None, start_offset=None, end_offset=None,
+                   fields=None):
+        entries = []  # (name or prefix, is_prefix), in listing order
+        for name in sorted(self.objects):
+            if not name.startswith(prefix) or (start_offset and name < start_offset) \
+                    or (end_offset and name >= end_offset):
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                entry = (prefix + rest[:rest.index(delimiter) + 1], True)
+                if not entries or entries[-1] != entry:
+                    entries.append(entry)
+            else:
+                entries.append((name, False))
+        if page_token:
+            entries = [entry for entry in entries if entry[0] > page_token]
+        pages = []
+        for i in range(0, len(entries), self.page_size):
+            chunk = entries[i:i + self.page_size]
+            page = FakePage(
+                [self.blob(name) for name, is_prefix in chunk if not is_prefix],
+                [name for name, is_prefix in chunk if is_prefix],
+            )
+            pages.append((page, chunk[-1][0] if i + self.page_size < len(entries) else None))
+        return FakeListing(pages)
@@ -0,0 +1,55 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import analytics
+from conftest import FakeFirestore
+from sketches import TDigest
+
+NOW = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+
+
+def job(completed_at, seconds, status="completed"):
+    return {"status": status, "created_at": completed_at - timedelta(seconds=seconds), "completed_at": completed_at}
+
+
+def test_digest_quantiles_stay_close_and_survive_merges_and_storage():
+    values = list(range(1, 10001))
+    random.Random(3).shuffle(values)
+    whole, left, right = TDigest(), TDigest(), TDigest()
+    for i, value in enumerate(values):
+        whole.add(value)
+        (left if i % 2 else right).add(value)
+    merged = TDigest.from_dict(left.merge(right).to_dict())
+
+    for digest in (whole, merged):
+        assert digest.count == 10000
+        for q in (0.5, 0.95, 0.99):
+            assert digest.quantile(q) == pytest.approx(q * 10000, rel=0.01)
+    assert TDigest().quantile(0.5) is None
+
+
+def test_closed_windows_are_persisted_and_not_rescanned():
+    pytest.importorskip("google.cloud.firestore")
+    db = FakeFirestore({
+        ("audiobook_jobs", "job-1"): job(NOW.replace(hour=9, minute=10), 600),
+        ("audiobook_jobs", "job-2"): job(NOW.replace(hour=9, minute=40), 1200),
+        ("audiobook_jobs", "job-3"): job(NOW.replace(hour=12, minute=10), 300),
+        ("audiobook_jobs", "job-4"): job(NOW.replace(hour=11), 60, status="processing"),
+    })
+
+    first = analytics.processing_analytics(db, now=NOW)
+    windows = db.collection_docs(analytics.WINDOWS_COLLECTION)
+    assert max(windows) == "2026030111"  # The current hour stays open
+    assert windows["2026030109"]["completions"] == 2
+
+    # Jobs in persisted windows are not read again
+    del db.docs[("audiobook_jobs", "job-1")], db.docs[("audiobook_jobs", "job-2")]
+    second = analytics.processing_analytics(db, now=NOW)
+
+    assert second == first
+    assert second["processing_time_seconds"]["count"] == 3
+    assert second["processing_time_seconds"]["p50"] == 600
+    assert second["throughput"]["completions_last_hour"] == 1
+    assert second["throughput"]["completions_last_24h"] == 3
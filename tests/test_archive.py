@@ -0,0 +1,117 @@
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("google.cloud.firestore")
+
+import archive  # noqa: E402
+from conftest import FakeFirestore  # noqa: E402
+
+
+class Blob:
+    def __init__(self, bucket, name, generation=None):
+        self.bucket = bucket
+        self.name = name
+        self._generation = generation
+
+    @property
+    def generation(self):
+        return self.bucket.objects[self.name][0]
+
+    def open(self, mode, if_generation_match=None, **kwargs):
+        bucket, name = self.bucket, self.name
+        if mode == "rb":
+            generation = self._generation or bucket.objects[name][0]
+            return io.BytesIO(bucket.versions[(name, generation)])
+        if if_generation_match is not None:
+            assert bucket.objects.get(name, (0,))[0] == if_generation_match
+
+        class Writer(io.BytesIO):
+            def close(self):
+                if any(part in name for part in bucket.failing):
+                    raise ConnectionError(f"upload of {name} failed")
+                bucket.write(name, self.getvalue())
+                super().close()
+
+        return Writer()
+
+    def delete(self):
+        self.bucket.objects.pop(self.name, None)
+
+
+class Bucket:
+    def __init__(self, failing=()):
+        self.objects = {}  # name -> (generation, data)
+        self.versions = {}
+        self.failing = failing  # Uploads of names containing any of these fail
+        self.generations = 0
+
+    def write(self, name, data):
+        self.generations += 1
+        self.objects[name] = (self.generations, data)
+        self.versions[(name, self.generations)] = data
+
+    def blob(self, name, generation=None):
+        return Blob(self, name, generation)
+
+    def get_blob(self, name):
+        return Blob(self, name) if name in self.objects else None
+
+    def lines(self, name):
+        return gzip.decompress(self.objects[name][1]).decode().splitlines()
+
+
+JOBS = "audiobook_jobs"
+
+
+def jobs():
+    day = datetime(2026, 1, 5, 9, tzinfo=timezone.utc)
+    # Streamed in this order, as the query would
+    return {
+        (JOBS, "job-b"): {"status": "completed", "created_at": day},
+        (JOBS, "job-c"): {"status": "failed", "created_at": day + timedelta(days=1)},
+        # Firestore orders strings after timestamps, so the first day comes round again
+        (JOBS, "job-a"): {"status": "completed", "created_at": "2026-01-05T10:00:00"},
+    }
+
+
+def archive_run(db, bucket):
+    return archive.archive_finished(db, bucket, JOBS, timedelta(days=30), limit=100)
+
+
+def test_a_partition_that_comes_round_again_gets_its_own_segment():
+    db, bucket = FakeFirestore(jobs()), Bucket()
+
+    result = archive_run(db, bucket)
+
+    assert result["archived"] == 3
+    first_day = [name for name in result["segments"] if "dt=2026-01-05" in name]
+    assert len(first_day) == 2
+    archived = {json.loads(line)["id"] for name in first_day for line in bucket.lines(name)}
+    assert archived == {"job-a", "job-b"}
+    summary = archive.read_summary(db)
+    assert sorted(summary["partitions"]["2026-01-05"]["segments"]) == first_day
+    assert bucket.lines(archive.IDS_NAME) == ["job-a", "job-b", "job-c"]
+
+
+def test_only_jobs_whose_delete_went_through_stay_in_the_index():
+    db, bucket = FakeFirestore(jobs(), undeletable=[(JOBS, "job-c")]), Bucket()
+
+    result = archive_run(db, bucket)
+
+    assert (result["archived"], result["kept"], result["index_ids"]) == (2, 1, 2)
+    assert bucket.lines(archive.IDS_NAME) == ["job-a", "job-b"]
+    assert archive.ARCHIVED_FIELD not in db.docs[(JOBS, "job-c")]
+
+
+def test_jobs_are_kept_when_their_segment_is_not_written_out():
+    db, bucket = FakeFirestore(jobs()), Bucket(failing=["dt=2026-01-06"])
+
+    with pytest.raises(ConnectionError):
+        archive_run(db, bucket)
+
+    assert set(db.collection_docs(JOBS)) == {"job-a", "job-b", "job-c"}
+    assert archive.IDS_NAME not in bucket.objects
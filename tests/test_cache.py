@@ -0,0 +1,32 @@
+import json
+
+import cache
+
+
+class Request:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+
+def test_etag_survives_recomputation_with_a_new_timestamp(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: clock[0])
+    bodies = iter([
+        json.dumps({"total_jobs": 4, "completed": 3, "timestamp": "2026-10-17T08:00:00"}),
+        json.dumps({"total_jobs": 4, "completed": 3, "timestamp": "2026-10-17T08:05:00"}),
+        json.dumps({"total_jobs": 5, "completed": 3, "timestamp": "2026-10-17T08:10:00"}),
+    ])
+    stats_cache = cache.ResponseCache(ttl=60)
+
+    body, status, headers = stats_cache.serve(Request(), "stats", lambda: next(bodies))
+    assert status == 200
+    etag = headers["ETag"]
+
+    clock[0] = 300.0  # Expired: the body is recomputed with a new timestamp
+    _, status, headers = stats_cache.serve(Request({"If-None-Match": etag}), "stats", lambda: next(bodies))
+    assert (status, headers["X-Cache"], headers["ETag"]) == (304, "MISS", etag)
+
+    clock[0] = 600.0  # The counts changed
+    _, status, headers = stats_cache.serve(Request({"If-None-Match": etag}), "stats", lambda: next(bodies))
+    assert status == 200
+    assert headers["ETag"] != etag
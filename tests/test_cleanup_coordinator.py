@@ -0,0 +1,82 @@
+import base64
+import json
+
+from conftest import FakeFirestore
+
+
+class Publisher:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, data):
+        self.messages.append(json.loads(data))
+
+        class Done:
+            def result(self):
+                return "id"
+
+        return Done()
+
+
+class Request:
+    def __init__(self, headers=None, **args):
+        self.args = args
+        self.headers = headers or {}
+
+
+def test_coordinator_runs_started_in_the_same_second_get_distinct_ids(cleanup_main, monkeypatch):
+    firestore = FakeFirestore()
+    publisher = Publisher()
+    monkeypatch.setattr(cleanup_main, "get_firestore_client", lambda: firestore)
+    monkeypatch.setattr(cleanup_main, "get_publisher", lambda: publisher)
+    monkeypatch.setattr(cleanup_main, "COORDINATOR_WAIT_SECONDS", 0)
+
+    first = json.loads(cleanup_main.cleanup_coordinator(Request(shards="2"))[0])
+    second = json.loads(cleanup_main.cleanup_coordinator(Request(shards="2"))[0])
+
+    assert first["run_id"] != second["run_id"]
+    assert {m["run_id"] for m in publisher.messages} == {first["run_id"], second["run_id"]}
+
+
+def test_scheduler_retries_of_one_scheduled_run_join_it(cleanup_main, monkeypatch):
+    firestore = FakeFirestore()
+    publisher = Publisher()
+    monkeypatch.setattr(cleanup_main, "get_firestore_client", lambda: firestore)
+    monkeypatch.setattr(cleanup_main, "get_publisher", lambda: publisher)
+    monkeypatch.setattr(cleanup_main, "COORDINATOR_WAIT_SECONDS", 0)
+    scheduled = {"X-CloudScheduler-ScheduleTime": "2026-10-18T07:00:00Z"}
+
+    first = json.loads(cleanup_main.cleanup_coordinator(Request(scheduled, shards="2"))[0])
+    retry = json.loads(cleanup_main.cleanup_coordinator(Request(scheduled, shards="2"))[0])
+
+    assert first["run_id"] == retry["run_id"] == "scheduled-20261018T070000Z"
+    assert len(publisher.messages) == 2
+
+
+def test_shard_checkpoints_belong_to_their_run(cleanup_main):
+    shard = cleanup_main.shard_ranges(2)[0]
+    assert cleanup_main.checkpoint_key("prefix", shard, "run-1") != cleanup_main.checkpoint_key("prefix", shard, "run-2")
+    assert cleanup_main.checkpoint_key("prefix") == "orphaned_files_prefix"
+
+
+def test_redelivered_message_of_a_reported_shard_is_skipped(cleanup_main, monkeypatch):
+    firestore = FakeFirestore()
+    monkeypatch.setattr(cleanup_main, "get_firestore_client", lambda: firestore)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the shard was swept again")
+
+    monkeypatch.setattr(cleanup_main, "run_sweep", fail)
+    shard = {"index": 0, "count": 2, "start": None, "end": "8"}
+    task = {"run_id": "run-1", "mode": "prefix", "shard": shard}
+    shard_doc = firestore.collection(cleanup_main.CLEANUP_RUNS_COLLECTION).document("run-1") \
+        .collection("shards").document("0")
+    shard_doc.set({"status": "success", "sweep_complete": True})
+
+    event = {"message": {"data": base64.b64encode(json.dumps(task).encode()).decode()}}
+
+    class CloudEvent:
+        data = event
+
+    cleanup_main.cleanup_shard_worker(CloudEvent())
+    assert shard_doc.get().to_dict()["status"] == "success"
@@ -0,0 +1,108 @@
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+
+
+class FailingBucket:
+    """Every delete raises the given exception, as a dropped connection would."""
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def delete_blob(self, name):
+        self.calls += 1
+        raise self.error
+
+
+@pytest.fixture
+def deleter_factory(cleanup_main, monkeypatch):
+    monkeypatch.setattr(cleanup_main, "_recording_batch_class", lambda: lambda client: contextlib.nullcontext())
+    monkeypatch.setattr(cleanup_main.AdaptiveBackoff, "wait", lambda self: None)
+
+    def make(bucket, **kwargs):
+        return cleanup_main.BatchDeleter(None, bucket, **kwargs)
+
+    return make
+
+
+@pytest.mark.parametrize("error", [
+    pytest.param("requests", id="connection-error"),
+    pytest.param("auth", id="refresh-error"),
+])
+def test_transport_errors_count_as_failed_and_do_not_abort(deleter_factory, error):
+    if error == "requests":
+        from requests.exceptions import ConnectionError as failure
+    else:
+        from google.auth.exceptions import RefreshError as failure
+
+    bucket = FailingBucket(failure("boom"))
+    deleter = deleter_factory(bucket, batch_size=2, workers=2, max_attempts=3)
+    for i in range(5):
+        deleter.add(f"audiobooks/job/{i}.wav")
+    stats = deleter.close()
+
+    assert stats["failed_deletes"] == 5
+    assert stats["orphaned_files_deleted"] == 0
+    # 3 batches, each tried max_attempts times
+    assert bucket.calls == 9
+
+
+def test_backoff_doubles_while_throttled_and_recovers_on_success(cleanup_main):
+    backoff = cleanup_main.AdaptiveBackoff(initial=0.5, maximum=4.0)
+    delays = []
+    for _ in range(5):
+        backoff.on_throttled()
+        delays.append(backoff._delay)
+    assert delays == [0.5, 1.0, 2.0, 4.0, 4.0]
+    assert backoff.throttled == 5
+
+    for _ in range(4):
+        backoff.on_success()
+    assert backoff._delay == 0.0
+
+
+class ThrottlingBucket:
+    """Answers each object's deletes with its scripted status codes, then 204."""
+
+    def __init__(self, statuses):
+        self.statuses = {name: list(codes) for name, codes in statuses.items()}
+        self.batches = []
+
+    def delete_blob(self, name):
+        self.batches[-1].append(name)
+
+    def batch(self, client):
+        bucket = self
+
+        class Batch:
+            def __enter__(self):
+                bucket.batches.append([])
+                return self
+
+            def __exit__(self, *exc_info):
+                codes = [(bucket.statuses.get(name) or [204]).pop(0) for name in bucket.batches[-1]]
+                self.responses = [SimpleNamespace(status_code=code) for code in codes]
+                return False
+
+        return Batch()
+
+
+def test_throttled_objects_are_retried_alone_until_storage_recovers(cleanup_main, monkeypatch):
+    bucket = ThrottlingBucket({"a.wav": [429, 503], "b.wav": [404], "c.wav": [403]})
+    monkeypatch.setattr(cleanup_main, "_recording_batch_class", lambda: bucket.batch)
+    monkeypatch.setattr(cleanup_main.AdaptiveBackoff, "wait", lambda self: None)
+    deleter = cleanup_main.BatchDeleter(None, bucket, batch_size=10, workers=1)
+    for name in ("a.wav", "b.wav", "c.wav", "d.wav"):
+        deleter.add(name)
+    deleter.drain()
+
+    assert bucket.batches == [["a.wav", "b.wav", "c.wav", "d.wav"], ["a.wav"], ["a.wav"]]
+    # Two throttled attempts doubled the delay, the clean one halved it
+    assert deleter.backoff._delay == 0.5
+
+    deleter.add("e.wav")
+    stats = deleter.close()
+    assert (stats["orphaned_files_deleted"], stats["failed_deletes"], stats["throttled_batches"]) == (4, 1, 2)
+    assert deleter.backoff._delay == 0.0
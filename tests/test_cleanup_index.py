@@ -0,0 +1,33 @@
+import uuid
+
+import pytest
+
+from conftest import FakeFirestore
+
+JOB_IDS = [str(uuid.UUID(int=i * 7919)) for i in range(1, 2001)]
+OTHER_IDS = [str(uuid.uuid5(uuid.NAMESPACE_URL, str(i))) for i in range(2000)]
+
+
+@pytest.mark.parametrize("page_size", [1, 7, 5000])
+def test_sorted_index_holds_every_job_across_page_runs(cleanup_main, page_size):
+    index = cleanup_main.SortedJobIndex(iter(JOB_IDS), page_size=page_size)
+
+    assert len(index) == len(JOB_IDS)
+    assert all(job_id in index for job_id in JOB_IDS)
+    assert not any(job_id in index for job_id in OTHER_IDS)
+
+
+def test_bloom_index_has_no_false_negatives_and_few_false_positives(cleanup_main):
+    index = cleanup_main.BloomJobIndex(iter(JOB_IDS), capacity=len(JOB_IDS), error_rate=0.01)
+
+    assert len(index) == len(JOB_IDS)
+    assert all(job_id in index for job_id in JOB_IDS)
+    assert sum(job_id in index for job_id in OTHER_IDS) < len(OTHER_IDS) * 0.03
+
+
+def test_job_ids_are_read_one_page_at_a_time(cleanup_main):
+    firestore = FakeFirestore({("audiobook_jobs", job_id): {"status": "completed"} for job_id in sorted(JOB_IDS[:5])})
+
+    job_ids = cleanup_main.iter_job_ids(firestore.collection("audiobook_jobs"), page_size=2)
+
+    assert list(job_ids) == sorted(JOB_IDS[:5])
@@ -0,0 +1,43 @@
+from conftest import FakeBucket, FakeFirestore
+
+FILES = [
+    "audiobooks/job-a/chapter-1.wav",
+    "audiobooks/job-a/chapter-2.wav",
+    "audiobooks/job-b/chapter-1.wav",
+    "audiobooks/job-b/chapter-2.wav",
+    "audiobooks/job-c/chapter-1.wav",
+    "audiobooks/readme.txt",
+]
+
+
+class Deleter:
+    def __init__(self):
+        self.names = []
+
+    def add(self, name):
+        self.names.append(name)
+
+
+def scan(cleanup_main, page_token=None):
+    bucket = FakeBucket({name: b"audio" for name in FILES}, page_size=2)
+    # job-c is missing from the index but its document exists
+    firestore = FakeFirestore({("audiobook_jobs", "job-a"): {}, ("audiobook_jobs", "job-c"): {}})
+    deleter, stats = Deleter(), {}
+    tokens = list(cleanup_main._scan_prefixes(bucket, firestore, {"job-a"}, deleter, stats, page_token))
+    return deleter.names, stats, tokens
+
+
+def test_prefix_scan_pages_over_job_folders_and_expands_only_orphans(cleanup_main):
+    deleted, stats, tokens = scan(cleanup_main)
+
+    assert deleted == ["audiobooks/job-b/chapter-1.wav", "audiobooks/job-b/chapter-2.wav"]
+    assert stats == {"prefixes_scanned": 3, "orphaned_jobs": 1}
+    assert tokens == ["audiobooks/job-b/", None]
+
+
+def test_prefix_scan_resumes_after_the_page_token(cleanup_main):
+    deleted, stats, tokens = scan(cleanup_main, page_token="audiobooks/job-b/")
+
+    assert deleted == []
+    assert stats == {"prefixes_scanned": 1, "orphaned_jobs": 0}
+    assert tokens == [None]
@@ -0,0 +1,73 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeBucket, FakeFirestore
+
+ORPHANS = [f"audiobooks/job-{i}/chapter-1.wav" for i in range(5)]
+
+
+class Storage:
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    def bucket(self, name):
+        return self._bucket
+
+
+class StorageBatch:
+    """Every delete in the batch succeeds."""
+    responses = itertools.repeat(SimpleNamespace(status_code=204))
+
+    def __init__(self, client):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+@pytest.fixture
+def sweep(cleanup_main, monkeypatch):
+    monkeypatch.setattr(cleanup_main, "_recording_batch_class", lambda: StorageBatch)
+    bucket = FakeBucket({name: b"audio" for name in ORPHANS}, page_size=2)
+    firestore = FakeFirestore()
+
+    def run(budget):
+        monkeypatch.setattr(cleanup_main, "CLEANUP_TIME_BUDGET_SECONDS", budget)
+        return cleanup_main.run_sweep(Storage(bucket), firestore, "prefix")
+
+    run.bucket, run.firestore = bucket, firestore
+    return run
+
+
+def checkpoints(firestore, cleanup_main):
+    return firestore.collection_docs(cleanup_main.CLEANUP_STATE_COLLECTION)
+
+
+def test_sweep_out_of_budget_checkpoints_and_the_next_run_resumes(cleanup_main, sweep):
+    first = sweep(budget=-1)
+
+    assert (first["sweep_complete"], first["resumed"], first["orphaned_files_deleted"]) == (False, False, 2)
+    saved = checkpoints(sweep.firestore, cleanup_main)["orphaned_files_prefix"]
+    assert saved["page_token"] == "audiobooks/job-1/"
+    assert sorted(sweep.bucket.objects) == ORPHANS[2:]
+
+    second = sweep(budget=300)
+
+    assert (second["sweep_complete"], second["resumed"], second["sweep_invocation"]) == (True, True, 2)
+    assert second["orphaned_files_deleted"] == 3
+    assert second["sweep_totals"]["orphaned_files_deleted"] == 5
+    assert second["sweep_started_at"] == first["sweep_started_at"]
+    assert sweep.bucket.objects == {}
+    assert checkpoints(sweep.firestore, cleanup_main) == {}
+
+
+def test_finished_sweep_starts_over_next_time(cleanup_main, sweep):
+    assert sweep(budget=300)["sweep_complete"]
+
+    again = sweep(budget=300)
+    assert (again["resumed"], again["sweep_invocation"], again["prefixes_scanned"]) == (False, 1, 0)
@@ -0,0 +1,44 @@
+import pytest
+
+import counters
+from conftest import FakeFirestore
+
+pytest.importorskip("google.cloud.firestore")
+
+SHARD = (counters.COUNTERS_COLLECTION, "shard-0")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # One shard, so every transition lands on the same document
+    monkeypatch.setattr(counters, "COUNTER_SHARDS", 1)
+    return FakeFirestore({SHARD: {"total_jobs": 3, "statuses": {"completed": 2, "processing": 1}}})
+
+
+def test_shards_holding_only_deltas_are_not_read_before_a_rebuild():
+    db = FakeFirestore({
+        (counters.FIRESTORE_COLLECTION, "job-1"): {"status": "completed"},
+        (counters.FIRESTORE_COLLECTION, "job-2"): {"status": "completed"},
+        # Transitions applied before the counters were built
+        (counters.COUNTERS_COLLECTION, "shard-3"): {"total_jobs": -1, "statuses": {"processing": -2, "completed": 1}},
+    })
+    assert counters.read_counters(db) is None
+
+    counters.rebuild(db)
+    assert counters.read_counters(db) == {"total_jobs": 2, "statuses": {"completed": 2}}
+
+
+def test_transition_without_a_status_keeps_the_shard_status_counts(db):
+    assert counters.apply_transition(db, "event-1", None, None, existed=False, exists=True)
+    assert db.docs[SHARD] == {"total_jobs": 4, "statuses": {"completed": 2, "processing": 1}}
+
+
+def test_status_change_moves_one_job_between_statuses(db):
+    assert counters.apply_transition(db, "event-1", "processing", "completed", existed=True, exists=True)
+    assert db.docs[SHARD] == {"total_jobs": 3, "statuses": {"completed": 3, "processing": 0}}
+
+
+def test_replayed_event_is_applied_once(db):
+    assert counters.apply_transition(db, "event-1", None, "pending", existed=False, exists=True)
+    assert not counters.apply_transition(db, "event-1", None, "pending", existed=False, exists=True)
+    assert db.docs[SHARD] == {"total_jobs": 4, "statuses": {"completed": 2, "processing": 1, "pending": 1}}
@@ -0,0 +1,80 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+import delivery  # noqa: E402
+
+
+@pytest.fixture
+def endpoint():
+    """
+    Local webhook endpoint. /<name> answers with the status codes queued in
+    `endpoint.statuses[name]`, then 200; idempotency keys are recorded per name.
+    """
+    state = {"statuses": {}, "requests": {}}
+
+    async def handle(request):
+        name = request.match_info["name"]
+        state["requests"].setdefault(name, []).append(request.headers["Idempotency-Key"])
+        queued = state["statuses"].get(name)
+        return web.Response(status=queued.pop(0) if queued else 200)
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_post("/{name}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    loop.run_until_complete(web.SockSite(runner, sock).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    class Endpoint:
+        statuses = state["statuses"]
+        requests = state["requests"]
+
+        def url(self, name):
+            return f"http://127.0.0.1:{port}/{name}"
+
+    yield Endpoint()
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = delivery.WebhookDispatcher([], max_attempts=3, timeout=5, backoff=0.01, backoff_max=0.02)
+    yield dispatcher
+    dispatcher.close()
+
+
+def test_retryable_failures_are_retried_until_delivered(endpoint, dispatcher):
+    endpoint.statuses["flaky"] = [503, 429, 200]
+
+    [result] = dispatcher.deliver({"event": "job_completed"}, "event-1", [endpoint.url("flaky")])
+
+    assert (result["delivered"], result["attempts"], result["status"]) == (True, 3, 200)
+    assert endpoint.requests["flaky"] == ["event-1"] * 3
+
+
+def test_client_errors_are_not_retried(endpoint, dispatcher):
+    endpoint.statuses["gone"] = [410, 410, 410]
+
+    [result] = dispatcher.deliver({"event": "job_failed"}, "event-1", [endpoint.url("gone")])
+
+    assert (result["delivered"], result["attempts"], result["error"]) == (False, 1, "HTTP 410")
+
+
+def test_redelivered_event_is_not_sent_again(endpoint, dispatcher):
+    urls = [endpoint.url("a"), endpoint.url("b")]
+
+    first = dispatcher.deliver({"event": "job_completed"}, "event-1", urls)
+    again = dispatcher.deliver({"event": "job_completed"}, "event-1", urls)
+
+    assert [r["duplicate"] for r in first + again] == [False, False, True, True]
+    assert endpoint.requests == {"a": ["event-1"], "b": ["event-1"]}
@@ -0,0 +1,132 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+import history
+from conftest import FakeBucket
+
+pytest.importorskip("google.api_core")
+
+
+def stats(total, completed=0, p50=None, count=0, completions=0):
+    return {
+        "total_jobs": total,
+        "completed": completed,
+        "processing_time_seconds": {"count": count, "p50": p50, "p95": p50, "p99": p50},
+        "throughput": {"completions_last_24h": completions},
+    }
+
+
+def at(day):
+    return datetime.combine(day, datetime.min.time(), timezone.utc) + timedelta(hours=6)
+
+
+def test_record_of_drifted_negative_counts_is_clamped():
+    stats = {"total_jobs": 3, "processing": -2, "completed": 5}
+    record = history.encode(stats, datetime(2026, 3, 1, tzinfo=timezone.utc))
+    snapshot = history.decode(record, datetime(2026, 3, 1).date())
+    assert snapshot["processing"] == 0
+    assert snapshot["completed"] == 5
+
+
+def test_appends_zero_fill_missing_days_and_keep_the_first_snapshot():
+    bucket = FakeBucket()
+    assert history.append(bucket, stats(1), at(date(2026, 1, 1)))
+    assert history.append(bucket, stats(5), at(date(2026, 1, 5)))
+    assert not history.append(bucket, stats(9), at(date(2026, 1, 5)))
+    assert not history.append(bucket, stats(9), at(date(2026, 1, 3)))
+
+    # One segment, one record per day, and no leftover append objects
+    assert list(bucket.objects) == [history.segment_name(2026)]
+    assert len(bucket.objects[history.segment_name(2026)]) == 5 * history.RECORD_SIZE
+    snapshots = history.read(bucket, date(2026, 1, 1), date(2026, 1, 5))
+    assert [(s["date"], s["total_jobs"]) for s in snapshots] == [("2026-01-01", 1), ("2026-01-05", 5)]
+
+
+def test_read_spans_years_and_skips_missing_segments_and_days():
+    bucket = FakeBucket()
+    for day in (date(2024, 12, 30), date(2024, 12, 31), date(2026, 1, 2)):
+        history.append(bucket, stats(day.day), at(day))
+
+    snapshots = history.read(bucket, date(2024, 12, 31), date(2026, 12, 31))
+    assert [s["date"] for s in snapshots] == ["2024-12-31", "2026-01-02"]
+    # Past the last record of a segment
+    assert history.read(bucket, date(2026, 1, 3), date(2026, 2, 1)) == []
+
+
+def test_weekly_and_monthly_rollups():
+    bucket = FakeBucket()
+    # Thursday 2026-01-29 to Tuesday 2026-02-03
+    for offset, (total, p50, count) in enumerate([(1, 10.0, 1), (2, 20.0, 3), (3, None, 0), (4, 40.0, 1),
+                                                  (5, 50.0, 1), (6, 60.0, 2)]):
+        day = date(2026, 1, 29) + timedelta(days=offset)
+        history.append(bucket, stats(total, p50=p50, count=count, completions=1), at(day))
+    snapshots = history.read(bucket, date(2026, 1, 1), date(2026, 2, 28))
+
+    weekly = history.rollup(snapshots, "weekly")
+    assert [(p["period_start"], p["days"], p["last_date"], p["total_jobs"]) for p in weekly] == [
+        ("2026-01-26", 4, "2026-02-01", 4),
+        ("2026-02-02", 2, "2026-02-03", 6),
+    ]
+    assert weekly[0]["processing_time_seconds"] == {"count": 5, "p50": 22.0, "p95": 22.0, "p99": 40.0}
+    assert weekly[0]["completions"] == 4
+
+    monthly = history.rollup(snapshots, "monthly")
+    assert [(p["period_start"], p["days"], p["total_jobs"]) for p in monthly] == [
+        ("2026-01-01", 3, 3), ("2026-02-01", 3, 6),
+    ]
+    assert monthly[0]["processing_time_seconds"]["p50"] == 17.5
+    assert history.rollup(snapshots, "daily") is snapshots
+
+
+def test_parse_defaults_to_the_last_30_days():
+    start, end, period = history.parse({})
+    assert end == datetime.now(timezone.utc).date()
+    assert (end - start).days == 29
+    assert period == "daily"
+    assert history.parse({"from": "2026-01-01", "to": "2026-03-31", "rollup": "monthly"}) == (
+        date(2026, 1, 1), date(2026, 3, 31), "monthly",
+    )
+
+
+@pytest.mark.parametrize("args", [
+    {"from": "2026-02-01", "to": "2026-01-01"},
+    {"from": "01/02/2026"},
+    {"from": "2000-01-01", "to": "2026-01-01"},
+    {"rollup": "hourly"},
+])
+def test_parse_rejects_bad_arguments(args):
+    with pytest.raises(history.HistoryError):
+        history.parse(args)
+
+
+class Request:
+    def __init__(self, args):
+        self.args = args
+
+
+class Storage:
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    def bucket(self, name):
+        return self._bucket
+
+
+def test_history_endpoint(notification_main, monkeypatch):
+    bucket = FakeBucket()
+    history.append(bucket, stats(7), at(date(2026, 3, 2)))
+    monkeypatch.setattr(notification_main, "STATS_HISTORY_BUCKET", "history")
+    monkeypatch.setattr(notification_main, "get_storage_client", lambda: Storage(bucket))
+
+    body, status, headers = notification_main.get_stats_history(
+        Request({"from": "2026-03-01", "to": "2026-03-31", "rollup": "weekly"}))
+    assert status == 200
+    response = json.loads(body)
+    assert response["rollup"] == "weekly"
+    assert [(p["period_start"], p["total_jobs"]) for p in response["points"]] == [("2026-03-02", 7)]
+
+    body, status, headers = notification_main.get_stats_history(Request({"rollup": "yearly"}))
+    assert status == 400
+    assert "rollup" in json.loads(body)["error"]
@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import job_events
+
+firestoredata = pytest.importorskip("google.events.cloud.firestore")
+cloudevents = pytest.importorskip("cloudevents.http")
+
+DOCUMENT = "projects/fognode-test/databases/(default)/documents/audiobook_jobs/job-1"
+COMPLETED_AT = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+
+
+def document(**fields):
+    return firestoredata.Document(name=DOCUMENT, fields={
+        "status": firestoredata.Value(string_value="processing"),
+        "progress": firestoredata.Value(integer_value=0),
+        "completed_at": firestoredata.Value(timestamp_value=COMPLETED_AT),
+        **fields,
+    })
+
+
+def cloud_event(old=None, new=None, mask=None):
+    payload = firestoredata.DocumentEventData()
+    if old is not None:
+        payload.old_value = old
+    if new is not None:
+        payload.value = new
+    if mask is not None:
+        payload.update_mask = firestoredata.DocumentMask(field_paths=mask)
+    attributes = {
+        "id": "event-1",
+        "type": "google.cloud.firestore.document.v1.written",
+        "source": "//firestore.googleapis.com/projects/fognode-test/databases/(default)",
+    }
+    return cloudevents.CloudEvent(attributes, firestoredata.DocumentEventData.serialize(payload))
+
+
+def test_field_values_decode_by_kind():
+    event = job_events.JobEvent(cloud_event(new=document()))
+    assert event.new("progress") == 0
+    assert event.new("status") == "processing"
+    assert event.new("completed_at") == COMPLETED_AT
+    assert event.new("filename") is None
+    assert event.job_id == "job-1"
+
+
+def test_missing_document_decodes_as_none():
+    event = job_events.JobEvent(cloud_event(old=document()))
+    assert (event.existed, event.exists) == (True, False)
+    assert event.new("status") is None
+    assert event.old("status") == "processing"
+
+
+def test_update_mask_without_status_is_left_alone(notification_main, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("a progress update reached the counters")
+
+    monkeypatch.setattr(notification_main.counters, "apply_transition", fail)
+    event = cloud_event(old=document(), new=document(progress=firestoredata.Value(integer_value=40)), mask=["progress"])
+
+    assert not job_events.JobEvent(event).may_change("status")
+    assert notification_main.on_job_completed(event) == {"event": "no_action"}
@@ -0,0 +1,56 @@
+import importlib.util
+import os
+
+import pytest
+
+from conftest import REPO_ROOT
+
+pytest.importorskip("proto")
+
+import lifecycle  # noqa: E402
+
+
+def load_benchmark():
+    path = os.path.join(REPO_ROOT, "benchmarks", "job_lifecycle_pubsub.py")
+    spec = importlib.util.spec_from_file_location("job_lifecycle_pubsub", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_proto_has_one_top_level_type_matching_the_classes():
+    benchmark = load_benchmark()
+    with open(benchmark.PROTO_PATH) as f:
+        declared = benchmark.proto_declarations(f.read())
+    assert sorted(declared) == ["JobLifecycleEvent", "JobLifecycleEvent.Change", "JobLifecycleEvent.JobStatus"]
+    assert benchmark.schema_mismatches(lifecycle) == []
+
+
+def test_extra_top_level_types_are_reported(tmp_path, monkeypatch):
+    benchmark = load_benchmark()
+    with open(benchmark.PROTO_PATH) as f:
+        text = f.read()
+    proto = tmp_path / "job_lifecycle.proto"
+    proto.write_text(text + "\nenum Change {\n  CHANGE_UNSPECIFIED = 0;\n}\n")
+    monkeypatch.setattr(benchmark, "PROTO_PATH", str(proto))
+    assert benchmark.schema_mismatches(lifecycle) == ["Change", "top-level types Change, JobLifecycleEvent"]
+
+
+class Event:
+    id = "event-1"
+    job_id = "job-1"
+    existed, exists = True, True
+
+    def old(self, field):
+        return {"status": "processing", "filename": "book.txt"}[field]
+
+    def new(self, field):
+        return {"status": "failed", "filename": "book.txt"}[field]
+
+
+def test_transition_round_trips_with_nested_enums():
+    message = lifecycle.transition(Event(), "2026-10-17T08:00:00.123456789Z")
+    decoded = lifecycle.JobLifecycleEvent.deserialize(lifecycle.JobLifecycleEvent.serialize(message))
+    assert decoded.new_status == lifecycle.JobLifecycleEvent.JobStatus.FAILED
+    assert lifecycle.attributes(decoded) == {"change": "UPDATED", "new_status": "FAILED", "old_status": "PROCESSING"}
+    assert decoded.event_time_micros == 1792224000123456
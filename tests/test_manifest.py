@@ -0,0 +1,128 @@
+import gzip
+import io
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import manifest
+from conftest import FakeFirestore
+
+pytest.importorskip("google.api_core")
+
+NOW = datetime.now(timezone.utc)
+
+
+class Blob:
+    def __init__(self, bucket, name, size=0, generation=1):
+        self.bucket = bucket
+        self.name = name
+        self.size = size
+        self.generation = generation
+        self.time_created = None
+
+    def open(self, mode, **kwargs):
+        if mode == "rb":
+            return io.BytesIO(self.bucket.objects[self.name])
+        bucket, name = self.bucket, self.name
+
+        class Writer(io.BytesIO):
+            def close(self):
+                bucket.objects[name] = self.getvalue()
+                super().close()
+
+        return Writer()
+
+    def download_as_bytes(self):
+        return self.bucket.objects[self.name]
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        self.bucket.objects[self.name] = data.encode() if isinstance(data, str) else data
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class Bucket:
+    def __init__(self, listed=()):
+        self.objects = {}
+        self.listed = listed
+
+    def blob(self, name):
+        return Blob(self, name)
+
+    def get_blob(self, name):
+        return Blob(self, name) if name in self.objects else None
+
+    def list_blobs(self, prefix, fields):
+        return sorted(self.listed, key=lambda blob: blob.name)
+
+    def write_gzip(self, name, lines):
+        self.objects[name] = gzip.compress("".join(f"{line}\n" for line in lines).encode())
+
+    def read_gzip(self, name):
+        return gzip.decompress(self.objects[name]).decode().splitlines()
+
+
+def delta(name, size, generation, deleted):
+    return {"name": name, "job_id": manifest.job_id_of(name), "size": size, "created": "",
+            "generation": generation, "deleted": deleted}
+
+
+def test_bootstrap_listing_streams_rows_in_job_id_order():
+    # Characters sorting before "/" make name order differ from job id order
+    rng = random.Random(7)
+    job_ids = ["a", "a-b", "a-b-c", "a.b", "ab", "a b", "b", "b!", "b0"]
+    job_ids += ["".join(rng.choice("ab-.0 ") for _ in range(rng.randint(1, 4))) for _ in range(200)]
+    names = {f"audiobooks/{job_id}/{part}" for job_id in job_ids for part in ("a.mp3", "b.mp3")}
+    bucket = Bucket([Blob(None, name, size=1) for name in names])
+
+    rows = list(manifest._listing(bucket))
+    assert [row[:2] for row in rows] == sorted((manifest.job_id_of(name), name) for name in names)
+
+
+def test_compaction_reads_only_touched_jobs_and_keeps_recent_tombstones():
+    bucket = Bucket()
+    bucket.write_gzip("manifests/audiobooks/segment-1.tsv.gz", [
+        "job-1\taudiobooks/job-1/a.mp3\t10\t\t1",
+        "job-2\taudiobooks/job-2/a.mp3\t20\t\t1",
+        "job-3\taudiobooks/job-3/a.mp3\t30\t\t1",
+    ])
+    bucket.write_gzip("manifests/audiobooks/statuses-1.tsv.gz", ["job-1\tcompleted", "job-2\tprocessing", "job-3\tfailed"])
+    bucket.objects[manifest.POINTER_NAME] = json.dumps({
+        "segment": "manifests/audiobooks/segment-1.tsv.gz", "statuses": "manifests/audiobooks/statuses-1.tsv.gz",
+    }).encode()
+    old = NOW - manifest.TOMBSTONE_RETENTION - timedelta(hours=1)
+    db = FakeFirestore(
+        {
+            ("audiobook_jobs", "job-2"): {"status": "completed"},
+            ("audiobook_jobs", "job-4"): {"status": "pending"},
+            (manifest.TOUCHED_COLLECTION, "job-2"): {},
+            (manifest.DELTAS_COLLECTION, "d1"): delta("audiobooks/job-3/a.mp3", 30, 1, deleted=True),
+            (manifest.DELTAS_COLLECTION, "d2"): delta("audiobooks/job-4/a.mp3", 40, 1, deleted=False),
+            (manifest.DELTAS_COLLECTION, "d3"): delta("audiobooks/job-9/a.mp3", 5, 1, deleted=True),
+        },
+        unscannable=[("audiobook_jobs",)],
+    )
+    db.update_times[(manifest.DELTAS_COLLECTION, "d3")] = old
+
+    summary = manifest.compact(bucket, db, "audiobook_jobs")
+
+    assert summary["bytes_by_status"] == {"completed": 30, "pending": 40}
+    assert summary["statuses_looked_up"] == 4
+    assert bucket.read_gzip(summary["segment"].replace("segment-", "statuses-")) == [
+        "job-1\tcompleted", "job-2\tcompleted", "job-4\tpending",
+    ]
+    # The recent tombstone survives the compaction, the old one and the rest go
+    remaining = {doc_id for (name, doc_id) in db.docs if name in (manifest.DELTAS_COLLECTION, manifest.TOUCHED_COLLECTION)}
+    assert remaining == {"d1"}
+    assert summary["tombstones_kept"] == 1
+
+
+def test_first_compaction_scans_the_jobs():
+    bucket = Bucket([Blob(None, "audiobooks/job-1/a.mp3", size=7), Blob(None, "audiobooks/job-2/a.mp3", size=3)])
+    db = FakeFirestore({("audiobook_jobs", "job-1"): {"status": "completed"}})
+
+    summary = manifest.compact(bucket, db, "audiobook_jobs", archived_ids=iter(["job-2"]))
+    assert summary["bytes_by_status"] == {"completed": 7, manifest.ARCHIVED: 3}
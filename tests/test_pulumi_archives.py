@@ -0,0 +1,53 @@
+import os
+
+import archives
+from conftest import run_stack
+
+
+def write_function(functions_dir, main="def handler(request):\n    return 'ok'\n"):
+    for name, files in {"shared": {"telemetry.py": "ENABLED = True\n"}, "demo": {"main.py": main}}.items():
+        os.makedirs(functions_dir / name, exist_ok=True)
+        for filename, content in files.items():
+            (functions_dir / name / filename).write_text(content)
+
+
+def test_archive_name_follows_content_only(tmp_path):
+    functions_dir = tmp_path / "cloud-functions"
+    write_function(functions_dir)
+    path, name = archives.function_source("demo", str(functions_dir), str(tmp_path / "build"))
+    with open(path, "rb") as f:
+        first = f.read()
+
+    # Same sources with new timestamps, built again: same bytes, same name
+    for entry in (functions_dir / "demo").iterdir():
+        os.utime(entry, (1_900_000_000, 1_900_000_000))
+    path, again = archives.function_source("demo", str(functions_dir), str(tmp_path / "build"))
+    with open(path, "rb") as f:
+        assert f.read() == first
+    assert again == name
+    assert name.startswith("cloud-functions/demo-") and name.endswith(".zip")
+
+    write_function(functions_dir, main="def handler(request):\n    return 'changed'\n")
+    _, changed = archives.function_source("demo", str(functions_dir), str(tmp_path / "build"))
+    assert changed != name
+
+
+def test_unchanged_sources_render_identical_function_objects():
+    def objects(stack):
+        rendered = {}
+        for resource, inputs in stack.of_type("gcp:storage/bucketObject:BucketObject").items():
+            with open(os.path.join(archives.BUILD_DIR, os.path.basename(inputs["source"].path)), "rb") as f:
+                rendered[resource] = (inputs["name"], inputs["bucket"], f.read())
+        return rendered
+
+    # Read each run's zips before the next run rebuilds them
+    first = objects(run_stack())
+    stack = run_stack()
+    second = objects(stack)
+    assert first.keys() == {"cleanup-function-code", "stats-function-code"}
+    assert first == second
+
+    # Every function deploys the object named by its hash
+    names = {name for name, _, _ in first.values()}
+    for inputs in stack.of_type("gcp:cloudfunctionsv2/function:Function").values():
+        assert inputs["buildConfig"]["source"]["storageSource"]["object"] in names
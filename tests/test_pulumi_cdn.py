@@ -0,0 +1,58 @@
+from conftest import run_stack
+
+CDN_CONFIG = {"cdn_enabled": "true", "cdn_signing_key": "c2lnbmluZy1rZXktZm9yLXRlc3Rz"}
+
+
+def secret(value):
+    """A secret input as the mocks receive it."""
+    from pulumi.runtime import rpc
+
+    return {rpc._special_sig_key: rpc._special_secret_sig, "value": value}
+
+
+def test_backend_bucket_serves_the_audio_bucket_through_cdn():
+    stack = run_stack(CDN_CONFIG)
+
+    backend = stack.of_type("gcp:compute/backendBucket:BackendBucket")["audio-backend-bucket"]
+    audio_bucket = stack.of_type("gcp:storage/bucket:Bucket")["audiobooks-bucket"]
+    assert backend["enableCdn"] is True
+    assert backend["bucketName"] == audio_bucket["name"]
+    assert backend["cdnPolicy"]["signedUrlCacheMaxAgeSec"] > 0
+
+    url_map = stack.of_type("gcp:compute/uRLMap:URLMap")["audio-cdn-url-map"]
+    rules = url_map["pathMatchers"][0]["pathRules"]
+    assert rules == [{"paths": ["/audiobooks/*"], "service": "https://compute.googleapis.com/audio-backend-bucket"}]
+
+
+def test_signing_key_is_attached_and_shared_with_the_api():
+    stack = run_stack(CDN_CONFIG)
+
+    key = stack.of_type("gcp:compute/backendBucketSignedUrlKey:BackendBucketSignedUrlKey")["audio-cdn-signed-url-key"]
+    assert key["backendBucket"] == "fognode-audio-cdn"
+    # The key reaches the provider as a secret, never in plain text
+    assert key["keyValue"] == secret(CDN_CONFIG["cdn_signing_key"])
+    version = stack.of_type("gcp:secretmanager/secretVersion:SecretVersion")["cdn-signing-key-secret-version"]
+    assert version["secretData"] == secret(CDN_CONFIG["cdn_signing_key"])
+
+    envs = {
+        env["name"]: env
+        for env in stack.of_type("gcp:cloudrunv2/service:Service")["fognode-api-service"]["template"]["containers"][0]["envs"]
+    }
+    assert envs["CDN_KEY_NAME"]["value"] == key["name"]
+    assert envs["CDN_SIGNING_KEY"]["valueSource"]["secretKeyRef"]["version"] == "latest"
+
+
+def test_cdn_url_and_key_name_are_exported():
+    stack = run_stack(CDN_CONFIG)
+    assert stack.exports["cdn_url"] == "http://203.0.113.10"
+    assert stack.exports["cdn_key_name"] == "fognode-audio-key"
+
+    stack = run_stack({**CDN_CONFIG, "cdn_domain": "audio.example.com"})
+    assert stack.exports["cdn_url"] == "https://audio.example.com"
+    assert "audio-cdn-https-proxy" in stack.of_type("gcp:compute/targetHttpsProxy:TargetHttpsProxy")
+
+
+def test_cdn_is_off_by_default():
+    stack = run_stack()
+    assert not stack.of_type("gcp:compute/backendBucket:BackendBucket")
+    assert "cdn_url" not in stack.exports and "cdn_key_name" not in stack.exports
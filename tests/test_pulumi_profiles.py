@@ -0,0 +1,117 @@
+import glob
+import json
+import os
+
+import pytest
+
+import profiles
+from conftest import PULUMI_DIR, run_stack
+
+yaml = pytest.importorskip("yaml")
+
+# Pulumi resource -> profile entry it is sized with
+FUNCTION_PROFILES = {
+    "cleanup-function": "cleanup",
+    "cleanup-worker-function": "cleanup-worker",
+    "cleanup-coordinator-function": "cleanup-coordinator",
+    "stats-function": "stats",
+    "stats-history-function": "stats-history",
+    "job-events-function": "job-events",
+    "job-purge-function": "job-purge",
+    "manifest-finalized-function": "manifest-events",
+    "manifest-deleted-function": "manifest-events",
+    "manifest-compact-function": "manifest-compact",
+    "job-archive-function": "job-archive",
+}
+
+STACK_FILES = sorted(glob.glob(os.path.join(PULUMI_DIR, "Pulumi.*.yaml")))
+
+
+def camel(key):
+    head, *rest = key.split("_")
+    return head + "".join(part.title() for part in rest)
+
+
+def stack_config(path):
+    """The fognode config of a Pulumi.<stack>.yaml, as run_stack takes it."""
+    with open(path) as f:
+        settings = yaml.safe_load(f)
+    return {
+        key.split(":", 1)[1]: value if isinstance(value, str) else json.dumps(value)
+        for key, value in settings["config"].items() if key.startswith("fognode:")
+    }
+
+
+@pytest.mark.parametrize("path", STACK_FILES, ids=os.path.basename)
+def test_stack_files_are_valid(path):
+    with open(path) as f:
+        settings = yaml.safe_load(f)
+    assert set(settings) <= {"config", "encryptionsalt", "secretsprovider", "encryptedkey"}
+    assert all(":" in key for key in settings["config"])
+    config = stack_config(path)
+    profiles.load(
+        config.get("performance_profile") or "dev",
+        json.loads(config.get("performance", "null")),
+        cleanup_shards=int(config.get("cleanup_shards", 8)),
+    )
+
+
+@pytest.mark.parametrize("path", STACK_FILES, ids=os.path.basename)
+def test_stack_files_render(path):
+    assert run_stack(stack_config(path)).of_type("gcp:cloudfunctionsv2/function:Function")
+
+
+@pytest.mark.parametrize("preset", sorted(profiles.PRESETS))
+def test_each_preset_sizes_every_function_and_the_api(preset):
+    profile = profiles.load(preset)
+    stack = run_stack({"performance_profile": preset, "cleanup_shards": "8"})
+
+    functions = stack.of_type("gcp:cloudfunctionsv2/function:Function")
+    assert set(functions) == set(FUNCTION_PROFILES)
+    for resource, name in FUNCTION_PROFILES.items():
+        expected = profile.function(name).service_config()
+        if name == "cleanup-worker":
+            expected["max_instance_count"] = 8  # One instance per shard
+        rendered = functions[resource]["serviceConfig"]
+        assert {key: rendered.get(camel(key)) for key in expected} == expected, resource
+        assert ("availableCpu" in rendered) == (profile.function(name).cpu is not None), resource
+
+    template = stack.of_type("gcp:cloudrunv2/service:Service")["fognode-api-service"]["template"]
+    assert template["maxInstanceRequestConcurrency"] == profile.api.concurrency
+    assert template["scaling"] == {"minInstanceCount": profile.api.min_instances,
+                                   "maxInstanceCount": profile.api.max_instances}
+    assert template["containers"][0]["resources"] == {
+        "limits": {"cpu": profile.api.cpu, "memory": profile.api.memory},
+        "cpuIdle": not profile.api.cpu_always_allocated,
+        "startupCpuBoost": profile.api.startup_cpu_boost,
+    }
+
+
+def test_overrides_reach_the_rendered_function():
+    stack = run_stack({"performance_profile": "dev", "performance": json.dumps({"stats": {"memory": "1G"}})})
+    rendered = stack.of_type("gcp:cloudfunctionsv2/function:Function")["stats-function"]["serviceConfig"]
+    assert rendered["availableMemory"] == "1G"
+
+
+def test_cleanup_worker_runs_one_instance_per_shard_unless_overridden():
+    assert profiles.load("dev", cleanup_shards=16).function("cleanup-worker").max_instances == 16
+    stack = run_stack({"cleanup_shards": "16", "performance": json.dumps({"cleanup-worker": {"max_instances": 4}})})
+    rendered = stack.of_type("gcp:cloudfunctionsv2/function:Function")["cleanup-worker-function"]["serviceConfig"]
+    assert rendered["maxInstanceCount"] == 4
+    with pytest.raises(profiles.ProfileError, match="cleanup-worker"):
+        profiles.load("dev", cleanup_shards=0)
+
+
+def test_unknown_profile_is_rejected_before_any_resource():
+    with pytest.raises(profiles.ProfileError, match="turbo"):
+        profiles.load("turbo")
+    with pytest.raises(Exception, match="turbo"):
+        run_stack({"performance_profile": "turbo"})
+
+
+def test_cleanup_scheduler_waits_longer_than_the_coordinator():
+    stack = run_stack()
+    coordinator = stack.of_type("gcp:cloudfunctionsv2/function:Function")["cleanup-coordinator-function"]
+    wait = int(coordinator["serviceConfig"]["environmentVariables"]["COORDINATOR_WAIT_SECONDS"])
+    job = stack.of_type("gcp:cloudscheduler/job:Job")["cleanup-scheduler"]
+    assert int(job["attemptDeadline"].rstrip("s")) > wait
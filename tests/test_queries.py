@@ -0,0 +1,136 @@
+"""
+Job queries of get_stats. Argument validation runs anywhere; pagination and
+counts run against the Firestore emulator (FIRESTORE_EMULATOR_HOST) and are
+skipped without it.
+"""
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+needs_emulator = pytest.mark.skipif(
+    not os.environ.get("FIRESTORE_EMULATOR_HOST"), reason="FIRESTORE_EMULATOR_HOST is not set",
+)
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+class Request:
+    def __init__(self, **args):
+        self.args = args
+        self.headers = {}
+
+
+def get_stats(notification_main, **args):
+    body, status, _ = notification_main.get_stats(Request(**args))
+    return status, json.loads(body)
+
+
+@pytest.mark.parametrize("args, message", [
+    ({"status": "lost"}, "status must be one of"),
+    ({"from": "yesterday"}, "from must be an ISO 8601"),
+    ({"from": "2026-03-02", "to": "2026-03-01"}, "from must be before to"),
+    ({"group_by": "week"}, "group_by must be one of"),
+    ({"group_by": "hour", "from": "2025-01-01", "to": "2026-01-01"}, "range too long"),
+    ({"limit": "ten"}, "limit must be an integer"),
+    ({"limit": "0"}, "limit must be between"),
+])
+def test_invalid_filters_are_a_400(notification_main, monkeypatch, args, message):
+    def no_firestore():
+        raise AssertionError("an invalid query reached Firestore")
+
+    monkeypatch.setattr(notification_main, "get_firestore_client", no_firestore)
+    status, body = get_stats(notification_main, **args)
+    assert status == 400
+    assert message in body["error"]
+
+
+@pytest.fixture
+def jobs(notification_main, monkeypatch):
+    """Ten jobs, two hours apart, in a collection of their own."""
+    from google.cloud import firestore
+
+    db = firestore.Client(project="fognode-test")
+    collection = f"test_jobs_{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(notification_main, "FIRESTORE_COLLECTION", collection)
+    monkeypatch.setattr(notification_main, "get_firestore_client", lambda: db)
+    batch = db.batch()
+    for i in range(10):
+        created = START + timedelta(hours=2 * i)
+        # Two jobs share each creation time, so pages must break ties by id
+        batch.set(db.collection(collection).document(f"job-{i:02d}"), {
+            "status": "failed" if i % 3 == 0 else "completed",
+            "filename": f"book-{i}.txt",
+            "created_at": created.replace(tzinfo=None, hour=created.hour // 4 * 4).isoformat(),
+        })
+    batch.commit()
+    yield db.collection(collection)
+    for doc in db.collection(collection).stream():
+        doc.reference.delete()
+
+
+@needs_emulator
+def test_pages_cover_every_job_once_newest_first(notification_main, jobs):
+    seen, cursor, pages = [], None, 0
+    while True:
+        args = {"from": "2026-03-01", "to": "2026-03-03", "limit": "3"}
+        if cursor:
+            args["cursor"] = cursor
+        status, body = get_stats(notification_main, **args)
+        assert status == 200
+        assert len(body["jobs"]) <= 3
+        seen += [(job["created_at"], job["id"]) for job in body["jobs"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == 4
+    assert len(seen) == 10 and len(set(seen)) == 10
+    assert seen == sorted(seen, reverse=True)
+
+
+@needs_emulator
+def test_a_full_last_page_has_no_next_cursor(notification_main, jobs):
+    _, body = get_stats(notification_main, **{"from": "2026-03-01", "to": "2026-03-03", "limit": "5"})
+    status, body = get_stats(notification_main, **{
+        "from": "2026-03-01", "to": "2026-03-03", "limit": "5", "cursor": body["next_cursor"],
+    })
+    assert status == 200
+    assert len(body["jobs"]) == 5
+    assert body["next_cursor"] is None
+
+
+@needs_emulator
+def test_status_filter_and_range_bounds(notification_main, jobs):
+    status, body = get_stats(notification_main, **{
+        "status": "failed", "from": "2026-03-01T04:00:00", "to": "2026-03-02T00:00:00",
+    })
+    assert status == 200
+    assert sorted(job["id"] for job in body["jobs"]) == ["job-03", "job-06", "job-09"]
+
+
+@needs_emulator
+def test_group_counts_per_day_and_hour(notification_main, jobs):
+    status, body = get_stats(notification_main, **{
+        "group_by": "day", "from": "2026-03-01", "to": "2026-03-03",
+    })
+    assert status == 200
+    assert [group["count"] for group in body["groups"]] == [10, 0]
+    assert body["total"] == 10
+
+    status, body = get_stats(notification_main, **{
+        "group_by": "hour", "status": "completed", "from": "2026-03-01T04:00:00", "to": "2026-03-01T09:00:00",
+    })
+    assert [(group["start"][11:16], group["count"]) for group in body["groups"]] == [
+        ("04:00", 1), ("05:00", 0), ("06:00", 0), ("07:00", 0), ("08:00", 2),
+    ]
+
+
+@needs_emulator
+def test_invalid_cursor_is_a_400(notification_main, jobs):
+    status, body = get_stats(notification_main, **{"cursor": "not-a-cursor"})
+    assert status == 400
+    assert body["error"] == "invalid cursor"
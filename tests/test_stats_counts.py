@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeFirestore
+
+JOBS = {"job-1": "completed", "job-2": "completed", "job-3": "failed", "job-4": "processing"}
+
+
+class CountQuery:
+    """A jobs query that only answers count() aggregations."""
+
+    def __init__(self, issued, status=None):
+        self.issued = issued
+        self.status = status
+
+    def where(self, filter):
+        assert (filter.field_path, filter.op_string) == ("status", "==")
+        return CountQuery(self.issued, filter.value)
+
+    def count(self, alias):
+        return self
+
+    def get(self):
+        self.issued.append(self.status)
+        matching = [job_id for job_id, status in JOBS.items() if self.status in (None, status)]
+        return [[SimpleNamespace(alias="count", value=len(matching))]]
+
+
+def test_statuses_are_counted_with_one_aggregation_each(notification_main):
+    issued = []
+    counts = notification_main.count_by_aggregation(CountQuery(issued))
+
+    assert counts == {"total_jobs": 4, "completed": 2, "processing": 1, "failed": 1, "pending": 0}
+    assert sorted(issued, key=str) == sorted([None, *notification_main.STATUSES], key=str)
+
+
+@pytest.fixture
+def stats_db(notification_main, monkeypatch):
+    db = FakeFirestore({("audiobook_jobs", job_id): {"status": status} for job_id, status in JOBS.items()})
+    monkeypatch.setattr(notification_main, "get_firestore_client", lambda: db)
+    monkeypatch.setattr(notification_main.analytics, "processing_analytics", lambda db: {})
+    return db
+
+
+def test_stats_fall_back_to_a_scan_without_aggregation_queries(notification_main, stats_db, monkeypatch):
+    def unsupported(jobs_ref):
+        raise NotImplementedError("count() is not supported by this emulator")
+
+    monkeypatch.setattr(notification_main, "count_by_aggregation", unsupported)
+    stats = notification_main.compute_stats()
+
+    assert stats["source"] == "scan"
+    assert {key: stats[key] for key in ("total_jobs", *notification_main.STATUSES)} == {
+        "total_jobs": 4, "completed": 2, "processing": 1, "failed": 1, "pending": 0,
+    }
+
+
+def test_stats_use_aggregations_until_the_counters_are_built(notification_main, stats_db, monkeypatch):
+    monkeypatch.setattr(notification_main, "count_by_aggregation", lambda jobs_ref: {"total_jobs": 4})
+    assert notification_main.compute_stats()["source"] == "aggregation"
+
+    notification_main.counters.rebuild(stats_db)
+    stats = notification_main.compute_stats()
+    assert (stats["source"], stats["completed"], stats["pending"]) == ("counters", 2, 0)
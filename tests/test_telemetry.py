@@ -0,0 +1,72 @@
+import pytest
+
+import telemetry
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    # configure() writes module globals; monkeypatch restores them afterwards
+    for name in ("ENABLED", "SAMPLE_RATE", "_exporter"):
+        monkeypatch.setattr(telemetry, name, getattr(telemetry, name))
+    exporter = telemetry.MemoryExporter()
+    telemetry.configure(enabled=True, sample_rate=1.0, exporter=exporter)
+    return exporter
+
+
+def test_spans_record_counters_busy_time_and_errors(exporter):
+    with telemetry.invocation("get_stats", region="eu"):
+        with telemetry.span("firestore.stream", shape="list") as streaming:
+            for item in streaming.iterate(range(3)):
+                streaming.add(items=1, bytes=10)
+        with pytest.raises(ValueError):
+            with telemetry.span("decode"):
+                raise ValueError("bad document")
+
+    stream, = exporter.spans("firestore.stream")
+    assert (stream["items"], stream["bytes"], stream["error"]) == (3, 30, False)
+    assert stream["busy_ms"] >= 0
+    assert stream["shape"] == "list"
+    assert stream["invocation"] == "get_stats" and stream["region"] == "eu"
+    decode, = exporter.spans("decode")
+    assert decode["error"] is True
+    assert "busy_ms" not in decode
+
+
+def test_invocation_record_is_emitted_last(exporter):
+    with telemetry.invocation("get_stats") as current:
+        with telemetry.span("response"):
+            pass
+
+    span, record = exporter.records
+    assert record["kind"] == "invocation"
+    assert record["invocation_id"] == span["invocation_id"] == current.id
+    assert record["error"] is False
+    assert record["duration_ms"] >= span["duration_ms"]
+
+
+def test_spans_outside_a_sampled_invocation_are_not_recorded(exporter):
+    assert telemetry.span("decode") is telemetry.NOOP_SPAN
+
+    telemetry.configure(sample_rate=0.0)
+    with telemetry.invocation("get_stats") as current:
+        assert current is None
+        assert telemetry.span("decode") is telemetry.NOOP_SPAN
+    assert exporter.records == []
+
+
+def test_traced_runs_each_call_in_an_invocation(exporter):
+    @telemetry.traced("on_job_completed", trigger="firestore")
+    def handler(value):
+        with telemetry.span("counters.apply") as applying:
+            applying.add(items=value)
+        return value * 2
+
+    assert handler(2) == 4
+    assert handler.__name__ == "handler"
+    with pytest.raises(TypeError):
+        handler()
+
+    spans = exporter.spans("counters.apply")
+    assert [span["items"] for span in spans] == [2]
+    invocations = [r for r in exporter.records if r["kind"] == "invocation"]
+    assert [(r["trigger"], r["error"]) for r in invocations] == [("firestore", False), ("firestore", True)]